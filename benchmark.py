@@ -0,0 +1,219 @@
+"""
+Benchmarks del generador de casos de prueba
+
+Mide casos por segundo de las rutas críticas (derivación, mutación, casos
+extremos, métricas y exportación) sobre un conjunto de gramáticas de
+referencia, y guarda los resultados en JSON para comparar entre commits.
+
+Uso:
+    python benchmark.py                      # escala 1, resultados por pantalla
+    python benchmark.py --scale 0.1 -o bench.json
+    python benchmark.py --compare bench.json # compara con una corrida anterior
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from generator import GrammarParser, SubtreePool, TestCaseGenerator
+
+
+def expression_grammar() -> str:
+    """Gramática de expresiones aritméticas del ejemplo"""
+    return """E -> E + T | E - T | T
+T -> T * F | T / F | T % F | F
+F -> ( E ) | num"""
+
+
+def deep_grammar(levels: int = 30) -> str:
+    """Cadena de niveles con operadores unarios: árboles profundos y estrechos"""
+    lines = []
+    for i in range(levels):
+        lines.append(f"N{i} -> op{i} N{i + 1} | N{i + 1}")
+    lines.append(f"N{levels} -> ( N0 ) | id")
+    return '\n'.join(lines)
+
+
+def wide_grammar(width: int = 200) -> str:
+    """Pocos niveles con muchas alternativas por no-terminal"""
+    return '\n'.join([
+        "S -> " + " | ".join(f"S + A{j}" for j in range(width // 10)) + " | A0",
+        "A0 -> " + " | ".join([f"t{j}" for j in range(width)] + ["( S )"]),
+    ] + [f"A{j} -> A0 * t{j} | t{j}" for j in range(1, width // 10)])
+
+
+# Gramáticas de referencia: nombre -> (texto, profundidad máxima, longitud máxima)
+GRAMMARS = {
+    'expression': (expression_grammar(), 10, 100),
+    'deep': (deep_grammar(), 100, 300),
+    'wide': (wide_grammar(), 8, 200),
+}
+
+# Casos por benchmark con escala 1
+BASE_COUNTS = {
+    'generate_valid': 5000,
+    'generate_invalid': 5000,
+    'generate_extreme': 200,
+    'calculate_metrics': 20000,
+    'export_json': 20000,
+}
+
+
+def measure(function: Callable[[], None], cases: int, repeat: int) -> Dict:
+    """Ejecuta ``function`` ``repeat`` veces y se queda con la más rápida"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return {
+        'cases': cases,
+        'seconds': best,
+        'cases_per_sec': cases / best if best > 0 else float('inf'),
+    }
+
+
+def bench_grammar(text: str, max_depth: int, max_length: int,
+                  scale: float, repeat: int, seed: int) -> Dict[str, Dict]:
+    """Corre todos los benchmarks sobre una gramática"""
+    grammar = GrammarParser(text)
+    generator = TestCaseGenerator(grammar, seed)
+    start_symbol = grammar.get_start_symbol()
+    counts = {name: max(1, int(count * scale)) for name, count in BASE_COUNTS.items()}
+
+    # Las tablas de la gramática se construyen fuera de la medición
+    grammar.compiled
+    grammar.length_sampler('chars').ensure(max_length + 1)
+
+    results = {}
+
+    n = counts['generate_valid']
+    results['generate_valid'] = measure(
+        lambda: [generator.generate_valid(start_symbol, 0, max_depth) for _ in range(n)],
+        n, repeat)
+
+    # Misma derivación reutilizando subárboles (el pool se llena en la primera repetición)
+    generator.pool = SubtreePool()
+    results['generate_valid[pool]'] = measure(
+        lambda: [generator.generate_valid(start_symbol, 0, max_depth) for _ in range(n)],
+        n, repeat)
+    generator.pool = None
+
+    n = counts['generate_invalid']
+    valid = [generator.generate_valid(start_symbol, 0, max_depth) for _ in range(n)]
+    results['generate_invalid'] = measure(
+        lambda: [generator.generate_invalid(expression) for expression in valid],
+        n, repeat)
+
+    n = counts['generate_extreme']
+    for extreme_type in TestCaseGenerator.EXTREME_TYPES:
+        results[f'generate_extreme[{extreme_type}]'] = measure(
+            lambda: [generator.generate_extreme(start_symbol, extreme_type, max_depth, max_length)
+                     for _ in range(n)],
+            n, repeat)
+
+    # Métricas y exportación sobre un lote ya generado
+    n = max(counts['calculate_metrics'], counts['export_json'])
+    generator.generate_all(n // 2, n // 4, n - n // 2 - n // 4, max_depth, max_length)
+
+    n = len(generator.test_cases)
+    results['calculate_metrics'] = measure(generator.calculate_metrics, n, repeat)
+
+    handle, path = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        results['export_json'] = measure(lambda: generator.export_json(path), n, repeat)
+    finally:
+        os.remove(path)
+
+    return results
+
+
+def run(scale: float = 1.0, repeat: int = 3, seed: int = 0,
+        grammars: List[str] = None) -> Dict:
+    """Corre los benchmarks y devuelve el informe completo"""
+    report = {
+        'meta': {
+            'generated_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': scale,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': {},
+    }
+    for name in grammars or GRAMMARS:
+        text, max_depth, max_length = GRAMMARS[name]
+        report['results'][name] = bench_grammar(text, max_depth, max_length,
+                                                scale, repeat, seed)
+    return report
+
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Benchmarks cuya velocidad cayó más de ``threshold`` respecto a la base"""
+    regressions = []
+    for grammar, results in report['results'].items():
+        for name, result in results.items():
+            previous = baseline.get('results', {}).get(grammar, {}).get(name)
+            if not previous:
+                continue
+            change = result['cases_per_sec'] / previous['cases_per_sec'] - 1
+            result['change'] = change
+            if change < -threshold:
+                regressions.append(f"{grammar}/{name}: {change:+.1%}")
+    return regressions
+
+
+def print_report(report: Dict):
+    """Muestra los resultados como tabla"""
+    for grammar, results in report['results'].items():
+        print(f"\n{grammar}")
+        for name, result in results.items():
+            change = f"  {result['change']:+.1%}" if 'change' in result else ""
+            print(f"  {name:<38} {result['cases_per_sec']:>14,.0f} casos/s{change}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del generador de casos")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="factor de escala de la cantidad de casos")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="repeticiones por benchmark (se toma la más rápida)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--grammar', action='append', choices=sorted(GRAMMARS),
+                        help="gramática de referencia (por defecto todas)")
+    parser.add_argument('-o', '--output', help="archivo JSON de resultados")
+    parser.add_argument('--compare', help="JSON de una corrida anterior")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="caída relativa que cuenta como regresión")
+    args = parser.parse_args(argv)
+
+    report = run(args.scale, args.repeat, args.seed, args.grammar)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        print("\nRegresiones:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
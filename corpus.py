@@ -0,0 +1,364 @@
+"""
+Corpus binario de casos de prueba
+
+Formato pensado para corpus muy grandes: en lugar de un único documento
+JSON que hay que parsear completo, el archivo tiene
+
+- una cabecera fija (``HEADER``) con la cantidad de casos y la posición de
+  las demás secciones,
+- los registros empaquetados, uno por caso: campos fijos (``RECORD``)
+  seguidos de los bytes UTF-8 de la expresión y, si el caso tiene campos
+  adicionales (por ejemplo ``tree``), de esos campos en JSON,
+- un índice por ID (``offset`` de cada registro, 0 si el ID no existe),
+- las tablas de nombres (tipos, mutaciones, tipos extremos) y las métricas
+  en JSON.
+
+``CorpusReader`` abre el archivo con ``mmap``: buscar un caso por ID es
+O(1), recorrerlo no copia el archivo a memoria y se puede leer por
+fragmentos o filtrando por tipo. La exportación a JSON se mantiene como
+herramienta de conversión.
+
+Uso:
+    python corpus.py casos.json casos.corpus     # JSON o JSON Lines -> corpus
+    python corpus.py casos.corpus casos.json     # corpus -> JSON
+    python corpus.py casos.corpus --id 5000000   # muestra un caso
+"""
+
+import argparse
+import gzip
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Dict, List
+
+from generator import CaseStore, CaseView, write_json
+
+
+MAGIC = b'GLCC'
+VERSION = 2
+# magic, versión, reservado, casos, ID mínimo, ID máximo,
+# offset del índice, offset de las tablas, tamaño de las tablas
+HEADER = struct.Struct('<4sHHQqqQQQ')
+# id, longitud, profundidad, expansiones, tipo, tipo extremo, mutación,
+# bytes de la expresión, bytes de los campos adicionales
+RECORD = struct.Struct('<qIiiBbIII')
+# Código de mutación de los casos sin mutación (cada combinación de
+# mutaciones es una etiqueta, así que la tabla no tiene tope práctico)
+NO_MUTATION = 0xFFFFFFFF
+INDEX_ENTRY = struct.Struct('<Q')
+
+
+class CorpusWriter:
+    """Escribe un corpus binario caso a caso
+
+    Uso::
+
+        with CorpusWriter('casos.corpus') as writer:
+            writer.extend(generator.iter_cases(...))
+            writer.metrics = generator.live_metrics.result()
+
+    Solo se mantienen en memoria los IDs y offsets de los registros; el
+    índice y las tablas se escriben al cerrar.
+    """
+
+    def __init__(self, filename: str, metrics: Dict = None):
+        self.f = open(filename, 'wb')
+        self.metrics = metrics or {}
+        self.ids = array('q')
+        self.offsets = array('Q')
+        self.labels = {'type': list(CaseStore.TYPES), 'mutation': [], 'extreme_type': []}
+        self._codes = {field: {name: code for code, name in enumerate(names)}
+                       for field, names in self.labels.items()}
+        self.f.write(bytes(HEADER.size))
+
+    def __enter__(self) -> 'CorpusWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _code(self, field: str, name: str) -> int:
+        if name is None:
+            return -1
+        codes = self._codes[field]
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(self.labels[field])
+            self.labels[field].append(name)
+        return code
+
+    def append(self, case: Dict):
+        """Agrega un caso (diccionario o vista)"""
+        expression = case['expression'].encode('utf-8')
+        extra = {key: case[key] for key in case if key not in CaseStore.FIELDS}
+        extra = json.dumps(extra, ensure_ascii=False).encode('utf-8') if extra else b''
+        mutation = case.get('mutation')
+        self.ids.append(case['id'])
+        self.offsets.append(self.f.tell())
+        self.f.write(RECORD.pack(
+            case['id'], case['length'], case.get('depth', -1), case.get('expansions', -1),
+            self._code('type', case['type']),
+            self._code('extreme_type', case.get('extreme_type')),
+            NO_MUTATION if mutation is None else self._code('mutation', mutation),
+            len(expression), len(extra)))
+        self.f.write(expression)
+        self.f.write(extra)
+
+    def extend(self, cases):
+        for case in cases:
+            self.append(case)
+
+    def close(self):
+        """Escribe el índice, las tablas y la cabecera definitiva"""
+        if self.f.closed:
+            return
+        index_offset = self.f.tell()
+        min_id = min(self.ids) if self.ids else 0
+        max_id = max(self.ids) if self.ids else -1
+        index = array('Q', bytes(8 * (max_id - min_id + 1)))
+        for case_id, offset in zip(self.ids, self.offsets):
+            index[case_id - min_id] = offset
+        if sys.byteorder != 'little':
+            index.byteswap()
+        index.tofile(self.f)
+
+        tables_offset = self.f.tell()
+        tables = json.dumps({'labels': self.labels, 'metrics': self.metrics},
+                            ensure_ascii=False).encode('utf-8')
+        self.f.write(tables)
+
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0, len(self.ids), min_id, max_id,
+                                 index_offset, tables_offset, len(tables)))
+        self.f.close()
+
+
+def write_corpus(filename: str, cases, metrics: Dict = None) -> int:
+    """Escribe ``cases`` en un corpus binario y devuelve la cantidad de casos"""
+    with CorpusWriter(filename, metrics) as writer:
+        writer.extend(cases)
+        return len(writer.ids)
+
+
+class CorpusReader:
+    """Lee un corpus binario a través de ``mmap``
+
+    Los casos se entregan como ``CaseView`` (se comportan como el
+    diccionario del caso) que solo guardan el offset del registro; los
+    campos se decodifican al pedirlos. ``expression_bytes`` devuelve la
+    expresión como ``memoryview`` sin copiarla.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            self.mm.close()
+            raise ValueError(f"{filename} no es un corpus de casos")
+        (magic, version, _, self.count, self.min_id, self.max_id,
+         self.index_offset, tables_offset, tables_size) = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f"{filename} no es un corpus de casos (versión {VERSION})")
+        tables = json.loads(self.mm[tables_offset:tables_offset + tables_size].decode('utf-8'))
+        self.labels = tables['labels']
+        self.metrics = tables['metrics']
+        self._type_codes = {name: code for code, name in enumerate(self.labels['type'])}
+
+    def __enter__(self) -> 'CorpusReader':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def offset(self, case_id: int) -> int:
+        """Offset del registro del caso ``case_id`` (0 si no existe), en O(1)"""
+        if not self.min_id <= case_id <= self.max_id:
+            return 0
+        return INDEX_ENTRY.unpack_from(self.mm, self.index_offset + 8 * (case_id - self.min_id))[0]
+
+    def __contains__(self, case_id: int) -> bool:
+        return self.offset(case_id) != 0
+
+    def get(self, case_id: int) -> CaseView:
+        """Caso con el ID dado (KeyError si no está en el corpus)"""
+        offset = self.offset(case_id)
+        if not offset:
+            raise KeyError(case_id)
+        return CaseView(self, offset)
+
+    def __iter__(self):
+        return self.scan()
+
+    def scan(self, case_type: str = None, start_id: int = None, stop_id: int = None):
+        """Recorre los casos en orden, opcionalmente de un tipo o de un rango de IDs
+
+        ``start_id`` incluido y ``stop_id`` excluido; el filtro por tipo
+        solo lee el código de tipo de cada registro.
+        """
+        if case_type is not None and case_type not in self._type_codes:
+            return
+        type_code = self._type_codes.get(case_type)
+        offset = HEADER.size
+        if start_id is not None:
+            # Primer ID presente desde start_id
+            case_id = max(start_id, self.min_id)
+            offset = 0
+            while not offset and case_id <= self.max_id:
+                offset = self.offset(case_id)
+                case_id += 1
+            if not offset:
+                return
+        end = self.index_offset
+        mm = self.mm
+        unpack_from = RECORD.unpack_from
+        while offset < end:
+            case_id, _, _, _, code, _, _, size, extra_size = unpack_from(mm, offset)
+            if stop_id is not None and case_id >= stop_id:
+                return
+            if type_code is None or code == type_code:
+                yield CaseView(self, offset)
+            offset += RECORD.size + size + extra_size
+
+    def shard(self, index: int, shards: int):
+        """Casos del fragmento ``index`` de ``shards`` (rangos de IDs de igual tamaño)"""
+        span = self.max_id - self.min_id + 1
+        start = self.min_id + span * index // shards
+        stop = self.min_id + span * (index + 1) // shards
+        return self.scan(start_id=start, stop_id=stop)
+
+    def expression_bytes(self, offset: int) -> memoryview:
+        """Bytes UTF-8 de la expresión del registro, sin copiarlos
+
+        La vista debe liberarse (``release()``) antes de cerrar el corpus.
+        """
+        size = RECORD.unpack_from(self.mm, offset)[7]
+        start = offset + RECORD.size
+        return memoryview(self.mm)[start:start + size]
+
+    # Interfaz que usa CaseView (la fila es el offset del registro)
+
+    def value(self, offset: int, key: str):
+        """Valor del campo ``key`` del registro (KeyError si el caso no lo tiene)"""
+        (case_id, length, depth, expansions, type_code, extreme_code, mutation_code,
+         size, extra_size) = RECORD.unpack_from(self.mm, offset)
+        if key == 'id':
+            return case_id
+        if key == 'type':
+            return self.labels['type'][type_code]
+        if key == 'expression':
+            start = offset + RECORD.size
+            return self.mm[start:start + size].decode('utf-8')
+        if key == 'length':
+            return length
+        if key == 'depth' or key == 'expansions':
+            value = depth if key == 'depth' else expansions
+            if value >= 0:
+                return value
+        elif key == 'mutation':
+            if mutation_code != NO_MUTATION:
+                return self.labels[key][mutation_code]
+        elif key == 'extreme_type':
+            if extreme_code >= 0:
+                return self.labels[key][extreme_code]
+        elif extra_size:
+            extra = self._extra(offset, size, extra_size)
+            if key in extra:
+                return extra[key]
+        raise KeyError(key)
+
+    def fields(self, offset: int) -> List[str]:
+        """Claves presentes en el registro, en el orden de CaseStore.FIELDS"""
+        (_, _, depth, expansions, _, extreme_code, mutation_code,
+         size, extra_size) = RECORD.unpack_from(self.mm, offset)
+        fields = ['id', 'type', 'expression']
+        if mutation_code != NO_MUTATION:
+            fields.append('mutation')
+        if extreme_code >= 0:
+            fields.append('extreme_type')
+        if depth >= 0:
+            fields.append('depth')
+        if expansions >= 0:
+            fields.append('expansions')
+        fields.append('length')
+        if extra_size:
+            fields.extend(self._extra(offset, size, extra_size))
+        return fields
+
+    def _extra(self, offset: int, size: int, extra_size: int) -> Dict:
+        start = offset + RECORD.size + size
+        return json.loads(self.mm[start:start + extra_size].decode('utf-8'))
+
+    def export_json(self, filename: str, case_type: str = None):
+        """Convierte el corpus (o los casos de un tipo) al JSON de ``export_json``"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            write_json(f, self.scan(case_type), self.metrics)
+
+
+def read_cases(filename: str):
+    """Casos y métricas de un JSON de ``export_json`` o un JSON Lines (con o sin gzip)"""
+    opener = gzip.open if filename.endswith('.gz') else open
+    name = filename[:-3] if filename.endswith('.gz') else filename
+    if not name.endswith('.jsonl'):
+        with opener(filename, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return data['test_cases'], data.get('metrics', {})
+
+    cases = []
+    metrics = {}
+    with opener(filename, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'metrics' in record:
+                metrics = record['metrics']
+            else:
+                cases.append(record)
+    return cases, metrics
+
+
+def is_corpus(filename: str) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Conversión entre JSON y corpus binario")
+    parser.add_argument('input', help="JSON, JSON Lines o corpus de entrada")
+    parser.add_argument('output', nargs='?', help="archivo de salida")
+    parser.add_argument('--type', dest='case_type', choices=CaseStore.TYPES,
+                        help="exportar a JSON solo los casos de este tipo")
+    parser.add_argument('--id', type=int, help="mostrar el caso con este ID")
+    args = parser.parse_args(argv)
+
+    if not is_corpus(args.input):
+        if args.output is None:
+            parser.error("falta el archivo de salida del corpus")
+        cases, metrics = read_cases(args.input)
+        count = write_corpus(args.output, cases, metrics)
+        print(f"{count} casos escritos en {args.output}", file=sys.stderr)
+        return 0
+
+    with CorpusReader(args.input) as reader:
+        if args.id is not None:
+            if args.id not in reader:
+                print(f"el caso {args.id} no está en el corpus", file=sys.stderr)
+                return 1
+            print(json.dumps(reader.get(args.id), indent=2, ensure_ascii=False, default=dict))
+        elif args.output is not None:
+            reader.export_json(args.output, args.case_type)
+        else:
+            print(f"{len(reader)} casos (IDs {reader.min_id} a {reader.max_id})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
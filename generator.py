@@ -1,15 +1,49 @@
+import argparse
+import bisect
+import cProfile
+import gzip
 import json
+import math
+import os
+import pickle
 import random
+import re
+import sys
+import tempfile
 import time
+import tracemalloc
+from array import array
+from collections import Counter, deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from datetime import datetime
-from typing import Dict, List, Tuple
+from hashlib import blake2b
+from typing import Callable, Dict, List, Tuple
 
 
 class GrammarParser:
-    """Parser de gramáticas libres de contexto"""
+    """Parser de gramáticas libres de contexto
+    
+    Cada alternativa puede terminar con un peso entre corchetes, por ejemplo
+    ``E -> E + T [0.2] | T [0.8]``. Los pesos de un no-terminal no necesitan
+    sumar 1 (se normalizan) y las alternativas sin peso valen 1.
+    """
+    
+    # Anotación de peso al final de una alternativa: [0.2], [3], [.5]
+    WEIGHT_PATTERN = re.compile(r'\[(\d+(?:\.\d*)?|\.\d+)\]$')
     
     def __init__(self, grammar_text: str):
         self.rules = {}
+        # Pesos de las reglas anotadas (no-terminal -> peso de cada alternativa)
+        self.weights = {}
+        self._analysis = None
+        self._compiled = None
+        self._samplers = {}
+        self._enumerator = None
+        self._recognizer = None
+        # Clave en GrammarCache (None si la gramática no salió de la caché)
+        self.cache_key = None
         self.parse_grammar(grammar_text)
     
     def parse_grammar(self, grammar_text: str):
@@ -24,219 +58,3564 @@ class GrammarParser:
             left = left.strip()
             
             # Dividir por '|' para obtener las producciones
-            productions = [prod.strip().split() for prod in right.split('|')]
+            productions = []
+            weights = []
+            annotated = False
+            for prod in right.split('|'):
+                symbols = prod.strip().split()
+                match = self.WEIGHT_PATTERN.match(symbols[-1]) if symbols else None
+                if match:
+                    symbols.pop()
+                    annotated = True
+                weights.append(float(match.group(1)) if match else 1.0)
+                productions.append(symbols)
             self.rules[left] = productions
+            if annotated:
+                self.weights[left] = weights
+            else:
+                self.weights.pop(left, None)
+        
+        # Las reglas cambiaron: la versión compilada debe reconstruirse
+        self._analysis = None
+        self._compiled = None
+        self._samplers = {}
+        self._enumerator = None
+        self._recognizer = None
+        self.cache_key = None
     
     def get_start_symbol(self) -> str:
         """Obtiene el símbolo inicial (primer símbolo definido)"""
         return list(self.rules.keys())[0] if self.rules else None
+    
+    @property
+    def analysis(self) -> 'GrammarAnalysis':
+        """Análisis de la gramática tal como se escribió (se calcula una vez)"""
+        if self._analysis is None:
+            self._analysis = GrammarAnalysis(CompiledGrammar(self.rules, self.weights),
+                                             self.get_start_symbol())
+        return self._analysis
+    
+    @property
+    def compiled(self) -> 'CompiledGrammar':
+        """Representación compilada de la gramática (se construye una sola vez)
+        
+        Las producciones inútiles que encuentra el análisis se podan antes
+        de compilar; ``self.rules`` conserva la gramática original.
+        """
+        if self._compiled is None:
+            analysis = self.analysis
+            if analysis.useless:
+                rules, weights = analysis.pruned_rules(self.rules, self.weights)
+                self._compiled = CompiledGrammar(rules, weights)
+            else:
+                self._compiled = analysis.compiled
+        return self._compiled
+    
+    @property
+    def recognizer(self) -> 'EarleyRecognizer':
+        """Reconocedor de Earley para el símbolo inicial (se construye una vez)"""
+        if self._recognizer is None:
+            self._recognizer = EarleyRecognizer(self.compiled, self.get_start_symbol(),
+                                                self.analysis)
+        return self._recognizer
+    
+    def tune_weights(self, target_length: float, symbol: str = None) -> float:
+        """Ajusta los pesos para que la longitud esperada se acerque al objetivo
+        
+        Multiplica el peso de cada alternativa por ``λ ** k``, donde ``k`` es
+        la cantidad de no-terminales de la alternativa, y busca por bisección
+        el ``λ`` cuya longitud esperada en tokens desde ``symbol`` (por
+        defecto el inicial) es ``target_length``. Valores pequeños de ``λ``
+        favorecen las alternativas que terminan antes. La esperanza se calcula
+        sin límite de profundidad, que en la generación acorta las cadenas.
+        
+        Guarda los pesos resultantes en ``self.weights`` y devuelve la
+        longitud esperada obtenida.
+        """
+        compiled = self.compiled
+        sym_id = compiled.symbol_ids.get(symbol or self.get_start_symbol())
+        if sym_id is None or compiled.is_terminal[sym_id]:
+            raise ValueError("Símbolo no definido en la gramática")
+        
+        base = compiled.prod_weight.tolist()
+        arity = [sum(1 for s in compiled.production(p) if not compiled.is_terminal[s])
+                 for p in range(compiled.num_productions)]
+        
+        def expected(log_scale):
+            scale = math.exp(log_scale)
+            weights = [w * scale ** k for w, k in zip(base, arity)]
+            return compiled.expected_tokens(weights)[sym_id], weights
+        
+        # Bisección sobre log(λ): la longitud esperada crece con λ
+        low, high = -30.0, 30.0
+        best_length, best_weights = expected(0.0)
+        for _ in range(100):
+            middle = (low + high) / 2
+            length, weights = expected(middle)
+            if abs(length - target_length) < abs(best_length - target_length):
+                best_length, best_weights = length, weights
+            if length < target_length:
+                low = middle
+            else:
+                high = middle
+            if high - low < 1e-9:
+                break
+        
+        compiled.set_weights(best_weights)
+        # Los pesos ya no son los del texto: no se guarda en la caché
+        self.cache_key = None
+        # Las producciones podadas (ver ``compiled``) quedan con peso 0
+        useless = set(self.analysis.useless)
+        tuned = iter(best_weights)
+        self.weights = {}
+        prod_id = 0
+        for left, productions in self.rules.items():
+            self.weights[left] = [0.0 if prod_id + i in useless else next(tuned)
+                                  for i in range(len(productions))]
+            prod_id += len(productions)
+        return best_length
+    
+    def length_sampler(self, unit: str = 'tokens') -> 'LengthSampler':
+        """Muestreador por longitud exacta (tablas compartidas por gramática)"""
+        if unit not in self._samplers:
+            self._samplers[unit] = LengthSampler(self.compiled, unit)
+        return self._samplers[unit]
+    
+    def sentence_enumerator(self) -> 'SentenceEnumerator':
+        """Tablas de oraciones por longitud (compartidas por gramática)"""
+        if self._enumerator is None:
+            self._enumerator = SentenceEnumerator(self.compiled)
+        return self._enumerator
+
+
+class GrammarCache:
+    """Caché en disco de gramáticas compiladas
+    
+    Guarda el ``GrammarParser`` con su análisis, su versión compilada, el
+    reconocedor y las tablas de conteo y de oraciones ya calculadas, en un
+    archivo por gramática cuyo nombre es el hash del texto normalizado (sin
+    líneas vacías ni espacios repetidos) y de ``VERSION``. Un arranque en caliente
+    carga el archivo en lugar de volver a analizar la gramática.
+    
+    El tamaño total del directorio se limita a ``max_bytes``: al superarlo
+    se borran los archivos usados hace más tiempo (LRU según la fecha de
+    modificación, que se actualiza en cada acierto). Los errores de disco
+    no interrumpen la generación: la gramática se construye igual.
+    """
+    
+    # Cambiar al modificar las clases que se guardan en la caché
+    VERSION = 3
+    SUFFIX = '.grammar'
+    
+    def __init__(self, directory: str = None, max_bytes: int = 256 * 1024 * 1024):
+        if directory is None:
+            directory = os.environ.get('GLC_CACHE_DIR') or os.path.join(
+                os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                'glc-generator')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Estado de las tablas guardadas por clave (para no reescribir)
+        self._saved = {}
+    
+    @staticmethod
+    def normalize(grammar_text: str) -> str:
+        """Texto de la gramática sin líneas vacías ni espacios redundantes"""
+        return '\n'.join(' '.join(line.split()) for line in grammar_text.split('\n')
+                         if line.strip())
+    
+    def key(self, grammar_text: str) -> str:
+        text = f"{self.VERSION}\n{self.normalize(grammar_text)}"
+        return blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+    
+    def load(self, grammar_text: str) -> GrammarParser:
+        """Gramática desde la caché; si no está, se analiza y se guarda"""
+        key = self.key(grammar_text)
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                grammar = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            grammar = None
+        except Exception:
+            # Archivo dañado o de otra versión de las clases
+            grammar = None
+            self._remove(path)
+        
+        if grammar is not None:
+            self.hits += 1
+            grammar.cache_key = key
+            self._saved[key] = self._table_state(grammar)
+            return grammar
+        
+        self.misses += 1
+        grammar = GrammarParser(grammar_text)
+        if not grammar.rules:
+            return grammar
+        if grammar.get_start_symbol() in grammar.compiled.symbol_ids:
+            grammar.recognizer
+        grammar.cache_key = key
+        self.save(grammar)
+        return grammar
+    
+    @staticmethod
+    def _table_state(grammar: GrammarParser) -> Tuple:
+        return (grammar._analysis is not None, grammar._compiled is not None,
+                grammar._recognizer is not None,
+                tuple(sorted((unit, sampler.max_size)
+                             for unit, sampler in grammar._samplers.items())),
+                grammar._enumerator.max_tokens if grammar._enumerator else -1)
+    
+    def save(self, grammar: GrammarParser) -> bool:
+        """Guarda la gramática si sus tablas crecieron desde la última vez
+        
+        Las gramáticas modificadas después de cargarse (por ejemplo con
+        ``tune_weights``) ya no corresponden a su texto y no se guardan.
+        """
+        key = grammar.cache_key
+        if key is None:
+            return False
+        state = self._table_state(grammar)
+        if self._saved.get(key) == state:
+            return False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'wb') as f:
+                    pickle.dump(grammar, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self.path(key))
+            except BaseException:
+                self._remove(temp_path)
+                raise
+        except OSError:
+            return False
+        self._saved[key] = state
+        self.evict()
+        return True
+    
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """(último uso, tamaño, ruta) de cada gramática guardada"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+    
+    def evict(self):
+        """Borra las gramáticas menos usadas hasta respetar ``max_bytes``"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+    
+    def clear(self):
+        for _, _, path in self.entries():
+            self._remove(path)
+        self._saved = {}
+    
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CompiledGrammar:
+    """Representación intermedia de la gramática con identificadores enteros
+    
+    Los símbolos se internan en IDs densos (primero los no-terminales, luego
+    los terminales) y las producciones se guardan en arreglos planos:
+    
+    - ``prod_symbols``: concatenación de los símbolos de todas las producciones
+    - ``prod_offset`` / ``prod_length``: inicio y largo de cada producción
+    - ``rule_offset`` / ``rule_count``: rango de producciones de cada no-terminal
+    - ``prod_lhs``: no-terminal del lado izquierdo de cada producción
+    - ``is_terminal``: mapa de bits (un byte por símbolo)
+    
+    Al construirse calcula además las tablas de terminación (ver
+    ``_compute_termination``).
+    
+    Si la gramática trae pesos, ``prod_weight`` guarda el de cada producción
+    y ``weighted`` queda activo (ver ``set_weights``).
+    """
+    
+    # Altura/tokens de un símbolo que no puede derivar una cadena terminal
+    UNREACHABLE = 2 ** 31 - 1
+    
+    def __init__(self, rules: Dict[str, List[List[str]]],
+                 weights: Dict[str, List[float]] = None):
+        self.symbols = []
+        self.symbol_ids = {}
+        
+        # Los no-terminales ocupan los IDs 0..n-1 para indexar las tablas de reglas
+        for left in rules:
+            self._intern(left)
+        self.num_nonterminals = len(self.symbols)
+        
+        for productions in rules.values():
+            for prod in productions:
+                for sym in prod:
+                    self._intern(sym)
+        
+        self.is_terminal = bytearray(len(self.symbols))
+        for sym_id in range(self.num_nonterminals, len(self.symbols)):
+            self.is_terminal[sym_id] = 1
+        
+        self.rule_offset = array('i')
+        self.rule_count = array('i')
+        self.prod_offset = array('i')
+        self.prod_length = array('i')
+        self.prod_symbols = array('i')
+        self.prod_lhs = array('i')
+        
+        for lhs, productions in enumerate(rules.values()):
+            self.rule_offset.append(len(self.prod_offset))
+            self.rule_count.append(len(productions))
+            for prod in productions:
+                self.prod_lhs.append(lhs)
+                self.prod_offset.append(len(self.prod_symbols))
+                self.prod_length.append(len(prod))
+                self.prod_symbols.extend(self.symbol_ids[sym] for sym in prod)
+        
+        # Símbolos de cada producción invertidos (mismos offsets), listos
+        # para apilarse en la derivación iterativa
+        self.prod_symbols_reversed = array('i')
+        for prod_id in range(self.num_productions):
+            self.prod_symbols_reversed.extend(reversed(self.production(prod_id)))
+        
+        self._compute_termination()
+        self._compute_nullable()
+        self._compute_roles()
+        
+        prod_weight = []
+        for left, productions in rules.items():
+            prod_weight.extend((weights or {}).get(left, [1.0] * len(productions)))
+        self.set_weights(prod_weight)
+        self.weighted = bool(weights)
+    
+    def set_weights(self, prod_weight: List[float]):
+        """Fija el peso de cada producción y precalcula las tablas de muestreo
+        
+        - ``alias_prob`` / ``alias_index``: tablas de alias de Walker por
+          no-terminal (mismos offsets que ``rule_offset``) para elegir una
+          producción con probabilidad proporcional a su peso en O(1)
+        - ``sorted_cumweight``: pesos acumulados (desde cero en cada
+          no-terminal) en el orden de ``rule_sorted``, para elegir por peso entre las producciones que
+          caben en la profundidad restante
+        """
+        if len(prod_weight) != self.num_productions or any(w < 0 for w in prod_weight):
+            raise ValueError("Se requiere un peso no negativo por producción")
+        self.prod_weight = array('d', prod_weight)
+        self.weighted = True
+        
+        self.alias_prob = array('d', [1.0] * self.num_productions)
+        self.alias_index = array('i', range(self.num_productions))
+        self.sorted_cumweight = array('d', [0.0] * self.num_productions)
+        for sym_id in range(self.num_nonterminals):
+            lo = self.rule_offset[sym_id]
+            count = self.rule_count[sym_id]
+            # Solo las productivas pueden elegirse; sin pesos positivos, uniforme
+            weights = [self.prod_weight[p] if self.prod_height[p] != self.UNREACHABLE else 0.0
+                       for p in range(lo, lo + count)]
+            total = sum(weights)
+            if total <= 0:
+                weights = [1.0 if self.prod_height[p] != self.UNREACHABLE else 0.0
+                           for p in range(lo, lo + count)]
+                total = sum(weights)
+            if total > 0:
+                self._build_alias(lo, [w * count / total for w in weights])
+            
+            cumulative = 0.0
+            for i in range(lo, lo + count):
+                cumulative += self.prod_weight[self.rule_sorted[i]]
+                self.sorted_cumweight[i] = cumulative
+    
+    def _build_alias(self, lo: int, scaled: List[float]):
+        """Método de Vose: reparte las probabilidades escaladas en cubetas"""
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            self.alias_prob[lo + s] = scaled[s]
+            self.alias_index[lo + s] = lo + g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # Lo que queda es 1 salvo por error de redondeo
+        for i in small + large:
+            self.alias_prob[lo + i] = 1.0
+            self.alias_index[lo + i] = lo + i
+    
+    def expected_tokens(self, prod_weight: List[float] = None) -> List[float]:
+        """Cantidad esperada de tokens que deriva cada no-terminal
+        
+        Resuelve ``L[A] = Σ p(A → α) · L(α)`` sin límite de profundidad,
+        con iteraciones de Gauss-Seidel que visitan primero los símbolos de
+        menor altura. Si la esperanza no es finita (la gramática crece más
+        rápido de lo que termina) el valor es ``inf``.
+        """
+        if prod_weight is None:
+            prod_weight = self.prod_weight
+        inf = self.UNREACHABLE
+        n = self.num_nonterminals
+        is_terminal = self.is_terminal
+        
+        # Probabilidad, terminales y no-terminales de cada producción productiva
+        rules = []
+        for sym_id in range(n):
+            prods = [p for p in self.productions_of(sym_id) if self.prod_height[p] != inf]
+            total = sum(prod_weight[p] for p in prods)
+            rule = []
+            for p in prods:
+                probability = prod_weight[p] / total if total > 0 else 1.0 / len(prods)
+                symbols = self.production(p)
+                terminals = sum(1 for s in symbols if is_terminal[s])
+                rule.append((probability, terminals, [s for s in symbols if not is_terminal[s]]))
+            rules.append(rule)
+        
+        order = sorted(range(n), key=lambda sym_id: self.min_height[sym_id])
+        lengths = [0.0] * n
+        changes = [0.0] * n
+        for _ in range(10000):
+            for sym_id in order:
+                value = sum(probability * (terminals + sum(lengths[s] for s in children))
+                            for probability, terminals, children in rules[sym_id])
+                changes[sym_id] = abs(value - lengths[sym_id]) / max(value, 1.0)
+                lengths[sym_id] = value
+            if max(changes) < 1e-12:
+                break
+            if max(lengths) > 1e12:
+                # Diverge: los símbolos que siguen creciendo no tienen esperanza finita
+                return [math.inf if change > 1e-9 else value
+                        for value, change in zip(lengths, changes)]
+        return lengths
+    
+    def _compute_roles(self):
+        """Clasifica los terminales según su papel en las producciones
+        
+        - ``open`` / ``close``: primer y último símbolo de una producción que
+          encierra no-terminales entre terminales, como ``( E )``
+        - ``operator``: terminal junto a un no-terminal que no es delimitador,
+          como ``+`` en ``E + T``
+        - ``operand``: el resto, como ``num``
+        
+        Un terminal con varios papeles se queda con el de mayor prioridad
+        (delimitador, luego operador).
+        """
+        is_terminal = self.is_terminal
+        priority = {'operand': 0, 'operator': 1, 'open': 2, 'close': 2}
+        roles = {}
+        
+        def assign(sym_id, role):
+            current = roles.get(sym_id, 'operand')
+            if priority[role] >= priority[current]:
+                roles[sym_id] = role
+        
+        for prod_id in range(self.num_productions):
+            symbols = self.production(prod_id)
+            last = len(symbols) - 1
+            bracketed = (last >= 2 and is_terminal[symbols[0]] and is_terminal[symbols[last]]
+                         and not all(is_terminal[s] for s in symbols))
+            for i, s in enumerate(symbols):
+                if not is_terminal[s]:
+                    continue
+                if bracketed and i == 0:
+                    assign(s, 'open')
+                elif bracketed and i == last:
+                    assign(s, 'close')
+                elif ((i > 0 and not is_terminal[symbols[i - 1]])
+                      or (i < last and not is_terminal[symbols[i + 1]])):
+                    assign(s, 'operator')
+                else:
+                    assign(s, 'operand')
+        
+        # Papel de cada terminal por su texto, y listas por papel
+        self.role_of = {self.symbols[s]: role for s, role in sorted(roles.items())}
+        self.operators = [t for t, role in self.role_of.items() if role == 'operator']
+        self.operands = [t for t, role in self.role_of.items() if role == 'operand']
+        self.open_brackets = [t for t, role in self.role_of.items() if role == 'open']
+        self.close_brackets = [t for t, role in self.role_of.items() if role == 'close']
+    
+    def _compute_nullable(self):
+        """Marca en ``nullable`` los no-terminales que derivan la cadena vacía"""
+        is_terminal = self.is_terminal
+        self.nullable = bytearray(self.num_nonterminals)
+        changed = True
+        while changed:
+            changed = False
+            for prod_id in range(self.num_productions):
+                lhs = self.prod_lhs[prod_id]
+                if not self.nullable[lhs] and all(
+                        not is_terminal[s] and self.nullable[s]
+                        for s in self.production(prod_id)):
+                    self.nullable[lhs] = 1
+                    changed = True
+    
+    def _compute_termination(self):
+        """Análisis de punto fijo de la derivación mínima
+        
+        Para cada no-terminal calcula la altura mínima del árbol de derivación
+        que termina en terminales (``min_height``), la cantidad mínima de
+        tokens (``min_tokens``) y la producción que alcanza esa altura
+        (``best_production``, desempate por tokens). Se resuelve con una
+        lista de trabajo que solo reevalúa las producciones afectadas. Los símbolos
+        improductivos quedan con ``UNREACHABLE`` y producción -1.
+        
+        También ordena las producciones de cada no-terminal por altura
+        (``rule_sorted`` / ``sorted_heights``) para que el generador pueda
+        descartar en O(log n) las que no caben en la profundidad restante.
+        """
+        inf = self.UNREACHABLE
+        n = self.num_nonterminals
+        is_terminal = self.is_terminal
+        
+        self.min_height = array('i', [inf] * n)
+        self.min_tokens = array('i', [inf] * n)
+        self.best_production = array('i', [-1] * n)
+        self.prod_height = array('i', [inf] * self.num_productions)
+        self.prod_min_tokens = array('i', [inf] * self.num_productions)
+        
+        # Producciones que usan cada no-terminal, para reevaluar solo esas
+        users = [[] for _ in range(n)]
+        for prod_id in range(self.num_productions):
+            for s in set(self.production(prod_id)):
+                if not is_terminal[s]:
+                    users[s].append(prod_id)
+        
+        # Lista de trabajo: los valores solo disminuyen, así que termina
+        pending = deque(range(self.num_productions))
+        queued = bytearray([1] * self.num_productions)
+        while pending:
+            prod_id = pending.popleft()
+            queued[prod_id] = 0
+            height = 1
+            tokens = 0
+            for s in self.production(prod_id):
+                if is_terminal[s]:
+                    tokens += 1
+                elif self.min_height[s] == inf:
+                    break
+                else:
+                    height = max(height, self.min_height[s] + 1)
+                    tokens += self.min_tokens[s]
+            else:
+                self.prod_height[prod_id] = height
+                self.prod_min_tokens[prod_id] = tokens
+                lhs = self.prod_lhs[prod_id]
+                changed = False
+                if height < self.min_height[lhs]:
+                    self.min_height[lhs] = height
+                    changed = True
+                if tokens < self.min_tokens[lhs]:
+                    self.min_tokens[lhs] = tokens
+                    changed = True
+                if changed:
+                    for user in users[lhs]:
+                        if not queued[user]:
+                            queued[user] = 1
+                            pending.append(user)
+        
+        for sym_id in range(n):
+            candidates = [p for p in self.productions_of(sym_id) if self.prod_height[p] != inf]
+            if candidates:
+                self.best_production[sym_id] = min(
+                    candidates, key=lambda p: (self.prod_height[p], self.prod_min_tokens[p]))
+        
+        # Producciones de cada no-terminal ordenadas por altura mínima; las
+        # improductivas quedan al final con altura UNREACHABLE
+        self.rule_sorted = array('i')
+        self.sorted_heights = array('i')
+        self.rule_max_height = array('i')
+        for sym_id in range(n):
+            ordered = sorted(self.productions_of(sym_id), key=lambda p: self.prod_height[p])
+            self.rule_sorted.extend(ordered)
+            self.sorted_heights.extend(self.prod_height[p] for p in ordered)
+            self.rule_max_height.append(max((self.prod_height[p] for p in ordered), default=inf))
+    
+    def _intern(self, symbol: str) -> int:
+        """Asigna (o recupera) el ID entero de un símbolo"""
+        sym_id = self.symbol_ids.get(symbol)
+        if sym_id is None:
+            sym_id = len(self.symbols)
+            self.symbol_ids[symbol] = sym_id
+            self.symbols.append(symbol)
+        return sym_id
+    
+    @property
+    def num_productions(self) -> int:
+        return len(self.prod_offset)
+    
+    def production(self, prod_id: int) -> List[int]:
+        """Devuelve los IDs de los símbolos de una producción"""
+        start = self.prod_offset[prod_id]
+        return self.prod_symbols[start:start + self.prod_length[prod_id]].tolist()
+    
+    def production_text(self, prod_id: int) -> str:
+        """Producción en el formato de la gramática, por ejemplo ``E -> E + T``"""
+        right = ' '.join(self.symbols[s] for s in self.production(prod_id))
+        return f"{self.symbols[self.prod_lhs[prod_id]]} -> {right}"
+    
+    def productions_of(self, sym_id: int) -> range:
+        """Rango de IDs de producción de un no-terminal"""
+        start = self.rule_offset[sym_id]
+        return range(start, start + self.rule_count[sym_id])
+
+
+class GrammarAnalysis:
+    """Análisis estático de la gramática (se calcula una vez)
+    
+    Sobre la gramática compilada sin podar determina:
+    
+    - ``productive``: no-terminales que derivan alguna cadena terminal
+    - ``reachable``: no-terminales alcanzables desde el inicial usando solo
+      producciones productivas
+    - ``nullable``: no-terminales que derivan la cadena vacía
+    - ``first`` / ``follow``: conjuntos FIRST y FOLLOW (``EPSILON`` y
+      ``END`` marcan la cadena vacía y el fin de entrada)
+    - ``left_recursive``: no-terminales con ``A =>+ A α``
+    - ``cycles``: grupos de no-terminales con ``A =>+ A`` (ciclos unitarios)
+    - ``useless``: producciones que no pueden formar parte de ninguna
+      derivación del símbolo inicial y se podan antes de generar
+    """
+    
+    EPSILON = 'ε'
+    END = '$'
+    
+    def __init__(self, compiled: CompiledGrammar, start_symbol: str):
+        self.compiled = compiled
+        self.start_symbol = start_symbol
+        inf = CompiledGrammar.UNREACHABLE
+        n = compiled.num_nonterminals
+        is_terminal = compiled.is_terminal
+        
+        self.productive = bytearray(1 if compiled.min_height[a] != inf else 0 for a in range(n))
+        self.nullable = compiled.nullable
+        
+        # Alcanzables desde el inicial a través de producciones productivas
+        self.reachable = bytearray(n)
+        start = compiled.symbol_ids.get(start_symbol)
+        stack = []
+        if start is not None and start < n and self.productive[start]:
+            self.reachable[start] = 1
+            stack.append(start)
+        while stack:
+            sym = stack.pop()
+            for p in compiled.productions_of(sym):
+                if compiled.prod_height[p] == inf:
+                    continue
+                for s in compiled.production(p):
+                    if not is_terminal[s] and not self.reachable[s]:
+                        self.reachable[s] = 1
+                        stack.append(s)
+        
+        self.useless = [p for p in range(compiled.num_productions)
+                        if compiled.prod_height[p] == inf
+                        or not self.reachable[compiled.prod_lhs[p]]]
+        
+        self._compute_first()
+        self._compute_follow(start)
+        self.left_recursive = self._recursive_symbols(self._left_corner_edges())
+        self.cycles = self._strong_components(self._unit_edges(compiled), with_loops=True)
+    
+    def _compute_first(self):
+        """FIRST de cada no-terminal (conjuntos de IDs) con lista de trabajo"""
+        compiled = self.compiled
+        n = compiled.num_nonterminals
+        self.first = [set() for _ in range(n)]
+        
+        # Producciones que mencionan cada no-terminal, para reevaluar solo esas
+        users = [[] for _ in range(n)]
+        for p in range(compiled.num_productions):
+            for s in set(compiled.production(p)):
+                if not compiled.is_terminal[s]:
+                    users[s].append(p)
+        
+        pending = deque(range(compiled.num_productions))
+        queued = bytearray([1] * compiled.num_productions)
+        while pending:
+            p = pending.popleft()
+            queued[p] = 0
+            lhs = compiled.prod_lhs[p]
+            first = self.sequence_first(compiled.production(p))[0]
+            if not first <= self.first[lhs]:
+                self.first[lhs] |= first
+                for user in users[lhs]:
+                    if not queued[user]:
+                        queued[user] = 1
+                        pending.append(user)
+    
+    def sequence_first(self, symbols: List[int]) -> Tuple[set, bool]:
+        """FIRST de una secuencia de símbolos y si puede ser vacía"""
+        is_terminal = self.compiled.is_terminal
+        result = set()
+        for s in symbols:
+            if is_terminal[s]:
+                result.add(s)
+                return result, False
+            result |= self.first[s]
+            if not self.nullable[s]:
+                return result, False
+        return result, True
+    
+    def _compute_follow(self, start: int):
+        """FOLLOW de cada no-terminal; el fin de entrada se representa con -1
+        
+        Primero agrega el FIRST de lo que sigue a cada aparición y luego
+        propaga FOLLOW(A) a los símbolos con los que A puede terminar.
+        """
+        compiled = self.compiled
+        is_terminal = compiled.is_terminal
+        n = compiled.num_nonterminals
+        self.follow = [set() for _ in range(n)]
+        if start is not None and start < n:
+            self.follow[start].add(-1)
+        
+        ends = [set() for _ in range(n)]
+        for p in range(compiled.num_productions):
+            symbols = compiled.production(p)
+            for i, s in enumerate(symbols):
+                if is_terminal[s]:
+                    continue
+                rest, empty = self.sequence_first(symbols[i + 1:])
+                self.follow[s] |= rest
+                if empty:
+                    ends[compiled.prod_lhs[p]].add(s)
+        
+        pending = deque(range(n))
+        queued = bytearray([1] * n)
+        while pending:
+            a = pending.popleft()
+            queued[a] = 0
+            for s in ends[a]:
+                if not self.follow[a] <= self.follow[s]:
+                    self.follow[s] |= self.follow[a]
+                    if not queued[s]:
+                        queued[s] = 1
+                        pending.append(s)
+    
+    def _left_corner_edges(self) -> List[set]:
+        """A -> B si alguna producción de A empieza por B tras símbolos anulables"""
+        compiled = self.compiled
+        edges = [set() for _ in range(compiled.num_nonterminals)]
+        for p in range(compiled.num_productions):
+            for s in compiled.production(p):
+                if compiled.is_terminal[s]:
+                    break
+                edges[compiled.prod_lhs[p]].add(s)
+                if not self.nullable[s]:
+                    break
+        return edges
+    
+    @staticmethod
+    def _unit_edges(compiled: CompiledGrammar) -> List[set]:
+        """A -> B si A deriva B solo (el resto de la producción es anulable)"""
+        nullable = compiled.nullable
+        edges = [set() for _ in range(compiled.num_nonterminals)]
+        for p in range(compiled.num_productions):
+            symbols = compiled.production(p)
+            if any(compiled.is_terminal[s] for s in symbols):
+                continue
+            for i, s in enumerate(symbols):
+                if all(nullable[t] for j, t in enumerate(symbols) if j != i):
+                    edges[compiled.prod_lhs[p]].add(s)
+        return edges
+    
+    def _recursive_symbols(self, edges: List[set]) -> List[int]:
+        """No-terminales que se alcanzan a sí mismos en el grafo"""
+        return sorted(sym for group in self._strong_components(edges, with_loops=True)
+                      for sym in group)
+    
+    @staticmethod
+    def _strong_components(edges: List[set], with_loops: bool = False) -> List[List[int]]:
+        """Componentes fuertemente conexas no triviales
+        
+        Con ``with_loops`` también cuenta un nodo solo con arista a sí mismo.
+        """
+        return sorted(sorted(component)
+                      for component in GrammarAnalysis._ordered_components(edges)
+                      if len(component) > 1
+                      or (with_loops and component[0] in edges[component[0]]))
+    
+    @staticmethod
+    def _ordered_components(edges: List[set]) -> List[List[int]]:
+        """Todas las componentes fuertemente conexas (Tarjan iterativo)
+        
+        Salen en orden topológico inverso: cada componente aparece después
+        de aquellas a las que llegan sus aristas.
+        """
+        n = len(edges)
+        index = [-1] * n
+        low = [0] * n
+        on_stack = bytearray(n)
+        stack = []
+        components = []
+        counter = 0
+        for root in range(n):
+            if index[root] >= 0:
+                continue
+            work = [(root, iter(edges[root]))]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if index[child] < 0:
+                        index[child] = low[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack[child] = 1
+                        work.append((child, iter(edges[child])))
+                        break
+                    if on_stack[child]:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            sym = stack.pop()
+                            on_stack[sym] = 0
+                            component.append(sym)
+                            if sym == node:
+                                break
+                        components.append(component)
+        return components
+    
+    def pruned_rules(self, rules: Dict[str, List[List[str]]],
+                     weights: Dict[str, List[float]] = None) -> Tuple[Dict, Dict]:
+        """Reglas y pesos sin las producciones inútiles"""
+        useless = set(self.useless)
+        kept_rules = {}
+        kept_weights = {}
+        prod_id = 0
+        for left, productions in rules.items():
+            rule_weights = (weights or {}).get(left)
+            kept = []
+            kept_rule_weights = []
+            for i, prod in enumerate(productions):
+                if prod_id not in useless:
+                    kept.append(prod)
+                    if rule_weights is not None:
+                        kept_rule_weights.append(rule_weights[i])
+                prod_id += 1
+            if kept:
+                kept_rules[left] = kept
+                if rule_weights is not None:
+                    kept_weights[left] = kept_rule_weights
+        return kept_rules, kept_weights
+    
+    def _names(self, ids) -> List[str]:
+        symbols = self.compiled.symbols
+        return [self.END if s < 0 else symbols[s] for s in sorted(ids)]
+    
+    def report(self) -> Dict:
+        """Hallazgos del análisis en forma serializable"""
+        compiled = self.compiled
+        n = compiled.num_nonterminals
+        symbols = compiled.symbols
+        first = {}
+        for a in range(n):
+            first[symbols[a]] = self._names(self.first[a]) + (
+                [self.EPSILON] if self.nullable[a] else [])
+        return {
+            'nonterminals': n,
+            'terminals': len(symbols) - n,
+            'productions': compiled.num_productions,
+            'unproductive': [symbols[a] for a in range(n) if not self.productive[a]],
+            'unreachable': [symbols[a] for a in range(n)
+                            if self.productive[a] and not self.reachable[a]],
+            'nullable': [symbols[a] for a in range(n) if self.nullable[a]],
+            'left_recursive': [symbols[a] for a in self.left_recursive],
+            'cycles': [[symbols[a] for a in group] for group in self.cycles],
+            'pruned': [compiled.production_text(p) for p in self.useless],
+            'first': first,
+            'follow': {symbols[a]: self._names(self.follow[a]) for a in range(n)},
+            'warnings': self.warnings(),
+        }
+    
+    def warnings(self) -> List[str]:
+        """Descripción de los problemas encontrados"""
+        compiled = self.compiled
+        n = compiled.num_nonterminals
+        symbols = compiled.symbols
+        messages = []
+        start = compiled.symbol_ids.get(self.start_symbol)
+        if start is None or start >= n or not self.productive[start]:
+            messages.append(f"El símbolo inicial '{self.start_symbol}' no deriva ninguna cadena")
+        unproductive = [symbols[a] for a in range(n) if not self.productive[a]]
+        if unproductive:
+            messages.append("No-terminales improductivos: " + ", ".join(unproductive))
+        unreachable = [symbols[a] for a in range(n) if self.productive[a] and not self.reachable[a]]
+        if unreachable:
+            messages.append("No-terminales inalcanzables: " + ", ".join(unreachable))
+        if self.useless:
+            messages.append(f"Producciones podadas: {len(self.useless)}")
+        for group in self.cycles:
+            messages.append("Ciclo de derivación (A =>+ A) entre: " + ", ".join(
+                symbols[a] for a in group))
+        return messages
+
+
+class Derivation:
+    """Resultado estructural de una derivación
+    
+    ``depth`` es la profundidad real del árbol (niveles de no-terminales
+    expandidos) y ``expansions`` la cantidad de producciones aplicadas. Si
+    se pide el árbol, se guarda codificado en dos arreglos paralelos con un
+    nodo por expansión en preorden (derivación por la izquierda):
+    ``parent`` (índice del nodo padre, -1 en la raíz) y ``production`` (ID
+    de la producción aplicada).
+    """
+    
+    __slots__ = ('depth', 'expansions', 'parent', 'production')
+    
+    def __init__(self, tree: bool = False):
+        self.depth = 0
+        self.expansions = 0
+        self.parent = array('i') if tree else None
+        self.production = array('i') if tree else None
+    
+    def tree(self) -> Dict[str, List[int]]:
+        """Árbol en forma serializable: ``{'parent': [...], 'production': [...]}``"""
+        return {'parent': self.parent.tolist(), 'production': self.production.tolist()}
+    
+    @staticmethod
+    def tokens(compiled: CompiledGrammar, productions: List[int]) -> List[str]:
+        """Reconstruye la cadena aplicando las producciones en preorden"""
+        tokens = []
+        remaining = iter(productions)
+        stack = [compiled.prod_lhs[productions[0]]] if len(productions) else []
+        while stack:
+            sym = stack.pop()
+            if compiled.is_terminal[sym]:
+                tokens.append(compiled.symbols[sym])
+            else:
+                stack.extend(reversed(compiled.production(next(remaining))))
+        return tokens
+
+
+class LengthSampler:
+    """Muestreo uniforme de cadenas de longitud exacta mediante conteo
+    
+    Precalcula, para cada no-terminal ``A`` y tamaño ``n``, el número de
+    árboles de derivación de ``A`` cuyo tamaño es exactamente ``n`` (enteros
+    de precisión arbitraria). Con esas tablas se elige cada producción y cada
+    reparto del tamaño entre los símbolos con la probabilidad exacta, sin
+    reintentos. El resultado es uniforme sobre los árboles de derivación (y
+    sobre las cadenas si la gramática no es ambigua); la profundidad no se
+    limita.
+    
+    La longitud se mide en ``'tokens'`` o en ``'chars'`` (caracteres de la
+    cadena unida con espacios, igual que ``len(expr)``). Las tablas se
+    extienden bajo demanda cuando se pide una longitud mayor.
+    """
+    
+    UNITS = ('tokens', 'chars')
+    
+    def __init__(self, compiled: CompiledGrammar, unit: str = 'tokens'):
+        if unit not in self.UNITS:
+            raise ValueError(f"Unidad de longitud desconocida: {unit}")
+        self.compiled = compiled
+        self.unit = unit
+        
+        # Tamaño de cada terminal: con 'chars' cada token aporta su texto más
+        # el espacio separador, por lo que una cadena de L caracteres mide L + 1
+        self.terminal_size = [
+            (1 if unit == 'tokens' else len(sym) + 1) if compiled.is_terminal[sym_id] else 0
+            for sym_id, sym in enumerate(compiled.symbols)
+        ]
+        self.size_offset = 0 if unit == 'tokens' else 1
+        
+        n = compiled.num_nonterminals
+        self.counts = [[] for _ in range(n)]
+        # Tamaños con conteo no nulo de cada no-terminal (para saltar ceros)
+        self.nonzero = [[] for _ in range(n)]
+        # suffix[p][i][m]: formas en que los símbolos p[i:] miden exactamente m
+        self.suffix = [
+            [[] for _ in range(compiled.prod_length[p] + 1)]
+            for p in range(compiled.num_productions)
+        ]
+        self.max_size = -1
+        self.order = self._evaluation_order()
+    
+    def _evaluation_order(self) -> List[int]:
+        """Orden de evaluación de los no-terminales dentro de un mismo tamaño
+        
+        ``A`` depende de ``B`` en el mismo tamaño si alguna producción de
+        ``A`` contiene a ``B`` y el resto de sus símbolos puede ser vacío
+        (por ejemplo ``E -> T``). Un ciclo de esas dependencias implica
+        infinitas derivaciones del mismo tamaño.
+        """
+        compiled = self.compiled
+        nullable = compiled.nullable
+        deps = [set() for _ in range(compiled.num_nonterminals)]
+        for prod_id in range(compiled.num_productions):
+            symbols = compiled.production(prod_id)
+            for i, s in enumerate(symbols):
+                if compiled.is_terminal[s]:
+                    continue
+                others = symbols[:i] + symbols[i + 1:]
+                if all(not compiled.is_terminal[o] and nullable[o] for o in others):
+                    deps[compiled.prod_lhs[prod_id]].add(s)
+        
+        order = []
+        state = [0] * compiled.num_nonterminals  # 0: pendiente, 1: visitando, 2: listo
+        for root in range(compiled.num_nonterminals):
+            if state[root]:
+                continue
+            state[root] = 1
+            stack = [(root, iter(deps[root]))]
+            while stack:
+                node, children = stack[-1]
+                for child in children:
+                    if state[child] == 1:
+                        raise ValueError(
+                            "Ciclo de producciones unitarias o anulables en "
+                            f"'{compiled.symbols[child]}': infinitas derivaciones")
+                    if state[child] == 0:
+                        state[child] = 1
+                        stack.append((child, iter(deps[child])))
+                        break
+                else:
+                    stack.pop()
+                    state[node] = 2
+                    order.append(node)
+        return order
+    
+    def _symbol_count(self, sym_id: int, size: int) -> int:
+        size_of_terminal = self.terminal_size[sym_id]
+        if size_of_terminal:
+            return 1 if size == size_of_terminal else 0
+        return self.counts[sym_id][size]
+    
+    def ensure(self, max_size: int):
+        """Extiende las tablas de conteo hasta ``max_size`` (inclusive)"""
+        compiled = self.compiled
+        terminal_size = self.terminal_size
+        for m in range(self.max_size + 1, max_size + 1):
+            for sym_id in range(compiled.num_nonterminals):
+                self.counts[sym_id].append(0)
+            for prod_id in range(compiled.num_productions):
+                self.suffix[prod_id][-1].append(1 if m == 0 else 0)
+            
+            for lhs in self.order:
+                total = 0
+                for prod_id in compiled.productions_of(lhs):
+                    table = self.suffix[prod_id]
+                    symbols = compiled.production(prod_id)
+                    for i in range(len(symbols) - 1, -1, -1):
+                        s = symbols[i]
+                        rest = table[i + 1]
+                        size_of_terminal = terminal_size[s]
+                        if size_of_terminal:
+                            ways = rest[m - size_of_terminal] if m >= size_of_terminal else 0
+                        else:
+                            counts = self.counts[s]
+                            ways = 0
+                            for k in self.nonzero[s]:
+                                ways += counts[k] * rest[m - k]
+                            # El tamaño m del propio símbolo aún no está en nonzero
+                            if counts[m]:
+                                ways += counts[m] * rest[0]
+                        table[i].append(ways)
+                    total += table[0][m]
+                self.counts[lhs][m] = total
+            
+            for sym_id in range(compiled.num_nonterminals):
+                if self.counts[sym_id][m]:
+                    self.nonzero[sym_id].append(m)
+            self.max_size = m
+    
+    def count(self, sym_id: int, length: int) -> int:
+        """Número de derivaciones de ``sym_id`` con longitud exacta ``length``"""
+        size = length + self.size_offset
+        if size < 0:
+            return 0
+        self.ensure(size)
+        return self._symbol_count(sym_id, size)
+    
+    def reachable_lengths(self, sym_id: int, min_length: int, max_length: int) -> List[int]:
+        """Longitudes en ``[min_length, max_length]`` con al menos una derivación"""
+        return [length for length in range(max(min_length, 0), max_length + 1)
+                if self.count(sym_id, length)]
+    
+    def sample(self, sym_id: int, length: int, rng=random,
+               derivation: Derivation = None) -> List[str]:
+        """Genera los tokens de una derivación uniforme de longitud exacta
+        
+        Si se pasa ``derivation`` se completa con la profundidad, las
+        expansiones y (si lo pide) el árbol de la derivación.
+        """
+        if not self.count(sym_id, length):
+            raise ValueError(
+                f"No existen cadenas de '{self.compiled.symbols[sym_id]}' "
+                f"con longitud {length} ({self.unit})")
+        
+        compiled = self.compiled
+        symbols = compiled.symbols
+        terminal_size = self.terminal_size
+        randrange = rng.randrange
+        tree = derivation is not None and derivation.parent is not None
+        tokens = []
+        # Pila de (símbolo, tamaño, profundidad, nodo padre)
+        stack = [(sym_id, length + self.size_offset, 1, -1)]
+        deepest = 0
+        expansions = 0
+        
+        while stack:
+            sym, m, d, parent = stack.pop()
+            if terminal_size[sym]:
+                tokens.append(symbols[sym])
+                continue
+            
+            # Elegir la producción con probabilidad proporcional a sus derivaciones
+            r = randrange(self.counts[sym][m])
+            for prod_id in compiled.productions_of(sym):
+                ways = self.suffix[prod_id][0][m]
+                if r < ways:
+                    break
+                r -= ways
+            
+            expansions += 1
+            if d > deepest:
+                deepest = d
+            node = -1
+            if tree:
+                node = len(derivation.production)
+                derivation.parent.append(parent)
+                derivation.production.append(prod_id)
+            
+            # Repartir el tamaño entre los símbolos de la producción
+            table = self.suffix[prod_id]
+            parts = []
+            for i, s in enumerate(compiled.production(prod_id)):
+                rest = table[i + 1]
+                if terminal_size[s]:
+                    k = terminal_size[s]
+                else:
+                    r = randrange(table[i][m])
+                    counts = self.counts[s]
+                    for k in self.nonzero[s]:
+                        if k > m:
+                            break
+                        ways = counts[k] * rest[m - k]
+                        if r < ways:
+                            break
+                        r -= ways
+                parts.append((s, k, d + 1, node))
+                m -= k
+            stack.extend(reversed(parts))
+        
+        if derivation is not None:
+            derivation.depth = deepest
+            derivation.expansions = expansions
+        return tokens
+
+
+class SentenceEnumerator:
+    """Enumeración exhaustiva de oraciones por cantidad de tokens
+    
+    ``sentences[A][n]`` es el conjunto de oraciones (tuplas de IDs de
+    terminales) de exactamente ``n`` tokens que deriva el no-terminal ``A``.
+    Las tablas se construyen por longitud creciente y bajo demanda, de modo
+    que cada oración se arma una sola vez a partir de las de longitudes
+    menores. Dentro de una misma longitud un no-terminal puede depender de
+    otro (producciones unitarias o símbolos anulables, como ``E -> T``): los
+    no-terminales se evalúan en orden de dependencias y solo las componentes
+    cíclicas se iteran hasta un punto fijo, que existe porque los conjuntos
+    solo crecen y son finitos.
+    """
+    
+    def __init__(self, compiled: CompiledGrammar):
+        self.compiled = compiled
+        n = compiled.num_nonterminals
+        self.sentences = [[] for _ in range(n)]
+        # Longitudes con oraciones de cada no-terminal (para saltar vacíos)
+        self.lengths = [[] for _ in range(n)]
+        self.max_tokens = -1
+        edges = GrammarAnalysis._unit_edges(compiled)
+        # (componente, es_cíclica) con las dependencias antes que quien las usa
+        self.order = [(component, len(component) > 1 or component[0] in edges[component[0]])
+                      for component in GrammarAnalysis._ordered_components(edges)]
+    
+    def ensure(self, max_tokens: int):
+        """Extiende las tablas hasta ``max_tokens`` (inclusive)"""
+        compiled = self.compiled
+        nonterminals = range(compiled.num_nonterminals)
+        for length in range(self.max_tokens + 1, max_tokens + 1):
+            for sym_id in nonterminals:
+                self.sentences[sym_id].append(set())
+            
+            for component, cyclic in self.order:
+                changed = True
+                while changed:
+                    changed = False
+                    for sym_id in component:
+                        table = self.sentences[sym_id][length]
+                        before = len(table)
+                        for prod_id in compiled.productions_of(sym_id):
+                            table.update(self._sequences(compiled.production(prod_id), 0, length))
+                        changed = changed or len(table) != before
+                    changed = changed and cyclic
+            
+            for sym_id in nonterminals:
+                if self.sentences[sym_id][length]:
+                    self.lengths[sym_id].append(length)
+            self.max_tokens = length
+    
+    def _sequences(self, symbols: List[int], i: int, length: int) -> List[Tuple[int, ...]]:
+        """Oraciones de exactamente ``length`` tokens que derivan ``symbols[i:]``"""
+        if i == len(symbols):
+            return [()] if length == 0 else []
+        sym = symbols[i]
+        if self.compiled.is_terminal[sym]:
+            if length == 0:
+                return []
+            return [(sym,) + rest for rest in self._sequences(symbols, i + 1, length - 1)]
+        
+        result = []
+        tables = self.sentences[sym]
+        # La longitud actual aún no está en self.lengths (se busca el punto fijo)
+        for head_length in chain(self.lengths[sym], [length] if tables[length] else []):
+            if head_length > length:
+                break
+            rest = self._sequences(symbols, i + 1, length - head_length)
+            if rest:
+                result.extend(head + tail for head in tables[head_length] for tail in rest)
+        return result
+    
+    def sentences_of(self, sym_id: int, length: int) -> List[str]:
+        """Oraciones de ``length`` tokens de ``sym_id``, unidas con espacios y ordenadas"""
+        self.ensure(length)
+        symbols = self.compiled.symbols
+        return sorted(' '.join(symbols[t] for t in sentence)
+                      for sentence in self.sentences[sym_id][length])
+
+
+class EarleyRecognizer:
+    """Reconocedor de Earley sobre la gramática compilada
+    
+    Decide si una secuencia de tokens pertenece al lenguaje. Para acelerar
+    la predicción se precalculan, por no-terminal, todas las producciones
+    que se predicen transitivamente al esperarlo (``prediction``) y el
+    conjunto FIRST de cada producción, de modo que solo se agregan los
+    ítems que pueden consumir el siguiente token. Los no-terminales
+    anulables se saltan al predecir (técnica de Aycock y Horspool).
+    """
+    
+    def __init__(self, compiled: CompiledGrammar, start_symbol: str = None,
+                 analysis: 'GrammarAnalysis' = None):
+        self.compiled = compiled
+        self.start = 0 if start_symbol is None else compiled.symbol_ids[start_symbol]
+        self.first = self._production_first_sets(analysis)
+        self.nullable_production = bytearray(
+            all(not compiled.is_terminal[s] and compiled.nullable[s]
+                for s in compiled.production(p))
+            for p in range(compiled.num_productions))
+        self.predicted_symbols, self.prediction = self._prediction_closures()
+    
+    def _production_first_sets(self, analysis: 'GrammarAnalysis' = None) -> List[frozenset]:
+        """Terminales con que puede empezar cada producción
+        
+        Usa el FIRST de ``analysis``, que puede ser el de la gramática sin
+        podar: los símbolos se traducen por nombre y, como la poda solo quita
+        producciones, el conjunto puede sobrar pero nunca omite un terminal
+        que la predicción necesite.
+        """
+        compiled = self.compiled
+        if analysis is None:
+            analysis = GrammarAnalysis(compiled, compiled.symbols[self.start])
+        if analysis.compiled is compiled:
+            return [frozenset(analysis.sequence_first(compiled.production(p))[0])
+                    for p in range(compiled.num_productions)]
+        
+        to_analysis = analysis.compiled.symbol_ids
+        from_analysis = analysis.compiled.symbols
+        firsts = []
+        for p in range(compiled.num_productions):
+            symbols = [to_analysis[compiled.symbols[s]] for s in compiled.production(p)]
+            first = analysis.sequence_first(symbols)[0]
+            firsts.append(frozenset(compiled.symbol_ids[from_analysis[t]] for t in first
+                                    if from_analysis[t] in compiled.symbol_ids))
+        return firsts
+    
+    def _prediction_closures(self) -> Tuple[List[List[int]], List[List[int]]]:
+        """No-terminales y producciones predichos al esperar cada no-terminal"""
+        compiled = self.compiled
+        nullable = compiled.nullable
+        is_terminal = compiled.is_terminal
+        
+        # B se predice desde A si A -> N1 ... Nk B ... con N1..Nk anulables
+        direct = [set() for _ in range(compiled.num_nonterminals)]
+        for prod_id in range(compiled.num_productions):
+            for s in compiled.production(prod_id):
+                if is_terminal[s]:
+                    break
+                direct[compiled.prod_lhs[prod_id]].add(s)
+                if not nullable[s]:
+                    break
+        
+        symbols = []
+        productions = []
+        for sym_id in range(compiled.num_nonterminals):
+            seen = {sym_id}
+            pending = [sym_id]
+            while pending:
+                for child in direct[pending.pop()]:
+                    if child not in seen:
+                        seen.add(child)
+                        pending.append(child)
+            symbols.append(sorted(seen))
+            productions.append([p for s in sorted(seen) for p in compiled.productions_of(s)])
+        return symbols, productions
+    
+    def recognizes(self, tokens: List[str]) -> bool:
+        """Indica si los tokens forman una cadena del lenguaje"""
+        compiled = self.compiled
+        symbol_ids = compiled.symbol_ids
+        is_terminal = compiled.is_terminal
+        
+        # Convertir a IDs; un token que no es terminal se rechaza de inmediato
+        word = []
+        for token in tokens:
+            sym_id = symbol_ids.get(token)
+            if sym_id is None or not is_terminal[sym_id]:
+                return False
+            word.append(sym_id)
+        
+        n = len(word)
+        nullable = compiled.nullable
+        prod_lhs = compiled.prod_lhs
+        prod_offset = compiled.prod_offset
+        prod_length = compiled.prod_length
+        prod_symbols = compiled.prod_symbols
+        first = self.first
+        nullable_production = self.nullable_production
+        prediction = self.prediction
+        predicted_symbols = self.predicted_symbols
+        
+        # Cada conjunto guarda ítems (producción, punto, origen)
+        sets = [[] for _ in range(n + 1)]
+        seen = [set() for _ in range(n + 1)]
+        waiting = [{} for _ in range(n + 1)]
+        
+        def add(i, item):
+            if item not in seen[i]:
+                seen[i].add(item)
+                sets[i].append(item)
+        
+        def predict(i, sym, predicted):
+            predicted.update(predicted_symbols[sym])
+            lookahead = word[i] if i < n else None
+            for prod_id in prediction[sym]:
+                if lookahead in first[prod_id] or nullable_production[prod_id]:
+                    add(i, (prod_id, 0, i))
+        
+        for i in range(n + 1):
+            items = sets[i]
+            predicted = set()
+            if i == 0:
+                predict(0, self.start, predicted)
+            k = 0
+            while k < len(items):
+                prod_id, dot, origin = items[k]
+                k += 1
+                
+                if dot == prod_length[prod_id]:
+                    # Completar: avanzar los ítems que esperaban este no-terminal
+                    for waiting_prod, waiting_dot, waiting_origin in \
+                            waiting[origin].get(prod_lhs[prod_id], ()):
+                        add(i, (waiting_prod, waiting_dot + 1, waiting_origin))
+                    continue
+                
+                sym = prod_symbols[prod_offset[prod_id] + dot]
+                if is_terminal[sym]:
+                    # Escanear
+                    if i < n and word[i] == sym:
+                        add(i + 1, (prod_id, dot + 1, origin))
+                    continue
+                
+                # Predecir (una vez por conjunto) y saltar anulables
+                waiting[i].setdefault(sym, []).append((prod_id, dot, origin))
+                if sym not in predicted:
+                    predict(i, sym, predicted)
+                if nullable[sym]:
+                    add(i, (prod_id, dot + 1, origin))
+            
+            if i < n and not sets[i + 1]:
+                return False
+        
+        start = self.start
+        return any(dot == prod_length[p] and origin == 0 and prod_lhs[p] == start
+                   for p, dot, origin in sets[n])
+
+
+class CaseView(Mapping):
+    """Vista de solo lectura de una fila de un CaseStore
+    
+    Se comporta como el diccionario del caso (``case['type']``,
+    ``case.get('mutation')``, ``'depth' in case``, ``dict(case)``) pero
+    solo guarda el almacén y el número de fila.
+    """
+    
+    __slots__ = ('store', 'row')
+    
+    def __init__(self, store: 'CaseStore', row: int):
+        self.store = store
+        self.row = row
+    
+    def __getitem__(self, key: str):
+        return self.store.value(self.row, key)
+    
+    def __iter__(self):
+        return iter(self.store.fields(self.row))
+    
+    def __len__(self) -> int:
+        return len(self.store.fields(self.row))
+    
+    def __repr__(self) -> str:
+        return f"CaseView({self.to_dict()!r})"
+    
+    def to_dict(self) -> Dict:
+        """Copia del caso como diccionario (con las claves en el orden original)"""
+        return {key: self.store.value(self.row, key) for key in self.store.fields(self.row)}
+
+
+class CaseStore:
+    """Almacén columnar de casos de prueba
+    
+    En lugar de un diccionario por caso guarda una columna por campo:
+    ``array`` tipados para id, longitud, profundidad y expansiones, y
+    códigos enteros para el tipo, la mutación y el tipo extremo (con su
+    tabla de nombres). Las expresiones van codificadas en UTF-8 en un único
+    ``bytearray``; las cortas, que son las que más se repiten, se internan
+    y se guardan una sola vez. Los campos poco comunes (por ejemplo
+    ``tree``) quedan en un diccionario aparte por fila.
+    
+    Es una secuencia de ``CaseView``: indexar, iterar, ``len`` y comparar
+    funcionan como con la lista de diccionarios, así que la interfaz, las
+    métricas y la exportación lo usan sin cambios.
+    """
+    
+    # Orden de las claves de un caso (el mismo con que se generan)
+    FIELDS = ('id', 'type', 'expression', 'mutation', 'extreme_type',
+              'depth', 'expansions', 'length')
+    TYPES = ('válida', 'inválida', 'extrema')
+    # Las expresiones de hasta estos bytes se guardan una sola vez
+    INTERN_MAX = 32
+    
+    def __init__(self, cases=None):
+        self.ids = array('q')
+        self.lengths = array('l')
+        # -1 indica que el caso no tiene el campo
+        self.depths = array('l')
+        self.expansions = array('l')
+        self.types = array('b')
+        self.mutations = array('l')
+        self.extreme_types = array('b')
+        # Tablas de códigos: campo -> nombres y nombre -> código
+        self.labels = {'type': list(self.TYPES), 'mutation': [], 'extreme_type': []}
+        self._codes = {field: {name: code for code, name in enumerate(names)}
+                       for field, names in self.labels.items()}
+        # Pool de expresiones: inicio y tamaño en bytes de cada fila
+        self.pool = bytearray()
+        self.offsets = array('Q')
+        self.sizes = array('L')
+        self._interned = {}
+        self.extras = {}
+        if cases is not None:
+            self.extend(cases)
+    
+    def _code(self, field: str, name: str) -> int:
+        codes = self._codes[field]
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(self.labels[field])
+            self.labels[field].append(name)
+        return code
+    
+    def _add_expression(self, expression: str):
+        data = expression.encode('utf-8')
+        offset = None
+        if len(data) <= self.INTERN_MAX:
+            offset = self._interned.get(data)
+            if offset is None:
+                offset = self._interned[data] = len(self.pool)
+                self.pool += data
+        else:
+            offset = len(self.pool)
+            self.pool += data
+        self.offsets.append(offset)
+        self.sizes.append(len(data))
+    
+    def append(self, case: Dict):
+        """Agrega un caso (diccionario o vista)"""
+        row = len(self.ids)
+        self.ids.append(case['id'])
+        self.types.append(self._code('type', case['type']))
+        self._add_expression(case['expression'])
+        mutation = case.get('mutation')
+        self.mutations.append(-1 if mutation is None else self._code('mutation', mutation))
+        extreme_type = case.get('extreme_type')
+        self.extreme_types.append(-1 if extreme_type is None
+                                  else self._code('extreme_type', extreme_type))
+        self.depths.append(case.get('depth', -1))
+        self.expansions.append(case.get('expansions', -1))
+        self.lengths.append(case['length'])
+        extra = {key: case[key] for key in case if key not in self.FIELDS}
+        if extra:
+            self.extras[row] = extra
+    
+    def extend(self, cases):
+        for case in cases:
+            self.append(case)
+    
+    def expression(self, row: int) -> str:
+        offset = self.offsets[row]
+        return self.pool[offset:offset + self.sizes[row]].decode('utf-8')
+    
+    def value(self, row: int, key: str):
+        """Valor del campo ``key`` de la fila (KeyError si el caso no lo tiene)"""
+        if key == 'id':
+            return self.ids[row]
+        if key == 'type':
+            return self.labels['type'][self.types[row]]
+        if key == 'expression':
+            return self.expression(row)
+        if key == 'length':
+            return self.lengths[row]
+        if key == 'depth' or key == 'expansions':
+            value = (self.depths if key == 'depth' else self.expansions)[row]
+            if value >= 0:
+                return value
+        elif key == 'mutation' or key == 'extreme_type':
+            code = (self.mutations if key == 'mutation' else self.extreme_types)[row]
+            if code >= 0:
+                return self.labels[key][code]
+        elif row in self.extras and key in self.extras[row]:
+            return self.extras[row][key]
+        raise KeyError(key)
+    
+    def fields(self, row: int) -> List[str]:
+        """Claves presentes en la fila, en el orden de FIELDS"""
+        fields = ['id', 'type', 'expression']
+        if self.mutations[row] >= 0:
+            fields.append('mutation')
+        if self.extreme_types[row] >= 0:
+            fields.append('extreme_type')
+        if self.depths[row] >= 0:
+            fields.append('depth')
+        if self.expansions[row] >= 0:
+            fields.append('expansions')
+        fields.append('length')
+        if row in self.extras:
+            fields.extend(self.extras[row])
+        return fields
+    
+    def positions_by_type(self) -> Dict[str, List[int]]:
+        """Posiciones de los casos de cada tipo, recorriendo solo la columna de tipos"""
+        positions = {}
+        names = self.labels['type']
+        for row, code in enumerate(self.types):
+            positions.setdefault(names[code], []).append(row)
+        return positions
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CaseView(self, row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('índice de caso fuera de rango')
+        return CaseView(self, index)
+    
+    def __iter__(self):
+        for row in range(len(self)):
+            yield CaseView(self, row)
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (CaseStore, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    
+    def to_list(self) -> List[Dict]:
+        """Los casos como lista de diccionarios"""
+        return [case.to_dict() for case in self]
 
 
 class TestCaseGenerator:
     """Generador de casos de prueba"""
     
-    def __init__(self, grammar: GrammarParser):
+    EXTREME_TYPES = ['max_depth', 'min_depth', 'long_expression', 'nested_parenthesis', 'exact_length']
+    
+    def __init__(self, grammar: GrammarParser, seed: int = None):
         self.grammar = grammar
-        self.test_cases = []
+        # Fuente de aleatoriedad propia de la instancia (no el módulo random,
+        # que es global y compartido entre hilos)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Semilla y parámetros de la última generación (ver regenerate_case)
+        self.parameters = {}
+        # Casos de la última generación, en columnas (ver CaseStore)
+        self.test_cases = CaseStore()
         self.metrics = {}
+        # Métricas en línea de la generación en curso (ver iter_cases)
+        self.live_metrics = MetricsAccumulator()
+        self._live_source = None
+        self.counters = Counter()
+        # Segundos acumulados por fase (valid, invalid, extreme, verify, ...)
+        self.timers = Counter()
+        # Funciones hook(evento, datos) llamadas durante la generación
+        self.hooks = []
+        self.profile_report = {}
+        # Si tracemalloc lo inició este generador (y debe detenerlo él)
+        self._tracing = False
+        self.deduplicator = None
+        self.coverage = None
+        # Gramática compilada sin muestreador por longitud (ver _chars_sampler)
+        self._sampler_error = None
+        # Pool de subárboles de la generación en curso (ver SubtreePool)
+        self.pool = None
+        self._pool_cases = None
+        self._worker_pools = {}
         self.start_time = None
         self.end_time = None
     
     def generate_valid(self, symbol: str, depth: int, max_depth: int) -> str:
         """Genera una cadena válida mediante derivación"""
-        if depth > max_depth:
-            # Si alcanzamos profundidad máxima, intentar derivar a terminal
-            if symbol not in self.grammar.rules:
-                return symbol
-            # Buscar producción que derive directamente a terminales
-            for prod in self.grammar.rules[symbol]:
-                if all(s not in self.grammar.rules for s in prod):
-                    return ' '.join(prod)
-            return ''
-        
-        # Si es terminal, retornarlo
-        if symbol not in self.grammar.rules:
-            return symbol
-        
-        # Elegir una producción al azar
-        productions = self.grammar.rules[symbol]
-        production = random.choice(productions)
-        
-        # Derivar cada símbolo de la producción
-        result = []
-        for sym in production:
-            derived = self.generate_valid(sym, depth + 1, max_depth)
-            if derived:
-                result.append(derived)
+        return ' '.join(self._valid_tokens(symbol, depth, max_depth))
+    
+    def _valid_tokens(self, symbol: str, depth: int, max_depth: int,
+                      coverage: 'CoverageTracker' = None,
+                      derivation: Derivation = None, pooled: bool = True) -> List[str]:
+        """Tokens de una derivación aleatoria (ver ``generate_valid``)
+        
+        Con ``coverage`` la derivación se guía hacia lo que aún no está
+        cubierto (ver ``_derive_guided``). ``derivation`` recibe la
+        profundidad real, las expansiones y, si lo pide, el árbol. Con
+        ``pooled=False`` no se usa el pool de subárboles aunque esté activo.
+        """
+        compiled = self.grammar.compiled
+        sym_id = compiled.symbol_ids.get(symbol)
+        if sym_id is None:
+            # Símbolo desconocido: se trata como terminal
+            return [symbol]
+        tokens = []
+        if coverage is None:
+            if pooled and self.pool is not None and (derivation is None or
+                                                     derivation.parent is None):
+                self._derive_pooled(compiled, sym_id, depth, max_depth, tokens, derivation)
+            else:
+                self._derive(compiled, sym_id, depth, max_depth, tokens, derivation)
+        else:
+            self._derive_guided(compiled, sym_id, depth, max_depth, tokens, coverage, derivation)
+        return tokens
+    
+    def _derive(self, compiled: CompiledGrammar, sym_id: int, depth: int,
+                max_depth: int, out: List[str], derivation: Derivation = None):
+        """Derivación iterativa sobre la gramática compilada
+        
+        Usa una pila explícita (símbolos y profundidades en pilas paralelas)
+        en lugar de recursión, y agrega los terminales a ``out`` en orden.
+        
+        Un no-terminal en profundidad ``d`` dispone de ``max_depth - d + 1``
+        niveles. Si todas sus producciones caben se elige una al azar (igual
+        que antes); si no, se elige al azar entre las que aún pueden terminar
+        a tiempo según ``min_height``; y si ninguna cabe se toma la de
+        derivación mínima, lo que garantiza que la cadena siempre termina.
+        
+        Con una gramática con pesos la elección es proporcional al peso: en
+        O(1) con las tablas de alias si todas caben, y por bisección sobre
+        los pesos acumulados si solo caben algunas.
+        
+        La profundidad alcanzada y las expansiones se anotan en
+        ``derivation``; con árbol, una pila más lleva el nodo padre de cada
+        símbolo.
+        """
+        symbols = compiled.symbols
+        is_terminal = compiled.is_terminal
+        rule_offset = compiled.rule_offset
+        rule_count = compiled.rule_count
+        rule_max_height = compiled.rule_max_height
+        rule_sorted = compiled.rule_sorted
+        sorted_heights = compiled.sorted_heights
+        min_height = compiled.min_height
+        best_production = compiled.best_production
+        prod_offset = compiled.prod_offset
+        prod_length = compiled.prod_length
+        reversed_symbols = compiled.prod_symbols_reversed
+        randrange = self.rng.randrange
+        bisect_right = bisect.bisect_right
+        emit = out.append
+        weighted = compiled.weighted
+        if weighted:
+            uniform = self.rng.random
+            alias_prob = compiled.alias_prob
+            alias_index = compiled.alias_index
+            cumweight = compiled.sorted_cumweight
+        
+        sym_stack = [sym_id]
+        depth_stack = [depth]
+        push_syms = sym_stack.extend
+        push_depths = depth_stack.extend
+        expansions = 0
+        deepest = depth - 1
+        tree = derivation is not None and derivation.parent is not None
+        if tree:
+            node_stack = [-1]
+            tree_parents = derivation.parent
+            tree_productions = derivation.production
+        
+        while sym_stack:
+            sym = sym_stack.pop()
+            d = depth_stack.pop()
+            if tree:
+                parent_node = node_stack.pop()
+            
+            # Si es terminal, emitirlo
+            if is_terminal[sym]:
+                emit(symbols[sym])
+                continue
+            
+            budget = max_depth - d + 1
+            if budget >= rule_max_height[sym]:
+                # Elegir una producción al azar
+                prod_id = rule_offset[sym] + randrange(rule_count[sym])
+                if weighted and uniform() >= alias_prob[prod_id]:
+                    prod_id = alias_index[prod_id]
+            elif budget >= min_height[sym]:
+                # Elegir al azar entre las producciones que caben en el presupuesto
+                lo = rule_offset[sym]
+                fits = bisect_right(sorted_heights, budget, lo, lo + rule_count[sym]) - lo
+                if weighted and cumweight[lo + fits - 1] > 0:
+                    point = uniform() * cumweight[lo + fits - 1]
+                    prod_id = rule_sorted[min(bisect_right(cumweight, point, lo, lo + fits),
+                                              lo + fits - 1)]
+                else:
+                    prod_id = rule_sorted[lo + randrange(fits)]
+            else:
+                # Sin presupuesto: derivación mínima hacia terminales
+                prod_id = best_production[sym]
+                if prod_id < 0:
+                    continue
+            
+            # Apilar los símbolos de la producción al revés
+            expansions += 1
+            if d > deepest:
+                deepest = d
+            start = prod_offset[prod_id]
+            length = prod_length[prod_id]
+            push_syms(reversed_symbols[start:start + length])
+            push_depths([d + 1] * length)
+            if tree:
+                node_stack.extend([len(tree_productions)] * length)
+                tree_parents.append(parent_node)
+                tree_productions.append(prod_id)
         
-        return ' '.join(result)
+        self.counters['expansions'] += expansions
+        if derivation is not None:
+            derivation.depth = deepest - depth + 1
+            derivation.expansions = expansions
+    
+    def _choose_production(self, compiled: CompiledGrammar, sym: int, budget: int) -> int:
+        """Producción de ``sym`` con ``budget`` niveles, con la misma regla que ``_derive``"""
+        rng = self.rng
+        if budget >= compiled.rule_max_height[sym]:
+            prod_id = compiled.rule_offset[sym] + rng.randrange(compiled.rule_count[sym])
+            if compiled.weighted and rng.random() >= compiled.alias_prob[prod_id]:
+                prod_id = compiled.alias_index[prod_id]
+            return prod_id
+        if budget >= compiled.min_height[sym]:
+            lo = compiled.rule_offset[sym]
+            fits = bisect.bisect_right(compiled.sorted_heights, budget, lo,
+                                       lo + compiled.rule_count[sym]) - lo
+            cumweight = compiled.sorted_cumweight
+            if compiled.weighted and cumweight[lo + fits - 1] > 0:
+                point = rng.random() * cumweight[lo + fits - 1]
+                return compiled.rule_sorted[min(bisect.bisect_right(cumweight, point, lo, lo + fits),
+                                                lo + fits - 1)]
+            return compiled.rule_sorted[lo + rng.randrange(fits)]
+        return compiled.best_production[sym]
+    
+    def _derive_pooled(self, compiled: CompiledGrammar, sym_id: int, depth: int,
+                       max_depth: int, out: List[str], derivation: Derivation = None):
+        """Derivación que reutiliza subárboles de ``self.pool``
+        
+        Igual que ``_derive`` (pila explícita y la misma elección de
+        producciones), pero cada no-terminal por debajo de la raíz primero
+        se busca en el pool: si hay un subárbol para su presupuesto, sus
+        tokens se copian a ``out`` sin derivarlo. Si no, se deriva y una
+        marca en la pila (símbolo -1) indica dónde termina, para guardarlo
+        en el pool con su altura y sus expansiones. La raíz se deriva
+        siempre, así que dos casos nunca son el mismo subárbol reutilizado.
+        """
+        pool = self.pool
+        rng = self.rng
+        symbols = compiled.symbols
+        is_terminal = compiled.is_terminal
+        prod_offset = compiled.prod_offset
+        prod_length = compiled.prod_length
+        reversed_symbols = compiled.prod_symbols_reversed
+        choose = self._choose_production
+        emit = out.append
+        
+        sym_stack = [sym_id]
+        depth_stack = [depth]
+        # Subárboles en construcción: [clave, inicio en out, expansiones, nivel más profundo]
+        open_subtrees = []
+        expansions = 0
+        performed = 0
+        reused = 0
+        derived = 0
+        evicted = 0
+        deepest = depth - 1
+        
+        while sym_stack:
+            sym = sym_stack.pop()
+            d = depth_stack.pop()
+            
+            if sym < 0:
+                # Fin de un subárbol derivado: se guarda en el pool
+                key, start, first_expansion, sub_deepest = open_subtrees.pop()
+                entry = (tuple(out[start:]), sub_deepest - d + 1, expansions - first_expansion)
+                derived += 1
+                if pool.store(key, entry, rng):
+                    evicted += 1
+                if open_subtrees and sub_deepest > open_subtrees[-1][3]:
+                    open_subtrees[-1][3] = sub_deepest
+                continue
+            
+            if is_terminal[sym]:
+                emit(symbols[sym])
+                continue
+            
+            budget = max_depth - d + 1
+            if d > depth:
+                key = pool.key(sym, budget)
+                entry = pool.draw(key, budget, rng)
+                if entry is not None:
+                    tokens, height, subtree_expansions = entry
+                    out.extend(tokens)
+                    expansions += subtree_expansions
+                    reused += 1
+                    top = d + height - 1
+                    if top > deepest:
+                        deepest = top
+                    if open_subtrees and top > open_subtrees[-1][3]:
+                        open_subtrees[-1][3] = top
+                    continue
+                open_subtrees.append([key, len(out), expansions, d - 1])
+                sym_stack.append(-1)
+                depth_stack.append(d)
+            
+            prod_id = choose(compiled, sym, budget)
+            if prod_id < 0:
+                continue
+            
+            expansions += 1
+            performed += 1
+            if d > deepest:
+                deepest = d
+            if open_subtrees and d > open_subtrees[-1][3]:
+                open_subtrees[-1][3] = d
+            start = prod_offset[prod_id]
+            length = prod_length[prod_id]
+            sym_stack.extend(reversed_symbols[start:start + length])
+            depth_stack.extend([d + 1] * length)
+        
+        counters = self.counters
+        counters['expansions'] += performed
+        counters['pool_reused'] += reused
+        counters['pool_derived'] += derived
+        counters['pool_evicted'] += evicted
+        if derivation is not None:
+            derivation.depth = deepest - depth + 1
+            derivation.expansions = expansions
+    
+    def _derive_guided(self, compiled: CompiledGrammar, sym_id: int, depth: int,
+                       max_depth: int, out: List[str], coverage: 'CoverageTracker',
+                       derivation: Derivation = None):
+        """Derivación iterativa guiada por cobertura
+        
+        Igual que ``_derive``, pero entre las producciones que caben en la
+        profundidad restante elige al azar solo entre las prometedoras
+        (sin cubrir, o que llevan a algo sin cubrir); si no hay ninguna,
+        entre todas. Cada elección se registra en ``coverage`` junto con la
+        producción padre.
+        """
+        symbols = compiled.symbols
+        is_terminal = compiled.is_terminal
+        rule_offset = compiled.rule_offset
+        rule_count = compiled.rule_count
+        rule_sorted = compiled.rule_sorted
+        sorted_heights = compiled.sorted_heights
+        min_height = compiled.min_height
+        best_production = compiled.best_production
+        prod_offset = compiled.prod_offset
+        prod_length = compiled.prod_length
+        reversed_symbols = compiled.prod_symbols_reversed
+        randrange = self.rng.randrange
+        bisect_right = bisect.bisect_right
+        emit = out.append
+        promising = coverage.promising
+        record = coverage.record
+        coverage.refresh()
+        
+        # Pilas paralelas: símbolo, profundidad y producción padre
+        sym_stack = [sym_id]
+        depth_stack = [depth]
+        parent_stack = [-1]
+        expansions = 0
+        deepest = depth - 1
+        tree = derivation is not None and derivation.parent is not None
+        node_stack = [-1]
+        
+        while sym_stack:
+            sym = sym_stack.pop()
+            d = depth_stack.pop()
+            parent = parent_stack.pop()
+            parent_node = node_stack.pop()
+            
+            if is_terminal[sym]:
+                emit(symbols[sym])
+                continue
+            
+            budget = max_depth - d + 1
+            if budget >= min_height[sym]:
+                lo = rule_offset[sym]
+                fits = bisect_right(sorted_heights, budget, lo, lo + rule_count[sym]) - lo
+                candidates = rule_sorted[lo:lo + fits]
+                preferred = [p for p in candidates if promising(parent, p)]
+                if preferred:
+                    candidates = preferred
+                prod_id = candidates[randrange(len(candidates))]
+            else:
+                prod_id = best_production[sym]
+                if prod_id < 0:
+                    continue
+            record(parent, prod_id)
+            expansions += 1
+            if d > deepest:
+                deepest = d
+            node = -1
+            if tree:
+                node = len(derivation.production)
+                derivation.parent.append(parent_node)
+                derivation.production.append(prod_id)
+            
+            start = prod_offset[prod_id]
+            length = prod_length[prod_id]
+            sym_stack.extend(reversed_symbols[start:start + length])
+            depth_stack.extend([d + 1] * length)
+            parent_stack.extend([prod_id] * length)
+            node_stack.extend([node] * length)
+        
+        self.counters['expansions'] += expansions
+        if derivation is not None:
+            derivation.depth = deepest - depth + 1
+            derivation.expansions = expansions
     
     def generate_invalid(self, valid_string: str) -> Tuple[str, str]:
         """Genera una cadena inválida mediante mutación sintáctica"""
+        tokens, mutation_names, compact = self._mutate_tokens(valid_string.split())
+        return self._render(tokens, compact), mutation_names[0]
+    
+    def _mutate_tokens(self, tokens: List[str], count: int = 1) -> Tuple[List[str], List[str], bool]:
+        """Aplica ``count`` mutaciones sucesivas sobre una copia de los tokens
+        
+        Las posiciones se eligen al azar sobre un índice de tokens por papel
+        (operador, operando, delimitador) que se construye en una pasada y
+        solo se reconstruye si una mutación desplaza posiciones: agregar al
+        final o quitar espacios lo conservan. Devuelve los tokens mutados,
+        los nombres de las mutaciones y si la cadena debe unirse sin espacios.
+        """
         mutations = [
-            ('eliminar_operador', lambda s: self._remove_operator(s)),
-            ('duplicar_operador', lambda s: self._duplicate_operator(s)),
-            ('parentesis_desbalanceado', lambda s: self._unbalanced_parenthesis(s)),
-            ('operador_inicio', lambda s: '+ ' + s),
-            ('operador_final', lambda s: s + ' *'),
-            ('eliminar_operando', lambda s: self._remove_operand(s)),
-            ('espacios_incorrectos', lambda s: s.replace(' ', '')),
+            ('eliminar_operador', self._remove_operator),
+            ('duplicar_operador', self._duplicate_operator),
+            ('parentesis_desbalanceado', self._unbalanced_parenthesis),
+            ('operador_inicio', self._operator_at_start),
+            ('operador_final', self._operator_at_end),
+            ('eliminar_operando', self._remove_operand),
+            ('espacios_incorrectos', None),
         ]
         
-        mutation_name, mutation_func = random.choice(mutations)
-        try:
-            invalid_string = mutation_func(valid_string)
-            return invalid_string, mutation_name
-        except:
-            return valid_string + ' +', 'operador_final'
+        tokens = list(tokens)
+        names = []
+        compact = False
+        index = None
+        for _ in range(count):
+            mutation_name, mutation_func = self.rng.choice(mutations)
+            if mutation_func is None:
+                # Eliminar espacios: se aplica al unir los tokens
+                applied = len(tokens) > 1
+                compact = compact or applied
+            else:
+                if index is None:
+                    index = self._role_index(tokens)
+                try:
+                    applied = mutation_func(tokens, index)
+                except:
+                    self.counters['mutation_errors'] += 1
+                    applied = False
+                    index = None
+                else:
+                    if applied and mutation_func == self._operator_at_end:
+                        self._index_last(tokens, index)
+                    elif applied:
+                        index = None
+            
+            if not applied:
+                # Mutación no aplicable a esta cadena: operador al final
+                self.counters['mutation_fallbacks'] += 1
+                operators = self.grammar.compiled.operators or ['+']
+                tokens.append(self.rng.choice(operators))
+                mutation_name = 'operador_final'
+                if index is not None:
+                    self._index_last(tokens, index)
+            names.append(mutation_name)
+        
+        return tokens, names, compact
+    
+    @staticmethod
+    def _render(tokens: List[str], compact: bool = False) -> str:
+        return ''.join(tokens) if compact else ' '.join(tokens)
     
-    def _remove_operator(self, s: str) -> str:
+    def _role_index(self, tokens: List[str]) -> Dict[str, List[int]]:
+        """Posiciones de los tokens agrupadas por papel en la gramática"""
+        role_of = self.grammar.compiled.role_of
+        index = {'operand': [], 'operator': [], 'open': [], 'close': []}
+        for i, token in enumerate(tokens):
+            index[role_of.get(token, 'operand')].append(i)
+        return index
+    
+    def _index_last(self, tokens: List[str], index: Dict[str, List[int]]):
+        """Agrega al índice el token recién puesto al final"""
+        role = self.grammar.compiled.role_of.get(tokens[-1], 'operand')
+        index[role].append(len(tokens) - 1)
+    
+    def _remove_operator(self, tokens: List[str], index: Dict[str, List[int]]) -> bool:
         """Elimina un operador aleatorio"""
-        operators = ['+', '-', '*', '/', '%']
-        for op in operators:
-            if op in s:
-                return s.replace(op, '', 1)
-        return s
+        if not index['operator']:
+            return False
+        del tokens[self.rng.choice(index['operator'])]
+        return True
     
-    def _duplicate_operator(self, s: str) -> str:
+    def _duplicate_operator(self, tokens: List[str], index: Dict[str, List[int]]) -> bool:
         """Duplica un operador aleatorio"""
-        operators = ['+', '-', '*', '/', '%']
-        for op in operators:
-            if op in s:
-                return s.replace(op, op + op, 1)
-        return s
+        if not index['operator']:
+            return False
+        position = self.rng.choice(index['operator'])
+        tokens.insert(position, tokens[position])
+        return True
     
-    def _unbalanced_parenthesis(self, s: str) -> str:
+    def _unbalanced_parenthesis(self, tokens: List[str], index: Dict[str, List[int]]) -> bool:
         """Desbalancea paréntesis"""
-        if ')' in s:
-            return s.replace(')', '', 1)
-        elif '(' in s:
-            return s.replace('(', '', 1)
-        return '( ' + s
+        positions = index['open'] + index['close']
+        if positions:
+            del tokens[self.rng.choice(positions)]
+            return True
+        open_brackets = self.grammar.compiled.open_brackets
+        if open_brackets:
+            tokens.insert(0, self.rng.choice(open_brackets))
+            return True
+        return False
+    
+    def _operator_at_start(self, tokens: List[str], index: Dict[str, List[int]]) -> bool:
+        """Agrega un operador al inicio"""
+        operators = self.grammar.compiled.operators
+        if not operators:
+            return False
+        tokens.insert(0, self.rng.choice(operators))
+        return True
+    
+    def _operator_at_end(self, tokens: List[str], index: Dict[str, List[int]]) -> bool:
+        """Agrega un operador al final"""
+        operators = self.grammar.compiled.operators
+        if not operators:
+            return False
+        tokens.append(self.rng.choice(operators))
+        return True
     
-    def _remove_operand(self, s: str) -> str:
+    def _remove_operand(self, tokens: List[str], index: Dict[str, List[int]]) -> bool:
         """Elimina un operando"""
-        tokens = s.split()
-        if len(tokens) > 2:
-            # Buscar un token que no sea operador
-            for i, token in enumerate(tokens):
-                if token not in ['+', '-', '*', '/', '%', '(', ')']:
-                    tokens.pop(i)
-                    return ' '.join(tokens)
-        return s
+        if len(tokens) <= 2 or not index['operand']:
+            return False
+        del tokens[self.rng.choice(index['operand'])]
+        return True
     
     def generate_extreme(self, symbol: str, extreme_type: str, max_depth: int, max_length: int) -> str:
         """Genera casos extremos"""
+        return ' '.join(self._extreme_tokens(symbol, extreme_type, max_depth, max_length))
+    
+    def _extreme_tokens(self, symbol: str, extreme_type: str, max_depth: int,
+                        max_length: int, derivation: Derivation = None) -> List[str]:
+        """Tokens de un caso extremo (ver ``generate_extreme``)
+        
+        Los casos extremos buscan formas concretas y no usan el pool de
+        subárboles.
+        """
         if extreme_type == 'max_depth':
-            return self.generate_valid(symbol, 0, max_depth)
+            return self._valid_tokens(symbol, 0, max_depth, derivation=derivation, pooled=False)
         elif extreme_type == 'min_depth':
-            return self.generate_valid(symbol, 0, 1)
+            return self._valid_tokens(symbol, 0, 1, derivation=derivation, pooled=False)
         elif extreme_type == 'long_expression':
-            # Intentar generar expresión larga
-            attempts = 0
-            while attempts < 10:
-                expr = self.generate_valid(symbol, 0, max_depth)
-                if len(expr) >= max_length * 0.7:
-                    return expr
-                attempts += 1
-            return expr
+            # Longitud elegida al azar entre las alcanzables del 70% al 100%
+            # de max_length, y cadena uniforme de esa longitud (sin reintentos)
+            sampler = self._chars_sampler()
+            if sampler is None:
+                self.counters['long_expression_fallbacks'] += 1
+                return self._valid_tokens(symbol, 0, max_depth, derivation=derivation,
+                                          pooled=False)
+            sym_id = self.grammar.compiled.symbol_ids[symbol]
+            lengths = sampler.reachable_lengths(sym_id, math.ceil(max_length * 0.7), max_length)
+            if lengths:
+                return sampler.sample(sym_id, self.rng.choice(lengths), self.rng, derivation)
+            self.counters['long_expression_fallbacks'] += 1
+            return self._extreme_tokens(symbol, 'exact_length', max_depth, max_length, derivation)
+        elif extreme_type == 'exact_length':
+            # Cadena uniforme con la mayor longitud alcanzable <= max_length
+            sampler = self._chars_sampler()
+            sym_id = self.grammar.compiled.symbol_ids[symbol]
+            lengths = sampler.reachable_lengths(sym_id, 0, max_length) if sampler else []
+            if lengths:
+                return sampler.sample(sym_id, lengths[-1], self.rng, derivation)
+            self.counters['exact_length_fallbacks'] += 1
+            return self._valid_tokens(symbol, 0, max_depth, derivation=derivation, pooled=False)
         elif extreme_type == 'nested_parenthesis':
             # Expresión con muchos paréntesis anidados
-            return self.generate_valid(symbol, 0, max_depth)
+            return self._valid_tokens(symbol, 0, max_depth, derivation=derivation, pooled=False)
         else:
-            return self.generate_valid(symbol, 0, max_depth)
+            return self._valid_tokens(symbol, 0, max_depth, derivation=derivation, pooled=False)
+    
+    def _chars_sampler(self) -> 'LengthSampler':
+        """Muestreador por caracteres, o None si la gramática no admite uno
+        
+        Con ciclos de producciones unitarias o anulables hay infinitas
+        derivaciones de cada longitud y ``LengthSampler`` no se puede
+        construir; los casos extremos por longitud usan entonces la
+        derivación aleatoria (contadores ``*_fallbacks``).
+        """
+        compiled = self.grammar.compiled
+        if self._sampler_error is compiled:
+            return None
+        try:
+            return self.grammar.length_sampler('chars')
+        except ValueError:
+            self._sampler_error = compiled
+            return None
+    
+    def generate_exact_length(self, symbol: str, length: int) -> str:
+        """Genera una cadena válida con exactamente ``length`` tokens
+        
+        Muestreo uniforme sobre las derivaciones de esa longitud (ver
+        ``LengthSampler``); lanza ValueError si la longitud no es alcanzable.
+        """
+        return ' '.join(self._exact_length_tokens(symbol, length))
+    
+    def _exact_length_tokens(self, symbol: str, length: int,
+                             derivation: Derivation = None) -> List[str]:
+        compiled = self.grammar.compiled
+        sampler = self.grammar.length_sampler('tokens')
+        return sampler.sample(compiled.symbol_ids[symbol], length, self.rng, derivation)
+    
+    def enumerate_sentences(self, max_tokens: int, symbol: str = None):
+        """Genera todas las oraciones distintas de hasta ``max_tokens`` tokens
+        
+        Las oraciones salen por cantidad de tokens y, dentro de cada
+        longitud, en orden alfabético. Es perezoso: las tablas de cada
+        longitud (ver SentenceEnumerator) se construyen recién cuando se
+        piden y quedan en la gramática para las siguientes llamadas.
+        """
+        compiled = self.grammar.compiled
+        sym_id = compiled.symbol_ids.get(symbol or self.grammar.get_start_symbol())
+        if sym_id is None or compiled.is_terminal[sym_id]:
+            raise ValueError("Símbolo no definido en la gramática")
+        enumerator = self.grammar.sentence_enumerator()
+        for length in range(max_tokens + 1):
+            yield from enumerator.sentences_of(sym_id, length)
+    
+    def enumerate_cases(self, max_tokens: int, invalid: bool = False,
+                        mutations_per_case: int = 1, seed: int = None):
+        """Casos válidos con todas las oraciones de hasta ``max_tokens`` tokens
+        
+        Con ``invalid`` cada oración va seguida de un caso inválido obtenido
+        con los mismos mutadores que ``generate_all``; la mutación de la
+        oración ``i`` usa ``case_seed(seed, i)``, por lo que es reproducible.
+        """
+        if seed is None:
+            seed = self.seed if self.seed is not None else random.SystemRandom().getrandbits(64)
+        case_id = 0
+        for index, sentence in enumerate(self.enumerate_sentences(max_tokens)):
+            case_id += 1
+            yield {
+                'id': case_id,
+                'type': 'válida',
+                'expression': sentence,
+                'length': len(sentence)
+            }
+            if invalid:
+                self.rng.seed(self.case_seed(seed, index))
+                tokens, mutation_names, compact = self._mutate_tokens(sentence.split(),
+                                                                      mutations_per_case)
+                invalid_expr = self._render(tokens, compact)
+                case_id += 1
+                yield {
+                    'id': case_id,
+                    'type': 'inválida',
+                    'expression': invalid_expr,
+                    'mutation': ','.join(mutation_names),
+                    'length': len(invalid_expr)
+                }
     
     def generate_all(self, valid_count: int, invalid_count: int, 
-                    extreme_count: int, max_depth: int, max_length: int):
-        """Genera todos los casos de prueba"""
-        self.start_time = time.time()
-        self.test_cases = []
+                    extreme_count: int, max_depth: int, max_length: int,
+                    target_length: int = None, workers: int = 1, seed: int = None,
+                    verify: bool = False, mutations_per_case: int = 1,
+                    unique: str = None, unique_capacity: int = 1000000,
+                    coverage: str = None, coverage_target: float = None,
+                    profile: str = None, trees: bool = False, pool: int = None,
+                    pool_refresh: float = 0.1, pool_eviction: float = 0.5,
+                    pool_bucket: int = 1):
+        """Genera todos los casos de prueba
+        
+        Si se indica ``target_length``, los casos válidos se generan con
+        exactamente esa cantidad de tokens en lugar de por profundidad.
+        
+        Con ``verify`` cada caso se comprueba con el reconocedor de Earley:
+        los que no coinciden con su tipo (por ejemplo una mutación que deja
+        la cadena válida) se regeneran, y si tras ``MAX_ATTEMPTS``
+        intentos siguen sin coincidir se re-etiquetan.
+        
+        ``mutations_per_case`` apila varias mutaciones en cada caso inválido;
+        el campo ``mutation`` las lista separadas por comas.
+        
+        ``unique`` activa la eliminación de duplicados: ``'exact'`` usa un
+        conjunto de hashes de 64 bits y ``'bloom'`` un filtro de Bloom de
+        memoria acotada dimensionado para ``unique_capacity`` expresiones.
+        Un duplicado se regenera; si tras ``MAX_ATTEMPTS`` intentos sigue
+        repetido, el caso se descarta (su ID queda sin usar). Con
+        ``workers > 1`` cada fragmento regenera sus duplicados con su propio
+        filtro y el proceso principal regenera los repetidos entre
+        fragmentos; con ``'exact'`` el resultado es el de un solo proceso.
+        
+        ``coverage`` guía las derivaciones de los casos válidos hacia las
+        producciones (``'productions'``) o los pares padre→hijo de
+        producciones (``'pairs'``) aún no cubiertos. Con ``coverage_target``
+        (fracción entre 0 y 1) la generación de válidos se detiene al
+        alcanzar esa cobertura, de modo que ``valid_count`` pasa a ser un
+        máximo. Los casos válidos se generan siempre en el proceso
+        principal, que lleva la cobertura global.
+        
+        Los casos válidos y extremos guardan la profundidad real de su
+        derivación (``depth``) y la cantidad de expansiones
+        (``expansions``). Con ``trees`` incluyen además el árbol de
+        derivación codificado en arreglos (ver ``Derivation``); la lista de
+        producciones por ID queda en ``metrics['productions']``.
+        
+        ``profile`` activa la captura opcional de perfiles del proceso
+        principal: ``'cpu'`` (cProfile), ``'memory'`` (tracemalloc) o
+        ``'all'``. El resultado queda en ``metrics['profile']``.
+        
+        ``pool`` activa la reutilización de subárboles (ver SubtreePool) en
+        las derivaciones de los casos válidos e inválidos: guarda hasta
+        ``pool`` subárboles por no-terminal y profundidad restante
+        (agrupada de a ``pool_bucket``), los deriva de nuevo con
+        probabilidad ``pool_refresh`` y reemplaza uno guardado con
+        probabilidad ``pool_eviction``. La reutilización y la diversidad
+        quedan en ``metrics['pool']``. Cada caso depende del estado del
+        pool, por lo que no se puede regenerar por separado y el resultado
+        cambia con la cantidad de procesos (cada uno tiene su pool); no es
+        compatible con ``trees``.
+        
+        Cada caso se genera con el generador aleatorio de la instancia
+        reiniciado con ``(seed, índice del caso)``. Sin ``seed`` se usa la
+        del constructor o, si no hay, una al azar; la semilla queda en
+        ``metrics['seed']``. Así el resultado es reproducible, no depende de
+        la cantidad de procesos y cualquier caso se puede regenerar por
+        separado con ``regenerate_case``.
+        
+        Con ``workers > 1`` los casos se dividen en fragmentos que se generan
+        en un ProcessPoolExecutor; los IDs son estables.
+        """
+        self.test_cases = CaseStore(self.iter_cases(valid_count, invalid_count, extreme_count,
+                                                    max_depth, max_length, target_length,
+                                                    workers, seed, verify, mutations_per_case,
+                                                    unique, unique_capacity,
+                                                    coverage, coverage_target, profile, trees,
+                                                    pool, pool_refresh, pool_eviction,
+                                                    pool_bucket))
+        self.metrics = self.live_metrics.result(self.end_time - self.start_time)
+    
+    def iter_cases(self, valid_count: int, invalid_count: int,
+                   extreme_count: int, max_depth: int, max_length: int,
+                   target_length: int = None, workers: int = 1, seed: int = None,
+                   verify: bool = False, mutations_per_case: int = 1,
+                   unique: str = None, unique_capacity: int = 1000000,
+                   coverage: str = None, coverage_target: float = None,
+                   profile: str = None, trees: bool = False, pool: int = None,
+                   pool_refresh: float = 0.1, pool_eviction: float = 0.5,
+                   pool_bucket: int = 1):
+        """Genera los casos de prueba uno a uno (mismos parámetros que generate_all)
+        
+        No guarda los casos en ``self.test_cases``: la memoria usada no
+        depende de la cantidad de casos. Las métricas se actualizan caso a
+        caso en ``self.live_metrics`` y pueden consultarse durante la
+        generación.
         
+        La sección ``instrumentation`` de las métricas trae los segundos de
+        cada fase y los contadores (expansiones, reintentos, mutaciones no
+        aplicables, etc.). Los hooks registrados con ``add_hook`` reciben
+        los eventos ``'start'``, ``'case'`` y ``'end'``.
+        """
+        if profile not in (None, 'cpu', 'memory', 'all'):
+            raise ValueError(f"Perfil desconocido: {profile}")
+        if pool and trees:
+            raise ValueError("El pool de subárboles no es compatible con trees")
         start_symbol = self.grammar.get_start_symbol()
         if not start_symbol:
             raise ValueError("Gramática vacía o inválida")
+        if start_symbol not in self.grammar.compiled.symbol_ids:
+            # El análisis podó el símbolo inicial: no deriva ninguna cadena
+            raise ValueError("; ".join(self.grammar.analysis.warnings()))
         
-        # Generar casos válidos
-        for i in range(valid_count):
-            expr = self.generate_valid(start_symbol, 0, max_depth)
-            self.test_cases.append({
-                'id': len(self.test_cases) + 1,
-                'type': 'válida',
-                'expression': expr,
-                'depth': random.randint(1, max_depth),
-                'length': len(expr)
-            })
-        
-        # Generar casos inválidos
-        for i in range(invalid_count):
-            valid_expr = self.generate_valid(start_symbol, 0, max_depth)
-            invalid_expr, mutation_type = self.generate_invalid(valid_expr)
-            self.test_cases.append({
-                'id': len(self.test_cases) + 1,
-                'type': 'inválida',
-                'expression': invalid_expr,
-                'mutation': mutation_type,
-                'length': len(invalid_expr)
-            })
-        
-        # Generar casos extremos
-        extreme_types = ['max_depth', 'min_depth', 'long_expression', 'nested_parenthesis']
-        for i in range(extreme_count):
-            extreme_type = extreme_types[i % len(extreme_types)]
-            expr = self.generate_extreme(start_symbol, extreme_type, max_depth, max_length)
-            self.test_cases.append({
-                'id': len(self.test_cases) + 1,
-                'type': 'extrema',
-                'expression': expr,
-                'extreme_type': extreme_type,
-                'length': len(expr)
-            })
-        
-        self.end_time = time.time()
-        self.calculate_metrics()
+        if seed is None:
+            seed = self.seed if self.seed is not None else random.SystemRandom().getrandbits(64)
+        
+        params = {
+            'start_symbol': start_symbol,
+            'max_depth': max_depth,
+            'max_length': max_length,
+            'target_length': target_length,
+            'verify': verify,
+            'mutations_per_case': mutations_per_case,
+            'coverage': bool(coverage),
+            'seed': seed,
+            'trees': trees,
+            'pool': (pool, pool_refresh, pool_eviction, pool_bucket) if pool else None,
+            'unique': (unique, unique_capacity) if unique else None,
+        }
+        self.parameters = {
+            'seed': seed,
+            'valid_count': valid_count,
+            'invalid_count': invalid_count,
+            'extreme_count': extreme_count,
+            'max_depth': max_depth,
+            'max_length': max_length,
+            'target_length': target_length,
+            'verify': verify,
+            'mutations_per_case': mutations_per_case,
+            'unique': unique,
+            'coverage': coverage,
+            'coverage_target': coverage_target,
+            'trees': trees,
+            'pool': pool,
+            'pool_refresh': pool_refresh,
+            'pool_eviction': pool_eviction,
+            'pool_bucket': pool_bucket,
+        }
+        
+        self.counters = Counter()
+        self.timers = Counter()
+        self.profile_report = {}
+        self.live_metrics = MetricsAccumulator(self.grammar.compiled.operators)
+        grammar_report = self.grammar.analysis.report()
+        self.live_metrics.sections['grammar'] = lambda: grammar_report
+        self.live_metrics.sections['seed'] = lambda: seed
+        self.live_metrics.sections['parameters'] = lambda: self.parameters
+        self.live_metrics.sections['instrumentation'] = self._instrumentation_metrics
+        if profile:
+            self.live_metrics.sections['profile'] = lambda: self.profile_report
+        if trees:
+            compiled = self.grammar.compiled
+            productions = [compiled.production_text(p) for p in range(compiled.num_productions)]
+            self.live_metrics.sections['productions'] = lambda: productions
+        if verify:
+            self.live_metrics.sections['verification'] = self._verification_metrics
+        self.deduplicator = None
+        if unique:
+            self.deduplicator = make_deduplicator(unique, unique_capacity)
+            self.live_metrics.sections['dedup'] = self._dedup_metrics
+        self.coverage = None
+        if coverage:
+            self.coverage = CoverageTracker(self.grammar.compiled, start_symbol,
+                                            coverage, coverage_target)
+            self.live_metrics.sections['coverage'] = self.coverage.stats
+        self.pool = None
+        if pool:
+            self.pool = SubtreePool(pool, pool_refresh, pool_eviction, pool_bucket)
+            # Diversidad de los casos que usan el pool (válidos e inválidos)
+            self._pool_cases = ExactDeduplicator()
+            # Último resumen del pool de cada proceso del ProcessPoolExecutor
+            self._worker_pools = {}
+            self.live_metrics.sections['pool'] = self._pool_metrics
+        self._live_source = self._iter_cases(params, valid_count, invalid_count,
+                                             extreme_count, workers, seed, profile)
+        return self._live_source
     
-    def calculate_metrics(self):
-        """Calcula métricas del proceso"""
-        total_cases = len(self.test_cases)
-        valid_cases = len([c for c in self.test_cases if c['type'] == 'válida'])
-        invalid_cases = len([c for c in self.test_cases if c['type'] == 'inválida'])
-        extreme_cases = len([c for c in self.test_cases if c['type'] == 'extrema'])
+    def add_hook(self, hook: Callable[[str, Dict], None]):
+        """Registra una función ``hook(evento, datos)``
         
-        avg_length = sum(c['length'] for c in self.test_cases) / total_cases if total_cases > 0 else 0
+        Eventos: ``'start'`` (parámetros y cantidades), ``'case'`` (cada
+        caso entregado) y ``'end'`` (contadores y tiempos por fase).
+        """
+        self.hooks.append(hook)
+    
+    def _emit(self, event: str, data: Dict):
+        for hook in self.hooks:
+            hook(event, data)
+    
+    def _iter_cases(self, params: Dict, valid_count: int, invalid_count: int,
+                    extreme_count: int, workers: int, seed: int, profile: str = None):
+        self.start_time = time.time()
+        self.end_time = None
+        add_metrics = self.live_metrics.add
+        timers = self.timers
+        perf_counter = time.perf_counter
+        hooks = self.hooks
+        if hooks:
+            self._emit('start', dict(params, valid_count=valid_count, invalid_count=invalid_count,
+                                     extreme_count=extreme_count, workers=workers, seed=seed))
+        profiler = self._start_profile(profile)
         
-        # Contar operadores
-        operators = {'+': 0, '-': 0, '*': 0, '/': 0, '%': 0}
-        max_depth = 0
+        plan = [
+            ('valid', 0, valid_count),
+            ('invalid', valid_count, invalid_count),
+            ('extreme', valid_count + invalid_count, extreme_count),
+        ]
+        
+        if workers <= 1:
+            source = chain.from_iterable(self._iter_shard(kind, offset, 0, count, params)
+                                         for kind, offset, count in plan)
+        else:
+            source = self._iter_sharded(plan, params, workers)
+        
+        pooled = self._pool_cases if self.pool is not None else None
+        
+        # Si el consumidor corta la generación (close()), el perfil y el
+        # evento 'end' se cierran igual con lo generado hasta ese momento
+        try:
+            for case, tokens in source:
+                if pooled is not None and 'extreme_type' not in case:
+                    self.counters['pool_cases'] += 1
+                    pooled.add(case['expression'])
+                started = perf_counter()
+                add_metrics(case, tokens)
+                timers['metrics'] += perf_counter() - started
+                if hooks:
+                    self._emit('case', {'case': case})
+                yield case
+        finally:
+            self._stop_profile(profile, profiler)
+            self.end_time = time.time()
+            if hooks:
+                self._emit('end', self._instrumentation_metrics())
+    
+    # Funciones incluidas en el perfil de CPU y sitios en el de memoria
+    PROFILE_TOP = 20
+    
+    def _start_profile(self, profile: str):
+        """Inicia cProfile y/o tracemalloc según ``profile``"""
+        profiler = None
+        if profile in ('cpu', 'all'):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        if profile in ('memory', 'all'):
+            self._tracing = not tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.start()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        return profiler
+    
+    def _stop_profile(self, profile: str, profiler):
+        """Detiene los perfiles y guarda un resumen numérico en ``profile_report``"""
+        if profiler is not None:
+            profiler.disable()
+            profiler.create_stats()
+            functions = []
+            for (filename, line, name), (_, calls, total, cumulative, _) in profiler.stats.items():
+                functions.append({
+                    'function': f"{filename}:{line}({name})",
+                    'calls': calls,
+                    'total_time': total,
+                    'cumulative_time': cumulative,
+                })
+            functions.sort(key=lambda f: f['cumulative_time'], reverse=True)
+            self.profile_report['cpu'] = functions[:self.PROFILE_TOP]
+        if profile in ('memory', 'all'):
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._tracing:
+                tracemalloc.stop()
+            self.profile_report['memory'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [{'location': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count}
+                        for stat in snapshot.statistics('lineno')[:self.PROFILE_TOP]],
+            }
+    
+    # Casos por fragmento como máximo, para acotar la memoria en paralelo
+    SHARD_SIZE = 10000
+    
+    def _iter_sharded(self, plan: List[Tuple[str, int, int]], params: Dict, workers: int):
+        """Genera los casos por fragmentos en un pool de procesos"""
+        shards = []
+        for kind, offset, count in plan:
+            size = min(-(-count // workers), self.SHARD_SIZE)
+            for start in range(0, count, size or 1):
+                shards.append((kind, offset, start, min(size, count - start)))
+        
+        # La cobertura es global: los válidos (que van primero) se generan aquí
+        if params['coverage']:
+            local = [shard for shard in shards if shard[0] == 'valid']
+            shards = [shard for shard in shards if shard[0] != 'valid']
+            for shard in local:
+                yield from self._iter_shard(*shard, params)
+        
+        # Compilar (y precalcular las tablas de conteo) antes de enviar la
+        # gramática, para que cada proceso la reciba lista una sola vez
+        self.grammar.compiled
+        if any(kind == 'extreme' and count for kind, _, count in plan):
+            sampler = self._chars_sampler()
+            if sampler is not None:
+                sampler.ensure(params['max_length'] + 1)
+        if params['target_length'] is not None:
+            self.grammar.length_sampler('tokens').ensure(params['target_length'])
+        if params['verify']:
+            self.grammar.recognizer
+        
+        # Se mantienen a lo sumo 2 fragmentos por proceso en vuelo y se
+        # entregan en orden
+        dedup = self.deduplicator
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.grammar,)) as executor:
+            shard_iter = iter(shards)
+            pending = deque((shard, executor.submit(_run_shard, shard, params))
+                            for shard in islice(shard_iter, 2 * workers))
+            while pending:
+                (kind, offset, _, _), future = pending.popleft()
+                shard_cases, shard_counters, shard_timers, shard_pool = future.result()
+                if shard_pool is not None:
+                    pid, summary = shard_pool
+                    self._worker_pools[pid] = summary
+                self.counters.update(shard_counters)
+                self.timers.update(shard_timers)
+                shard = next(shard_iter, None)
+                if shard is not None:
+                    pending.append((shard, executor.submit(_run_shard, shard, params)))
+                for case in shard_cases:
+                    # Cada fragmento se deduplicó con su propio filtro, que no
+                    # ve los casos de los demás. Un repetido de otro fragmento
+                    # se regenera aquí con el filtro global, desde el primer
+                    # intento: como todo lo que vio el fragmento ya está en el
+                    # filtro global, el resultado es el de un solo proceso.
+                    if dedup is not None and not dedup.add(case['expression']):
+                        yield from self._iter_shard(kind, offset, case['id'] - offset - 1, 1,
+                                                    params)
+                        continue
+                    yield case, None
+    
+    def _iter_shard(self, kind: str, offset: int, start: int, count: int, params: Dict):
+        """Genera ``count`` casos de un tipo a partir del índice ``start``
+        
+        ``offset`` es la cantidad de casos de los tipos anteriores; los IDs
+        quedan como ``offset + índice + 1``, igual que en la generación
+        secuencial. Produce pares ``(caso, tokens)`` con los tokens de la
+        expresión. Antes de cada caso se reinicia ``self.rng`` con
+        ``case_seed(seed, índice global)``.
+        """
+        make_case = {
+            'valid': self._make_valid,
+            'invalid': self._make_invalid,
+            'extreme': self._make_extreme,
+        }[kind]
+        verify = params['verify']
+        dedup = self.deduplicator
+        coverage = self.coverage if kind == 'valid' else None
+        counters = self.counters
+        timers = self.timers
+        perf_counter = time.perf_counter
+        attempts_key = kind + '_attempts'
+        seed = params['seed']
+        reseed = self.rng.seed
+        
+        for i in range(start, start + count):
+            if coverage is not None and coverage.reached():
+                return
+            case_id = offset + i + 1
+            reseed(self.case_seed(seed, case_id - 1))
+            misclassified = False
+            for _ in range(self.MAX_ATTEMPTS):
+                started = perf_counter()
+                case, tokens = make_case(case_id, i, params)
+                timers[kind] += perf_counter() - started
+                counters[attempts_key] += 1
+                misclassified = verify and not self._verify(tokens, case['type'] != 'inválida')
+                if misclassified:
+                    continue
+                if dedup is not None:
+                    started = perf_counter()
+                    duplicate = not dedup.add(case['expression'])
+                    timers['dedup'] += perf_counter() - started
+                    if duplicate:
+                        counters['dedup_rejected'] += 1
+                        continue
+                break
+            else:
+                if not misclassified:
+                    # Solo se obtuvieron duplicados: el caso se descarta
+                    self.counters['dedup_dropped'] += 1
+                    continue
+                self._relabel(case)
+                if dedup is not None:
+                    dedup.add(case['expression'])
+            if coverage is not None:
+                coverage.end_case()
+            yield case, tokens
+    
+    def _make_valid(self, case_id: int, index: int, params: Dict) -> Tuple[Dict, List[str]]:
+        """Genera un caso válido con su profundidad real y sus expansiones"""
+        derivation = Derivation(params['trees'])
+        if params['target_length'] is not None:
+            tokens = self._exact_length_tokens(params['start_symbol'], params['target_length'],
+                                               derivation)
+        else:
+            tokens = self._valid_tokens(params['start_symbol'], 0, params['max_depth'],
+                                        self.coverage, derivation)
+        expr = ' '.join(tokens)
+        case = {
+            'id': case_id,
+            'type': 'válida',
+            'expression': expr,
+            'depth': derivation.depth,
+            'expansions': derivation.expansions,
+            'length': len(expr)
+        }
+        if params['trees']:
+            case['tree'] = derivation.tree()
+        return case, tokens
+    
+    def _make_invalid(self, case_id: int, index: int, params: Dict) -> Tuple[Dict, List[str]]:
+        """Genera un caso inválido mutando una derivación válida"""
+        valid_tokens = self._valid_tokens(params['start_symbol'], 0, params['max_depth'])
+        tokens, mutation_names, compact = self._mutate_tokens(
+            valid_tokens, params['mutations_per_case'])
+        invalid_expr = self._render(tokens, compact)
+        if compact:
+            tokens = invalid_expr.split()
+        return {
+            'id': case_id,
+            'type': 'inválida',
+            'expression': invalid_expr,
+            'mutation': ','.join(mutation_names),
+            'length': len(invalid_expr)
+        }, tokens
+    
+    def _make_extreme(self, case_id: int, index: int, params: Dict) -> Tuple[Dict, List[str]]:
+        """Genera un caso extremo; el tipo rota según el índice del caso"""
+        extreme_type = self.EXTREME_TYPES[index % len(self.EXTREME_TYPES)]
+        derivation = Derivation(params['trees'])
+        tokens = self._extreme_tokens(params['start_symbol'], extreme_type,
+                                      params['max_depth'], params['max_length'], derivation)
+        expr = ' '.join(tokens)
+        case = {
+            'id': case_id,
+            'type': 'extrema',
+            'expression': expr,
+            'extreme_type': extreme_type,
+            'depth': derivation.depth,
+            'expansions': derivation.expansions,
+            'length': len(expr)
+        }
+        if params['trees']:
+            case['tree'] = derivation.tree()
+        return case, tokens
+    
+    # Intentos de generación por caso al verificar o eliminar duplicados
+    MAX_ATTEMPTS = 10
+    
+    @staticmethod
+    def case_seed(seed: int, index: int) -> int:
+        """Semilla del caso ``index`` (base 0) de una generación con ``seed``"""
+        return (seed << 64) + index
+    
+    def regenerate_case(self, case_id: int, seed: int = None, parameters: Dict = None) -> Dict:
+        """Regenera un único caso a partir de la semilla y su ID, en O(1)
+        
+        ``parameters`` son los de la generación original (por defecto los de
+        la última, ``self.parameters``; también se pueden tomar de
+        ``metrics['parameters']`` de un archivo exportado) y ``seed`` la de
+        ``metrics['seed']``. La regeneración es exacta salvo para casos que
+        dependen de los anteriores: los regenerados por ser duplicados
+        (``unique``), los válidos guiados por cobertura y los generados con
+        el pool de subárboles (se regeneran sin pool).
+        """
+        parameters = dict(parameters or self.parameters)
+        if seed is None:
+            seed = parameters['seed']
+        valid_count = parameters['valid_count']
+        invalid_count = parameters['invalid_count']
+        index = case_id - 1
+        if index < 0 or index >= valid_count + invalid_count + parameters['extreme_count']:
+            raise ValueError(f"ID de caso fuera de rango: {case_id}")
+        
+        if index < valid_count:
+            kind, kind_index = self._make_valid, index
+        elif index < valid_count + invalid_count:
+            kind, kind_index = self._make_invalid, index - valid_count
+        else:
+            kind, kind_index = self._make_extreme, index - valid_count - invalid_count
+        params = dict(parameters, start_symbol=self.grammar.get_start_symbol(),
+                      seed=seed, coverage=False, trees=parameters.get('trees', False))
+        
+        saved_coverage, saved_pool = self.coverage, self.pool
+        self.coverage = None
+        self.pool = None
+        try:
+            self.rng.seed(self.case_seed(seed, index))
+            for _ in range(self.MAX_ATTEMPTS):
+                case, tokens = kind(case_id, kind_index, params)
+                if not (params['verify'] and not self._verify(tokens, case['type'] != 'inválida')):
+                    break
+            else:
+                self._relabel(case)
+        finally:
+            self.coverage = saved_coverage
+            self.pool = saved_pool
+        return case
+    
+    def _verify(self, tokens: List[str], expected: bool) -> bool:
+        """Comprueba con el reconocedor que el caso tenga la etiqueta esperada"""
+        self.counters['verify_checked'] += 1
+        started = time.perf_counter()
+        recognized = self.grammar.recognizer.recognizes(tokens)
+        self.timers['verify'] += time.perf_counter() - started
+        if recognized == expected:
+            return True
+        self.counters['verify_regenerated'] += 1
+        return False
+    
+    def _relabel(self, case: Dict):
+        """Corrige la etiqueta de un caso que no se pudo regenerar correctamente"""
+        self.counters['verify_relabeled'] += 1
+        case['type'] = 'válida' if case['type'] == 'inválida' else 'inválida'
+    
+    def _verification_metrics(self) -> Dict:
+        return {
+            'checked': self.counters['verify_checked'],
+            'regenerated': self.counters['verify_regenerated'],
+            'relabeled': self.counters['verify_relabeled'],
+        }
+    
+    def _instrumentation_metrics(self) -> Dict:
+        """Tiempos por fase (en segundos) y contadores de la generación"""
+        end_time = self.end_time or time.time()
+        return {
+            'execution_seconds': end_time - self.start_time if self.start_time else 0.0,
+            'phases': dict(self.timers),
+            'counters': dict(self.counters),
+        }
+    
+    def _pool_metrics(self) -> Dict:
+        cases = self.counters['pool_cases']
+        distinct = len(self._pool_cases.seen)
+        pools = self.pool.stats(self.counters, list(self._worker_pools.values()))
+        return dict(pools, cases=cases, distinct_cases=distinct,
+                    distinct_case_ratio=distinct / cases if cases else 0.0)
+    
+    def _dedup_metrics(self) -> Dict:
+        return dict(self.deduplicator.stats(),
+                    rejected=self.counters['dedup_rejected'],
+                    dropped=self.counters['dedup_dropped'])
+    
+    def verify_cases(self, cases=None) -> List[Dict]:
+        """Verifica en lote la etiqueta de los casos con el reconocedor
+        
+        Devuelve los casos mal clasificados: inválidos que pertenecen al
+        lenguaje y válidos o extremos que no pertenecen.
+        """
+        if cases is None:
+            cases = self.test_cases
+        recognizes = self.grammar.recognizer.recognizes
+        return [case for case in cases
+                if recognizes(case['expression'].split()) != (case['type'] != 'inválida')]
+    
+    def calculate_metrics(self):
+        """Calcula métricas del proceso
         
+        Recalcula los campos que salen de ``self.test_cases`` y conserva las
+        secciones de la última generación (semilla, parámetros, gramática,
+        instrumentación, duplicados, verificación...).
+        """
+        metrics = MetricsAccumulator(self.grammar.compiled.operators)
+        metrics.sections = dict(self.live_metrics.sections)
         for case in self.test_cases:
-            expr = case['expression']
-            for op in operators:
-                operators[op] += expr.count(op)
-            if 'depth' in case:
-                max_depth = max(max_depth, case['depth'])
+            metrics.add(case)
         
         execution_time = self.end_time - self.start_time if self.start_time and self.end_time else 0
+        self.metrics = metrics.result(execution_time)
+    
+    def export_json(self, filename: str):
+        """Exporta resultados a JSON (``'-'`` escribe en la salida estándar)
+        
+        Los casos se escriben de a uno, sin armar la lista completa de
+        diccionarios; el archivo queda igual que con ``json.dump(indent=2)``.
+        """
+        if filename == '-':
+            write_json(sys.stdout, self.test_cases, self.metrics)
+            sys.stdout.write('\n')
+            return
+        
+        with open(filename, 'w', encoding='utf-8') as f:
+            write_json(f, self.test_cases, self.metrics)
+    
+    def export_jsonl(self, filename: str, cases=None, compress: bool = None) -> Dict:
+        """Exporta casos en formato JSON Lines a medida que se producen
+        
+        ``cases`` puede ser cualquier iterable (por ejemplo ``iter_cases()``)
+        y se consume de a un caso, por lo que la memoria es constante; si se
+        omite se exportan ``self.test_cases``. Las métricas se escriben como
+        último registro (``{"metrics": {...}}``): si ``cases`` viene de
+        ``iter_cases()`` se reutilizan las que este ya acumula.
+        
+        Con ``compress`` (o si el nombre termina en ``.gz``) se escribe con
+        gzip; ``'-'`` escribe en la salida estándar.
+        """
+        if cases is None:
+            cases = self.test_cases
+        if compress is None:
+            compress = filename.endswith('.gz')
+        
+        if filename == '-':
+            f = sys.stdout
+        elif compress:
+            f = gzip.open(filename, 'wt', encoding='utf-8')
+        else:
+            f = open(filename, 'w', encoding='utf-8')
+        
+        started = time.time()
+        # iter_cases() ya acumula las métricas: no se cuentan dos veces
+        live = cases is self._live_source
+        metrics = self.live_metrics if live else MetricsAccumulator(self.grammar.compiled.operators)
+        try:
+            for case in cases:
+                if not live:
+                    metrics.add(case)
+                f.write(json.dumps(case, ensure_ascii=False, default=dict))
+                f.write('\n')
+            
+            self.metrics = metrics.result(time.time() - started)
+            f.write(json.dumps({'metrics': self.metrics}, ensure_ascii=False))
+            f.write('\n')
+        finally:
+            if f is not sys.stdout:
+                f.close()
+        
+        return self.metrics
+
+
+def write_json(f, cases, metrics: Dict):
+    """Escribe ``{"test_cases": [...], "metrics": {...}}`` caso a caso
+    
+    ``cases`` puede ser cualquier iterable de casos (diccionarios o vistas);
+    el texto es el mismo que produce ``json.dump(indent=2)``.
+    """
+    f.write('{\n  "test_cases": [')
+    separator = '\n    '
+    for case in cases:
+        f.write(separator)
+        f.write(json.dumps(case, indent=2, ensure_ascii=False, default=dict)
+                .replace('\n', '\n    '))
+        separator = ',\n    '
+    if separator != '\n    ':
+        f.write('\n  ')
+    f.write('],\n  "metrics": ')
+    f.write(json.dumps(metrics, indent=2, ensure_ascii=False).replace('\n', '\n  '))
+    f.write('\n}')
+
+
+class ExactDeduplicator:
+    """Conjunto exacto de hashes de 64 bits de las expresiones generadas"""
+    
+    backend = 'exact'
+    
+    def __init__(self):
+        self.seen = set()
+    
+    def add(self, expression: str) -> bool:
+        """Registra la expresión; devuelve False si ya se había visto"""
+        key = int.from_bytes(blake2b(expression.encode('utf-8'), digest_size=8).digest(), 'little')
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+    
+    def stats(self) -> Dict:
+        return {'backend': self.backend, 'unique': len(self.seen)}
+
+
+class BloomDeduplicator:
+    """Filtro de Bloom de memoria acotada para ejecuciones en streaming
+    
+    Se dimensiona para ``capacity`` expresiones con una tasa de falsos
+    positivos ``error_rate``; un falso positivo descarta una expresión nueva
+    como si fuera repetida. Los ``k`` índices se obtienen por doble hash a
+    partir de un único digest de 128 bits.
+    """
+    
+    backend = 'bloom'
+    
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+    
+    def add(self, expression: str) -> bool:
+        """Registra la expresión; devuelve False si (probablemente) ya se vio"""
+        digest = blake2b(expression.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        bits = self.bits
+        num_bits = self.num_bits
+        new = False
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % num_bits
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+    
+    def stats(self) -> Dict:
+        # Tasa de falsos positivos estimada con los elementos insertados
+        fill = 1 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        return {
+            'backend': self.backend,
+            'unique': self.count,
+            'memory_bytes': len(self.bits),
+            'estimated_false_positive_rate': fill ** self.num_hashes,
+        }
+
+
+def make_deduplicator(backend: str, capacity: int = 1000000):
+    """Crea el filtro de duplicados indicado ('exact' o 'bloom')"""
+    if backend == 'exact':
+        return ExactDeduplicator()
+    if backend == 'bloom':
+        return BloomDeduplicator(capacity)
+    raise ValueError(f"Modo de unicidad desconocido: {backend}")
+
+
+class CoverageTracker:
+    """Cobertura de producciones y de pares padre→hijo de producciones
+    
+    Un par ``(p, q)`` queda cubierto cuando la producción ``q`` expande un
+    no-terminal que aparece en el lado derecho de ``p``. Solo se cuentan las
+    producciones productivas alcanzables desde el símbolo inicial, de modo
+    que el 100 % siempre es alcanzable.
+    
+    ``mode`` indica qué cobertura guía la generación y decide el objetivo:
+    ``'productions'`` o ``'pairs'``. ``hot`` marca los no-terminales desde
+    los que todavía se puede llegar a algo sin cubrir; se recalcula de forma
+    perezosa, como mucho una vez por caso.
+    """
+    
+    MODES = ('productions', 'pairs')
+    
+    def __init__(self, compiled: CompiledGrammar, start_symbol: str,
+                 mode: str = 'productions', target: float = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de cobertura desconocido: {mode}")
+        self.compiled = compiled
+        self.mode = mode
+        self.target = target
+        inf = CompiledGrammar.UNREACHABLE
+        n = compiled.num_nonterminals
+        num_productions = compiled.num_productions
+        
+        # No-terminales (distintos) del lado derecho de cada producción productiva
+        self.prod_nonterminals = [
+            tuple(sorted({s for s in compiled.production(p) if not compiled.is_terminal[s]}))
+            if compiled.prod_height[p] != inf else ()
+            for p in range(num_productions)
+        ]
+        
+        # Producciones alcanzables desde el inicio usando solo productivas
+        self.reachable = bytearray(num_productions)
+        start = compiled.symbol_ids.get(start_symbol)
+        seen = bytearray(n)
+        stack = [start] if start is not None and start < n else []
+        for sym in stack:
+            seen[sym] = 1
+        while stack:
+            sym = stack.pop()
+            for p in compiled.productions_of(sym):
+                if compiled.prod_height[p] == inf:
+                    continue
+                self.reachable[p] = 1
+                for child in self.prod_nonterminals[p]:
+                    if not seen[child]:
+                        seen[child] = 1
+                        stack.append(child)
+        
+        self.covered = bytearray(num_productions)
+        self.covered_pairs = set()
+        self.uncovered_in_rule = array('i', [0] * n)
+        self.pending_pairs = array('i', [0] * num_productions)
+        self.total_productions = 0
+        self.total_pairs = 0
+        for p in range(num_productions):
+            if not self.reachable[p]:
+                continue
+            self.total_productions += 1
+            self.uncovered_in_rule[compiled.prod_lhs[p]] += 1
+            for child in self.prod_nonterminals[p]:
+                pairs = sum(1 for q in compiled.productions_of(child) if self.reachable[q])
+                self.pending_pairs[p] += pairs
+                self.total_pairs += pairs
+        self.covered_productions = 0
+        
+        # No-terminales que usan cada no-terminal, para propagar ``hot``
+        self.users = [set() for _ in range(n)]
+        for p in range(num_productions):
+            if self.reachable[p]:
+                for child in self.prod_nonterminals[p]:
+                    self.users[child].add(compiled.prod_lhs[p])
+        self.hot = bytearray(n)
+        self.dirty = True
+        
+        self.cases = 0
+        self.reached_at = None
+    
+    def record(self, parent: int, prod_id: int):
+        """Marca como cubierta la producción elegida (y su par con el padre)"""
+        if not self.covered[prod_id]:
+            self.covered[prod_id] = 1
+            self.covered_productions += 1
+            self.uncovered_in_rule[self.compiled.prod_lhs[prod_id]] -= 1
+            self.dirty = True
+        if parent >= 0:
+            key = parent * self.compiled.num_productions + prod_id
+            if key not in self.covered_pairs:
+                self.covered_pairs.add(key)
+                self.pending_pairs[parent] -= 1
+                self.dirty = True
+    
+    def refresh(self):
+        """Recalcula qué no-terminales llevan a algo sin cubrir"""
+        if not self.dirty:
+            return
+        compiled = self.compiled
+        pairs = self.mode == 'pairs'
+        hot = bytearray(compiled.num_nonterminals)
+        pending = []
+        for sym in range(compiled.num_nonterminals):
+            if self.uncovered_in_rule[sym] > 0 or (
+                    pairs and any(self.pending_pairs[q] for q in compiled.productions_of(sym))):
+                hot[sym] = 1
+                pending.append(sym)
+        while pending:
+            sym = pending.pop()
+            for user in self.users[sym]:
+                if not hot[user]:
+                    hot[user] = 1
+                    pending.append(user)
+        self.hot = hot
+        self.dirty = False
+    
+    def promising(self, parent: int, prod_id: int) -> bool:
+        """Indica si elegir ``prod_id`` bajo ``parent`` puede aumentar la cobertura"""
+        if not self.covered[prod_id]:
+            return True
+        if self.mode == 'pairs':
+            if parent >= 0 and parent * self.compiled.num_productions + prod_id not in self.covered_pairs:
+                return True
+            if self.pending_pairs[prod_id]:
+                return True
+        hot = self.hot
+        return any(hot[child] for child in self.prod_nonterminals[prod_id])
+    
+    def ratio(self, mode: str = None) -> float:
+        """Fracción cubierta (1.0 si no hay nada que cubrir)"""
+        if (mode or self.mode) == 'productions':
+            covered, total = self.covered_productions, self.total_productions
+        else:
+            covered, total = len(self.covered_pairs), self.total_pairs
+        return covered / total if total else 1.0
+    
+    def reached(self) -> bool:
+        """Indica si ya se alcanzó la cobertura objetivo"""
+        return self.target is not None and self.ratio() >= self.target
+    
+    def end_case(self):
+        """Cuenta un caso generado y anota cuándo se alcanzó el objetivo"""
+        self.cases += 1
+        if self.reached_at is None and self.reached():
+            self.reached_at = self.cases
+    
+    def stats(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'productions': {
+                'covered': self.covered_productions,
+                'total': self.total_productions,
+                'percentage': round(self.ratio('productions') * 100, 2),
+            },
+            'pairs': {
+                'covered': len(self.covered_pairs),
+                'total': self.total_pairs,
+                'percentage': round(self.ratio('pairs') * 100, 2),
+            },
+            'target': self.target,
+            'cases': self.cases,
+            'reached_at': self.reached_at,
+        }
+
+
+class SubtreePool:
+    """Pool acotado de subárboles derivados por (no-terminal, presupuesto)
+    
+    Para un mismo no-terminal y la misma profundidad restante los
+    subárboles salen de la misma distribución, así que una derivación
+    puede reutilizar uno ya derivado en lugar de reconstruirlo. Cada clave
+    ``(no-terminal, presupuesto // bucket)`` guarda hasta ``size``
+    subárboles (tokens, altura y expansiones). Mientras no está llena, cada
+    subárbol nuevo se agrega. Una vez llena:
+    
+    - con probabilidad ``refresh`` el subárbol se deriva de nuevo en lugar
+      de reutilizarse,
+    - con probabilidad ``eviction`` ese subárbol nuevo reemplaza a uno del
+      pool elegido al azar (si no, se usa y se descarta).
+    
+    Con ``bucket > 1`` se comparten subárboles entre presupuestos vecinos;
+    nunca se reutiliza uno más alto que el presupuesto disponible.
+    """
+    
+    def __init__(self, size: int = 64, refresh: float = 0.1, eviction: float = 0.5,
+                 bucket: int = 1):
+        if size < 1 or bucket < 1:
+            raise ValueError("El tamaño del pool y el ancho de los buckets deben ser positivos")
+        if not (0 <= refresh <= 1 and 0 <= eviction <= 1):
+            raise ValueError("refresh y eviction son probabilidades entre 0 y 1")
+        self.size = size
+        self.refresh = refresh
+        self.eviction = eviction
+        self.bucket = bucket
+        # clave -> lista de (tokens, altura, expansiones)
+        self.entries = {}
+    
+    def key(self, sym_id: int, budget: int) -> Tuple[int, int]:
+        return sym_id, budget // self.bucket
+    
+    def draw(self, key: Tuple[int, int], budget: int, rng) -> Tuple:
+        """Subárbol a reutilizar, o None si hay que derivar uno nuevo"""
+        entries = self.entries.get(key)
+        if entries is None or len(entries) < self.size or rng.random() < self.refresh:
+            return None
+        entry = entries[rng.randrange(len(entries))]
+        return entry if entry[1] <= budget else None
+    
+    def store(self, key: Tuple[int, int], entry: Tuple, rng) -> bool:
+        """Agrega un subárbol recién derivado; devuelve True si desalojó otro"""
+        entries = self.entries.setdefault(key, [])
+        if len(entries) < self.size:
+            entries.append(entry)
+            return False
+        if rng.random() < self.eviction:
+            entries[rng.randrange(len(entries))] = entry
+            return True
+        return False
+    
+    def summary(self) -> Dict:
+        """Claves, subárboles guardados y subárboles distintos de este pool"""
+        return {
+            'keys': len(self.entries),
+            'subtrees': sum(len(entries) for entries in self.entries.values()),
+            'distinct_subtrees': sum(len({entry[0] for entry in entries})
+                                     for entries in self.entries.values()),
+        }
+    
+    def stats(self, counters: Counter, summaries: List[Dict] = ()) -> Dict:
+        """Configuración, reutilización y diversidad de los subárboles guardados
         
-        self.metrics = {
+        ``summaries`` son los ``summary()`` de los pools de otros procesos;
+        claves y subárboles se suman (cada proceso tiene su propio pool).
+        """
+        totals = Counter(self.summary())
+        for summary in summaries:
+            totals.update(summary)
+        subtrees = totals['subtrees']
+        distinct = totals['distinct_subtrees']
+        reused = counters['pool_reused']
+        derived = counters['pool_derived']
+        return {
+            'size': self.size,
+            'refresh': self.refresh,
+            'eviction': self.eviction,
+            'bucket': self.bucket,
+            'processes': 1 + len(summaries),
+            'keys': totals['keys'],
+            'subtrees': subtrees,
+            'distinct_subtrees': distinct,
+            'distinct_ratio': distinct / subtrees if subtrees else 0.0,
+            'reused': reused,
+            'derived': derived,
+            'evicted': counters['pool_evicted'],
+            'reuse_ratio': reused / (reused + derived) if reused + derived else 0.0,
+        }
+
+
+class MetricsAccumulator:
+    """Acumula las métricas caso a caso, en una sola pasada
+    
+    Cada ``add`` es O(1) respecto de la cantidad de casos: conteos por tipo,
+    media y varianza de la longitud en línea (Welford), histograma de
+    longitudes, profundidad y frecuencia de operadores tomada de los tokens.
+    ``result()`` puede llamarse en cualquier momento, también durante la
+    generación.
+    """
+    
+    def __init__(self, operators: List[str] = None, bucket_width: int = 10):
+        self.started = time.time()
+        self.total_cases = 0
+        self.type_counts = {'válida': 0, 'inválida': 0, 'extrema': 0}
+        self.length_mean = 0.0
+        self.length_m2 = 0.0
+        self.min_length = None
+        self.max_length = 0
+        self.bucket_width = bucket_width
+        self.length_histogram = {}
+        self.max_depth = 0
+        self.depth_total = 0
+        self.depth_cases = 0
+        self.max_expansions = 0
+        self.expansions_total = 0
+        self.expansions_cases = 0
+        if operators is None:
+            operators = ['+', '-', '*', '/', '%']
+        self.operators = dict.fromkeys(operators, 0)
+        # Secciones adicionales del reporte: nombre -> función que devuelve un dict
+        self.sections = {}
+    
+    def add(self, case: Dict, tokens: List[str] = None):
+        """Incorpora un caso a las métricas
+        
+        ``tokens`` son los tokens con los que se construyó la expresión; si
+        se omiten se obtienen separando la expresión por espacios.
+        """
+        self.total_cases += 1
+        case_type = case['type']
+        self.type_counts[case_type] = self.type_counts.get(case_type, 0) + 1
+        
+        # Media y varianza de la longitud en línea
+        length = case['length']
+        delta = length - self.length_mean
+        self.length_mean += delta / self.total_cases
+        self.length_m2 += delta * (length - self.length_mean)
+        if self.min_length is None or length < self.min_length:
+            self.min_length = length
+        if length > self.max_length:
+            self.max_length = length
+        bucket = length // self.bucket_width
+        self.length_histogram[bucket] = self.length_histogram.get(bucket, 0) + 1
+        
+        if 'depth' in case:
+            depth = case['depth']
+            self.depth_total += depth
+            self.depth_cases += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        if 'expansions' in case:
+            expansions = case['expansions']
+            self.expansions_total += expansions
+            self.expansions_cases += 1
+            if expansions > self.max_expansions:
+                self.max_expansions = expansions
+        
+        # Contar operadores sobre los tokens
+        if tokens is None:
+            tokens = case['expression'].split()
+        operators = self.operators
+        for token, count in Counter(tokens).items():
+            if token in operators:
+                operators[token] += count
+    
+    def result(self, execution_time: float = None) -> Dict:
+        """Métricas en el formato de ``TestCaseGenerator.metrics``
+        
+        Sin ``execution_time`` se usa el tiempo transcurrido desde que se
+        creó el acumulador.
+        """
+        if execution_time is None:
+            execution_time = time.time() - self.started
+        total_cases = self.total_cases
+        
+        def percentage(count):
+            return f"{(count / total_cases * 100):.2f}%" if total_cases > 0 else "0%"
+        
+        variance = self.length_m2 / total_cases if total_cases > 0 else 0.0
+        width = self.bucket_width
+        
+        metrics = {
             'total_cases': total_cases,
             'distribution': {
-                'valid': f"{(valid_cases / total_cases * 100):.2f}%" if total_cases > 0 else "0%",
-                'invalid': f"{(invalid_cases / total_cases * 100):.2f}%" if total_cases > 0 else "0%",
-                'extreme': f"{(extreme_cases / total_cases * 100):.2f}%" if total_cases > 0 else "0%"
+                'valid': percentage(self.type_counts['válida']),
+                'invalid': percentage(self.type_counts['inválida']),
+                'extreme': percentage(self.type_counts['extrema'])
             },
-            'avg_length': f"{avg_length:.2f}",
-            'max_depth': max_depth,
-            'operators': operators,
+            'type_counts': dict(self.type_counts),
+            'avg_length': f"{self.length_mean:.2f}",
+            'length_stats': {
+                'mean': self.length_mean,
+                'variance': variance,
+                'stddev': math.sqrt(variance),
+                'min': self.min_length or 0,
+                'max': self.max_length
+            },
+            'length_histogram': {
+                f"{bucket * width}-{bucket * width + width - 1}": count
+                for bucket, count in sorted(self.length_histogram.items())
+            },
+            'max_depth': self.max_depth,
+            'avg_depth': self.depth_total / self.depth_cases if self.depth_cases else 0.0,
+            'max_expansions': self.max_expansions,
+            'avg_expansions': (self.expansions_total / self.expansions_cases
+                               if self.expansions_cases else 0.0),
+            'operators': dict(self.operators),
             'execution_time': f"{execution_time:.4f}s",
+            'execution_seconds': execution_time,
             'generated_at': datetime.now().isoformat()
         }
+        for name, section in self.sections.items():
+            metrics[name] = section()
+        return metrics
+
+
+# Generador de cada proceso del pool (se crea una vez por proceso)
+_worker_generator = None
+
+
+def _init_worker(grammar: GrammarParser):
+    """Inicializa el proceso con la gramática ya compilada"""
+    global _worker_generator
+    _worker_generator = TestCaseGenerator(grammar)
+
+
+def _run_shard(shard: Tuple, params: Dict) -> Tuple[List[Dict], Counter, Counter, Tuple]:
+    """Genera un fragmento en el proceso actual
     
-    def export_json(self, filename: str):
-        """Exporta resultados a JSON"""
-        data = {
-            'test_cases': self.test_cases,
-            'metrics': self.metrics
-        }
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    Devuelve los casos, los contadores y tiempos por fase acumulados
+    durante el fragmento y, con pool de subárboles, ``(pid, resumen)`` del
+    pool del proceso (que se conserva entre fragmentos).
+    """
+    kind, offset, start, count = shard
+    if params['pool'] and _worker_generator.pool is None:
+        # Cada proceso mantiene su propio pool entre fragmentos
+        _worker_generator.pool = SubtreePool(*params['pool'])
+    # Los duplicados dentro del fragmento se regeneran aquí; los repetidos
+    # de otros fragmentos, al unirlos en el proceso principal
+    _worker_generator.deduplicator = (make_deduplicator(*params['unique'])
+                                      if params['unique'] else None)
+    _worker_generator.counters = Counter()
+    _worker_generator.timers = Counter()
+    cases = [case for case, _ in _worker_generator._iter_shard(kind, offset, start, count, params)]
+    pool = _worker_generator.pool
+    pool_summary = (os.getpid(), pool.summary()) if pool is not None else None
+    return cases, _worker_generator.counters, _worker_generator.timers, pool_summary
+
+
+def main(argv: List[str] = None) -> int:
+    """Generación por lotes desde la línea de comandos (sin interfaz gráfica)
+    
+    Ejemplo::
+    
+        python -m generator gramatica.txt --valid 1000 --invalid 500 \\
+            --extreme 100 --seed 42 --workers 4 -o casos.jsonl.gz --stream
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m generator',
+        description="Genera casos de prueba para una gramática libre de contexto")
+    parser.add_argument('grammar', help="archivo con la gramática ('-' lee la entrada estándar)")
+    parser.add_argument('--valid', type=int, default=10, help="casos válidos (por defecto 10)")
+    parser.add_argument('--invalid', type=int, default=5, help="casos inválidos (por defecto 5)")
+    parser.add_argument('--extreme', type=int, default=5, help="casos extremos (por defecto 5)")
+    parser.add_argument('--max-depth', type=int, default=5,
+                        help="profundidad máxima de derivación (por defecto 5)")
+    parser.add_argument('--max-length', type=int, default=50,
+                        help="longitud máxima de los casos extremos (por defecto 50)")
+    parser.add_argument('--target-length', type=int,
+                        help="tokens exactos de los casos válidos")
+    parser.add_argument('--seed', type=int, help="semilla para resultados reproducibles")
+    parser.add_argument('--workers', type=int, default=1, help="procesos en paralelo")
+    parser.add_argument('--verify', action='store_true',
+                        help="comprobar cada caso con el reconocedor de Earley")
+    parser.add_argument('--mutations', type=int, default=1,
+                        help="mutaciones por caso inválido")
+    parser.add_argument('--unique', choices=['exact', 'bloom'],
+                        help="descartar expresiones repetidas")
+    parser.add_argument('--unique-capacity', type=int, default=1000000,
+                        help="capacidad del filtro de Bloom")
+    parser.add_argument('--coverage', choices=CoverageTracker.MODES,
+                        help="guiar los casos válidos por cobertura")
+    parser.add_argument('--coverage-target', type=float,
+                        help="cobertura (0 a 1) a la que se detienen los válidos")
+    parser.add_argument('--tune-length', type=float,
+                        help="ajustar los pesos a esta longitud esperada en tokens")
+    parser.add_argument('--trees', action='store_true',
+                        help="incluir el árbol de derivación de cada caso")
+    parser.add_argument('--profile', choices=['cpu', 'memory', 'all'],
+                        help="capturar perfiles en las métricas")
+    parser.add_argument('--pool', type=int, metavar='N',
+                        help="reutilizar hasta N subárboles por no-terminal y profundidad")
+    parser.add_argument('--pool-refresh', type=float, default=0.1,
+                        help="probabilidad de derivar de nuevo un subárbol del pool")
+    parser.add_argument('--pool-eviction', type=float, default=0.5,
+                        help="probabilidad de que un subárbol nuevo reemplace a uno del pool")
+    parser.add_argument('--pool-bucket', type=int, default=1,
+                        help="profundidades restantes que comparten subárboles")
+    parser.add_argument('--enumerate', type=int, metavar='N',
+                        help="en lugar de muestrear, todas las oraciones de hasta N tokens")
+    parser.add_argument('--enumerate-invalid', action='store_true',
+                        help="con --enumerate, agregar una mutación inválida de cada oración")
+    parser.add_argument('--case', type=int, metavar='ID',
+                        help="regenerar solo el caso con este ID (requiere --seed)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="archivo de salida ('-' para la salida estándar)")
+    parser.add_argument('--format', choices=['json', 'jsonl'],
+                        help="formato de salida (por defecto según la extensión; json en stdout)")
+    parser.add_argument('--stream', action='store_true',
+                        help="escribir los casos a medida que se generan (implica jsonl)")
+    parser.add_argument('--compress', action='store_true',
+                        help="comprimir la salida JSON Lines con gzip")
+    parser.add_argument('--cache-dir',
+                        help="directorio de la caché de gramáticas compiladas "
+                             "(por defecto $GLC_CACHE_DIR o ~/.cache/glc-generator)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="no usar la caché de gramáticas compiladas")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="no mostrar el resumen en stderr")
+    args = parser.parse_args(argv)
+    
+    output_format = args.format
+    if output_format is None:
+        name = args.output[:-3] if args.output.endswith('.gz') else args.output
+        output_format = 'jsonl' if args.stream or name.endswith('.jsonl') else 'json'
+    if args.stream and output_format != 'jsonl':
+        parser.error("--stream requiere el formato jsonl")
+    if args.compress and output_format != 'jsonl':
+        parser.error("--compress requiere el formato jsonl")
+    if args.case is not None and args.seed is None:
+        parser.error("--case requiere la --seed de la generación original")
+    
+    try:
+        if args.grammar == '-':
+            grammar_text = sys.stdin.read()
+        else:
+            with open(args.grammar, 'r', encoding='utf-8') as f:
+                grammar_text = f.read()
+    except OSError as e:
+        parser.error(f"no se pudo leer la gramática: {e}")
+    
+    # Arranque en caliente: la gramática ya analizada y sus tablas salen del disco
+    cache = None if args.no_cache else GrammarCache(args.cache_dir)
+    grammar = GrammarParser(grammar_text) if cache is None else cache.load(grammar_text)
+    if not grammar.rules:
+        parser.error("gramática vacía o inválida")
+    if args.tune_length is not None:
+        grammar.tune_weights(args.tune_length)
+    
+    generator = TestCaseGenerator(grammar)
+    options = dict(target_length=args.target_length, workers=args.workers, seed=args.seed,
+                   verify=args.verify, mutations_per_case=args.mutations,
+                   unique=args.unique, unique_capacity=args.unique_capacity,
+                   coverage=args.coverage, coverage_target=args.coverage_target,
+                   profile=args.profile, trees=args.trees, pool=args.pool,
+                   pool_refresh=args.pool_refresh, pool_eviction=args.pool_eviction,
+                   pool_bucket=args.pool_bucket)
+    counts = (args.valid, args.invalid, args.extreme, args.max_depth, args.max_length)
+    compress = args.compress or None
+    
+    if args.case is not None:
+        case = generator.regenerate_case(args.case, args.seed, {
+            'valid_count': args.valid, 'invalid_count': args.invalid,
+            'extreme_count': args.extreme, 'max_depth': args.max_depth,
+            'max_length': args.max_length, 'target_length': args.target_length,
+            'verify': args.verify, 'mutations_per_case': args.mutations,
+            'trees': args.trees,
+        })
+        line = json.dumps(case, ensure_ascii=False) + '\n'
+        if args.output == '-':
+            sys.stdout.write(line)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(line)
+        return 0
+    
+    if args.enumerate is not None:
+        cases = generator.enumerate_cases(args.enumerate, args.enumerate_invalid,
+                                          args.mutations, args.seed)
+        if output_format == 'jsonl':
+            metrics = generator.export_jsonl(args.output, cases, compress)
+        else:
+            generator.start_time = time.time()
+            generator.test_cases = CaseStore(cases)
+            generator.end_time = time.time()
+            generator.calculate_metrics()
+            generator.export_json(args.output)
+            metrics = generator.metrics
+    elif output_format == 'jsonl':
+        # JSON Lines se escribe siempre a medida que se generan los casos
+        metrics = generator.export_jsonl(args.output, generator.iter_cases(*counts, **options),
+                                         compress)
+    else:
+        generator.generate_all(*counts, **options)
+        generator.export_json(args.output)
+        metrics = generator.metrics
+    
+    if cache is not None:
+        # Guarda las tablas de conteo que se extendieron durante la generación
+        cache.save(grammar)
+    
+    if not args.quiet:
+        print(f"{metrics['total_cases']} casos generados en {metrics['execution_seconds']:.2f}s"
+              + ("" if args.output == '-' else f" -> {args.output}"), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    # Con ``python -m generator`` o ``python generator.py`` este archivo es
+    # ``__main__``: se ejecuta el main del módulo importado para que la caché
+    # guarde clases ``generator.*`` que luego pueda leer la biblioteca
+    import generator
+    sys.exit(generator.main())
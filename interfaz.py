@@ -1,7 +1,10 @@
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from datetime import datetime
-from generator import GrammarParser, TestCaseGenerator
+from generator import CaseStore, GrammarParser, TestCaseGenerator
 
 
 class Application(tk.Tk):
@@ -20,6 +23,12 @@ class Application(tk.Tk):
         self.grammar_text = ""
         self.generator = None
         
+        # Estado de la generación en segundo plano
+        self.worker = None
+        self.worker_generator = None
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        
         self.create_widgets()
     
     def center_window(self):
@@ -203,7 +212,7 @@ class Application(tk.Tk):
                            width=15, anchor='w')
             label.pack(side=tk.LEFT)
             
-            spinbox = ttk.Spinbox(row_frame, from_=1, to=100, width=12,
+            spinbox = ttk.Spinbox(row_frame, from_=1, to=1000000, width=12,
                                 font=('Segoe UI', 10))
             spinbox.set(default_val)
             spinbox.pack(side=tk.LEFT, padx=(10, 0))
@@ -264,22 +273,40 @@ class Application(tk.Tk):
         
         # BOTONES EN LA COLUMNA DERECHA
         # Botón principal GENERAR con diseño destacado
-        btn_generate = tk.Button(right_col,
-                                text="🚀 GENERAR\nCASOS DE\nPRUEBA",
-                                command=self.generate_cases,
-                                bg='#27ae60',
-                                fg='white',
-                                font=('Segoe UI', 11, 'bold'),
-                                relief=tk.FLAT,
-                                bd=0,
-                                padx=20,
-                                pady=25,
-                                cursor='hand2',
-                                activebackground='#229954',
-                                activeforeground='white',
-                                width=12,
-                                height=5)
-        btn_generate.pack(pady=(0, 10))
+        self.btn_generate = tk.Button(right_col,
+                                     text="🚀 GENERAR\nCASOS DE\nPRUEBA",
+                                     command=self.generate_cases,
+                                     bg='#27ae60',
+                                     fg='white',
+                                     font=('Segoe UI', 11, 'bold'),
+                                     relief=tk.FLAT,
+                                     bd=0,
+                                     padx=20,
+                                     pady=25,
+                                     cursor='hand2',
+                                     activebackground='#229954',
+                                     activeforeground='white',
+                                     width=12,
+                                     height=5)
+        self.btn_generate.pack(pady=(0, 10))
+        
+        # Botón cancelar (activo solo durante la generación)
+        self.btn_cancel = tk.Button(right_col,
+                                    text="⛔ Cancelar",
+                                    command=self.cancel_generation,
+                                    bg='#c0392b',
+                                    fg='white',
+                                    font=('Segoe UI', 9),
+                                    relief=tk.FLAT,
+                                    bd=0,
+                                    padx=15,
+                                    pady=8,
+                                    cursor='hand2',
+                                    activebackground='#a93226',
+                                    activeforeground='white',
+                                    width=12,
+                                    state=tk.DISABLED)
+        self.btn_cancel.pack(pady=(0, 10))
         
         # Botón exportar
         btn_export = tk.Button(right_col,
@@ -395,19 +422,78 @@ class Application(tk.Tk):
                               activeforeground='white')
         btn_filter.pack(side=tk.LEFT)
         
-        self.cases_text = scrolledtext.ScrolledText(cases_frame, 
-                                                    height=25,
-                                                    font=('Consolas', 10),
-                                                    wrap=tk.WORD,
-                                                    relief=tk.FLAT,
-                                                    padx=15,
-                                                    pady=15,
-                                                    bg='#fafafa',
-                                                    fg='#2c3e50',
-                                                    insertbackground='#3498db',
-                                                    selectbackground='#3498db',
-                                                    selectforeground='white')
-        self.cases_text.pack(fill=tk.BOTH, expand=True)
+        # Paginación: solo se insertan en la tabla los casos de la página actual
+        page_frame = tk.Frame(search_inner, bg='#ecf0f1')
+        page_frame.pack(side=tk.LEFT, padx=(30, 0))
+        
+        page_btn_style = {
+            'bg': '#95a5a6', 'fg': 'white',
+            'font': ('Segoe UI', 9, 'bold'),
+            'relief': tk.FLAT, 'bd': 0,
+            'padx': 10, 'pady': 6,
+            'cursor': 'hand2',
+            'activebackground': '#7f8c8d',
+            'activeforeground': 'white'
+        }
+        tk.Button(page_frame, text="◀ Anterior", command=lambda: self.change_page(-1),
+                  **page_btn_style).pack(side=tk.LEFT)
+        self.page_label = tk.Label(page_frame, text="Página 0 de 0",
+                                   font=('Segoe UI', 9),
+                                   bg='#ecf0f1', fg='#2c3e50',
+                                   width=28)
+        self.page_label.pack(side=tk.LEFT, padx=10)
+        tk.Button(page_frame, text="Siguiente ▶", command=lambda: self.change_page(1),
+                  **page_btn_style).pack(side=tk.LEFT)
+        
+        # Tabla de casos
+        tree_frame = tk.Frame(cases_frame, bg='white')
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        
+        style.configure('Cases.Treeview', font=('Consolas', 10), rowheight=24)
+        style.configure('Cases.Treeview.Heading', font=('Segoe UI', 9, 'bold'))
+        
+        columns = [
+            ('id', "ID", 70, tk.CENTER),
+            ('type', "Tipo", 90, tk.CENTER),
+            ('expression', "Expresión", 700, tk.W),
+            ('depth', "Profundidad", 90, tk.CENTER),
+            ('detail', "Mutación / Tipo extremo", 220, tk.W),
+            ('length', "Longitud", 80, tk.CENTER),
+        ]
+        self.cases_tree = ttk.Treeview(tree_frame,
+                                       columns=[c[0] for c in columns],
+                                       show='headings',
+                                       style='Cases.Treeview',
+                                       selectmode='browse')
+        for column, heading, width, anchor in columns:
+            self.cases_tree.heading(column, text=heading)
+            self.cases_tree.column(column, width=width, anchor=anchor,
+                                   stretch=(column == 'expression'))
+        
+        tree_scroll_y = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL,
+                                      command=self.cases_tree.yview)
+        tree_scroll_x = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL,
+                                      command=self.cases_tree.xview)
+        self.cases_tree.configure(yscrollcommand=tree_scroll_y.set,
+                                  xscrollcommand=tree_scroll_x.set)
+        tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+        tree_scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
+        self.cases_tree.pack(fill=tk.BOTH, expand=True)
+        self.cases_tree.bind('<<TreeviewSelect>>', self.show_case_detail)
+        
+        # Detalle del caso seleccionado (la expresión completa)
+        self.case_detail = tk.Label(cases_frame,
+                                    text="Seleccione un caso para ver la expresión completa",
+                                    font=('Consolas', 10),
+                                    bg='#fafafa', fg='#2c3e50',
+                                    anchor=tk.W, justify=tk.LEFT,
+                                    wraplength=1400,
+                                    padx=15, pady=8)
+        self.case_detail.pack(fill=tk.X)
+        
+        # Índice de casos por tipo y página actual
+        self.case_index = {}
+        self.page = 0
         
         # Barra de estado mejorada
         status_frame = tk.Frame(self, bg='#34495e', height=35)
@@ -422,7 +508,12 @@ class Application(tk.Tk):
                                      bg='#34495e',
                                      fg='#ecf0f1',
                                      padx=15)
-        self.status_label.pack(fill=tk.BOTH, expand=True)
+        self.status_label.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Barra de progreso de la generación
+        self.progress_bar = ttk.Progressbar(status_frame, mode='determinate',
+                                            length=250, maximum=100)
+        self.progress_bar.pack(side=tk.RIGHT, padx=15, pady=8)
         
         # Configurar grid weights para mejor distribución
         main_frame.columnconfigure(0, weight=3)
@@ -449,41 +540,78 @@ class Application(tk.Tk):
     def clear_results(self):
         """Limpia los resultados"""
         self.metrics_text.delete(1.0, tk.END)
-        self.cases_text.delete(1.0, tk.END)
+        self.cases_tree.delete(*self.cases_tree.get_children())
+        self.case_index = {}
+        self.page = 0
+        self.page_label.config(text="Página 0 de 0")
+        self.case_detail.config(text="Seleccione un caso para ver la expresión completa")
         self.generator = None
         self.status_label.config(text="⚡ Estado: Resultados limpiados")
     
+    # Casos mostrados por página de la tabla
+    PAGE_SIZE = 200
+    
+    def build_case_index(self):
+        """Precalcula las posiciones de los casos de cada tipo (una pasada)"""
+        cases = self.generator.test_cases
+        index = {"Todos": range(len(cases))}
+        index.update(cases.positions_by_type())
+        self.case_index = index
+    
     def filter_cases(self, event=None):
-        """Filtra casos por tipo"""
+        """Filtra casos por tipo y muestra la primera página"""
         if not self.generator:
             return
         
-        filter_type = self.filter_var.get()
-        self.cases_text.delete(1.0, tk.END)
-        
-        cases_str = "=== CASOS DE PRUEBA GENERADOS ===\n\n"
-        
-        filtered_cases = self.generator.test_cases
-        if filter_type != "Todos":
-            filtered_cases = [c for c in self.generator.test_cases if c['type'] == filter_type]
-        
-        cases_str += f"Mostrando {len(filtered_cases)} de {len(self.generator.test_cases)} casos\n"
-        cases_str += "=" * 80 + "\n\n"
+        self.page = 0
+        self.render_page()
+    
+    def change_page(self, step: int):
+        """Avanza o retrocede una página de casos"""
+        if not self.generator:
+            return
         
-        for case in filtered_cases:
-            cases_str += f"ID: {case['id']} | Tipo: {case['type'].upper()}\n"
-            cases_str += f"Expresión: {case['expression']}\n"
-            
-            if 'depth' in case:
-                cases_str += f"Profundidad: {case['depth']}\n"
-            if 'mutation' in case:
-                cases_str += f"Mutación aplicada: {case['mutation']}\n"
-            if 'extreme_type' in case:
-                cases_str += f"Tipo extremo: {case['extreme_type']}\n"
-            
-            cases_str += "-" * 80 + "\n\n"
+        self.page += step
+        self.render_page()
+    
+    def render_page(self):
+        """Inserta en la tabla solo los casos de la página actual"""
+        filter_type = self.filter_var.get()
+        positions = self.case_index.get(filter_type, [])
+        pages = max(1, -(-len(positions) // self.PAGE_SIZE))
+        self.page = min(max(self.page, 0), pages - 1)
+        
+        self.cases_tree.delete(*self.cases_tree.get_children())
+        cases = self.generator.test_cases
+        start = self.page * self.PAGE_SIZE
+        for position in positions[start:start + self.PAGE_SIZE]:
+            case = cases[position]
+            detail = case.get('mutation') or case.get('extreme_type') or ''
+            self.cases_tree.insert('', tk.END, iid=str(position), values=(
+                case['id'],
+                case['type'].upper(),
+                case['expression'],
+                case.get('depth', ''),
+                detail,
+                case['length'],
+            ))
+        
+        self.page_label.config(
+            text=f"Página {self.page + 1} de {pages} • {len(positions)} de {len(cases)} casos")
+    
+    def show_case_detail(self, event=None):
+        """Muestra la expresión completa del caso seleccionado"""
+        selection = self.cases_tree.selection()
+        if not selection:
+            return
         
-        self.cases_text.insert(1.0, cases_str)
+        case = self.generator.test_cases[int(selection[0])]
+        detail = f"ID: {case['id']} | Tipo: {case['type'].upper()} | Expresión: {case['expression']}"
+        if 'mutation' in case:
+            detail += f" | Mutación aplicada: {case['mutation']}"
+        if 'extreme_type' in case:
+            detail += f" | Tipo extremo: {case['extreme_type']}"
+        self.case_detail.config(text=detail)
     
     def load_grammar(self):
         """Carga gramática desde archivo"""
@@ -514,7 +642,10 @@ F -> ( E ) | num"""
         self.status_label.config(text="⚡ Estado: Gramática de ejemplo cargada")
     
     def generate_cases(self):
-        """Genera casos de prueba"""
+        """Genera casos de prueba en un hilo de trabajo"""
+        if self.worker is not None:
+            return
+        
         grammar_text = self.grammar_text_widget.get(1.0, tk.END).strip()
         
         if not grammar_text:
@@ -523,14 +654,11 @@ F -> ( E ) | num"""
             return
         
         try:
-            self.status_label.config(text="⏳ Estado: Generando casos de prueba...")
-            self.update()
-            
             # Parsear gramática
             grammar = GrammarParser(grammar_text)
             
             # Crear generador
-            self.generator = TestCaseGenerator(grammar)
+            generator = TestCaseGenerator(grammar)
             
             # Obtener configuración
             valid = int(self.valid_count.get())
@@ -538,28 +666,138 @@ F -> ( E ) | num"""
             extreme = int(self.extreme_count.get())
             depth = int(self.max_depth.get())
             length = int(self.max_length.get())
-            
-            # Generar casos
-            self.generator.generate_all(valid, invalid, extreme, depth, length)
-            
-            # Mostrar resultados
-            self.display_results()
-            
-            total = len(self.generator.test_cases)
-            exec_time = self.generator.metrics['execution_time']
-            
-            messagebox.showinfo("✅ Generación Exitosa", 
-                              f"Se generaron {total} casos de prueba\n" + 
-                              f"Tiempo de ejecución: {exec_time}")
-            
-            self.status_label.config(text=f"✅ Estado: {total} casos generados exitosamente en {exec_time}")
-            
         except Exception as e:
             messagebox.showerror("Error", f"Error al generar casos:\n{str(e)}")
             self.status_label.config(text="❌ Estado: Error en la generación")
+            return
+        
+        self.status_label.config(text="⏳ Estado: Generando casos de prueba...")
+        self.progress_bar.config(value=0)
+        self.btn_generate.config(state=tk.DISABLED)
+        self.btn_cancel.config(state=tk.NORMAL)
+        
+        self.cancel_event.clear()
+        self.progress_queue = queue.Queue()
+        self.worker_generator = generator
+        self.worker = threading.Thread(
+            target=self._generation_worker,
+            args=(generator, self.progress_queue, self.cancel_event,
+                  (valid, invalid, extreme, depth, length)),
+            daemon=True)
+        self.worker.start()
+        self.after(100, self._poll_generation)
+    
+    # Segundos entre mensajes de progreso del hilo de trabajo
+    PROGRESS_INTERVAL = 0.1
+    
+    @classmethod
+    def _generation_worker(cls, generator, progress_queue, cancel_event, params):
+        """Genera los casos fuera del hilo de Tk
+        
+        No toca ningún widget: comunica el avance por ``progress_queue``
+        y revisa ``cancel_event`` entre caso y caso.
+        """
+        source = None
+        try:
+            total = sum(params[:3])
+            cases = CaseStore()
+            started = time.time()
+            last_report = started
+            
+            source = generator.iter_cases(*params)
+            for case in source:
+                # El caso ya está en las métricas en línea: se guarda antes de
+                # cortar para que la tabla y las métricas parciales coincidan
+                cases.append(case)
+                if cancel_event.is_set():
+                    # Cerrar antes de avisar: así terminan el perfil y el hook 'end'
+                    source.close()
+                    progress_queue.put(('cancelled', cases))
+                    return
+                
+                now = time.time()
+                if now - last_report >= cls.PROGRESS_INTERVAL:
+                    progress_queue.put(('progress', len(cases), total, now - started))
+                    last_report = now
+            
+            progress_queue.put(('done', cases))
+        except Exception as e:
+            progress_queue.put(('error', e))
+        finally:
+            if source is not None:
+                source.close()
     
-    def display_results(self):
-        """Muestra los resultados en la interfaz"""
+    def _poll_generation(self):
+        """Procesa los mensajes del hilo de trabajo (se llama con after())"""
+        try:
+            while True:
+                message = self.progress_queue.get_nowait()
+                kind = message[0]
+                
+                if kind == 'progress':
+                    _, done, total, elapsed = message
+                    rate = done / elapsed if elapsed > 0 else 0
+                    eta = (total - done) / rate if rate > 0 else 0
+                    self.progress_bar.config(value=done / total * 100 if total else 0)
+                    self.status_label.config(
+                        text=f"⏳ Estado: {done}/{total} casos • {rate:.0f} casos/s • "
+                             f"tiempo restante ~{eta:.1f}s")
+                    continue
+                
+                self.worker = None
+                self.btn_generate.config(state=tk.NORMAL)
+                self.btn_cancel.config(state=tk.DISABLED)
+                
+                if kind == 'error':
+                    messagebox.showerror("Error", f"Error al generar casos:\n{str(message[1])}")
+                    self.status_label.config(text="❌ Estado: Error en la generación")
+                    return
+                
+                generator = self._finish_generation(message[1], kind == 'cancelled')
+                if kind == 'cancelled':
+                    total = len(generator.test_cases)
+                    self.status_label.config(
+                        text=f"⛔ Estado: Generación cancelada ({total} casos generados)")
+                    return
+                
+                total = len(generator.test_cases)
+                exec_time = generator.metrics['execution_time']
+                
+                messagebox.showinfo("✅ Generación Exitosa", 
+                                  f"Se generaron {total} casos de prueba\n" + 
+                                  f"Tiempo de ejecución: {exec_time}")
+                
+                self.status_label.config(text=f"✅ Estado: {total} casos generados exitosamente en {exec_time}")
+                return
+        except queue.Empty:
+            pass
+        
+        self.after(100, self._poll_generation)
+    
+    def _finish_generation(self, cases, cancelled: bool = False):
+        """Guarda los casos del hilo de trabajo y muestra los resultados
+        
+        El hilo siempre cierra la generación (también al cancelar), así que
+        ``end_time`` está definido; si se canceló, las métricas son las de
+        los casos generados hasta ese momento.
+        """
+        generator = self.worker_generator
+        self.worker_generator = None
+        generator.test_cases = cases
+        generator.metrics = generator.live_metrics.result(generator.end_time - generator.start_time)
+        self.generator = generator
+        self.progress_bar.config(value=100 if cases else 0)
+        self.display_results(cancelled)
+        return generator
+    
+    def cancel_generation(self):
+        """Solicita detener la generación en curso"""
+        if self.worker is not None:
+            self.cancel_event.set()
+            self.status_label.config(text="⏳ Estado: Cancelando generación...")
+    
+    def display_results(self, cancelled: bool = False):
+        """Muestra los resultados en la interfaz (parciales si se canceló)"""
         if not self.generator:
             return
         
@@ -589,12 +827,22 @@ F -> ( E ) | num"""
         metrics_str += f"\n⏱️  Tiempo de ejecución: {self.generator.metrics['execution_time']}\n"
         metrics_str += f"📅 Generado: {self.generator.metrics['generated_at']}\n"
         
+        warnings = self.generator.metrics.get('grammar', {}).get('warnings', [])
+        if warnings:
+            metrics_str += "\n⚠️  Análisis de la gramática:\n"
+            for warning in warnings:
+                metrics_str += f"   • {warning}\n"
+        
         metrics_str += "\n" + "─" * 80 + "\n"
-        metrics_str += "✅ Generación completada exitosamente\n"
+        if cancelled:
+            metrics_str += "⛔ Generación cancelada: métricas de los casos generados hasta entonces\n"
+        else:
+            metrics_str += "✅ Generación completada exitosamente\n"
         
         self.metrics_text.insert(1.0, metrics_str)
         
         # Mostrar casos de prueba
+        self.build_case_index()
         self.filter_cases()
         
         # Cambiar a la pestaña de métricas
@@ -3,9 +3,15 @@ Script de prueba rápida para verificar funcionalidad básica
 sin interfaz gráfica
 """
 
+import gzip
 import json
+import random
+import statistics
+import tempfile
 from datetime import datetime
-from generator import GrammarParser, TestCaseGenerator
+from pathlib import Path
+from generator import (CaseStore, Derivation, EarleyRecognizer, GrammarParser,
+                       SentenceEnumerator, TestCaseGenerator)
 
 def test_basic_functionality():
     """Prueba la funcionalidad básica del generador"""
@@ -80,10 +86,682 @@ F -> ( E ) | num"""
     print("✅ TODAS LAS PRUEBAS PASADAS EXITOSAMENTE")
     print("=" * 80)
 
-if __name__ == "__main__":
+
+GRAMATICA_EJEMPLO = """E -> E + T | E - T | T
+T -> T * F | T / F | T % F | F
+F -> ( E ) | num"""
+
+
+def test_compiled_grammar():
+    """La gramática compilada conserva las reglas con IDs enteros"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    compiled = grammar.compiled
+    
+    assert compiled.num_nonterminals == 3
+    assert compiled.num_productions == 9
+    for left, productions in grammar.rules.items():
+        sym_id = compiled.symbol_ids[left]
+        assert not compiled.is_terminal[sym_id]
+        decoded = [[compiled.symbols[s] for s in compiled.production(p)]
+                   for p in compiled.productions_of(sym_id)]
+        assert decoded == productions
+    assert compiled.is_terminal[compiled.symbol_ids['num']]
+
+
+def test_deep_derivation_without_recursion():
+    """La derivación iterativa soporta profundidades de miles de niveles"""
+    chain = "\n".join(f"A{i} -> A{i + 1} x" for i in range(3000)) + "\nA3000 -> x"
+    generator = TestCaseGenerator(GrammarParser(chain))
+    expr = generator.generate_valid('A0', 0, 5000)
+    assert expr.split() == ['x'] * 3001
+
+
+def test_termination_tables():
+    """El análisis de derivación mínima evita cadenas truncadas o vacías"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    compiled = grammar.compiled
+    heights = {s: compiled.min_height[compiled.symbol_ids[s]] for s in 'ETF'}
+    assert heights == {'E': 3, 'T': 2, 'F': 1}
+    best_f = compiled.best_production[compiled.symbol_ids['F']]
+    assert [compiled.symbols[s] for s in compiled.production(best_f)] == ['num']
+    
+    generator = TestCaseGenerator(grammar)
+    for max_depth in range(6):
+        for _ in range(50):
+            tokens = generator.generate_valid('E', 0, max_depth).split()
+            assert tokens and tokens[0] in ('num', '(') and tokens[-1] in ('num', ')')
+            assert tokens.count('(') == tokens.count(')')
+
+
+def test_length_sampler():
+    """El muestreo por conteo produce cadenas de longitud exacta sin reintentos"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    sampler = grammar.length_sampler('tokens')
+    start = grammar.compiled.symbol_ids['E']
+    assert [sampler.count(start, n) for n in range(6)] == [0, 1, 0, 6, 0, 41]
+    
+    generator = TestCaseGenerator(grammar)
+    assert {generator.generate_exact_length('E', 3) for _ in range(300)} == {
+        'num + num', 'num - num', 'num * num', 'num / num', 'num % num', '( num )'}
+    assert len(generator.generate_exact_length('E', 301).split()) == 301
+    
+    expr = generator.generate_extreme('E', 'long_expression', 5, 200)
+    assert 140 <= len(expr) <= 200
+    assert len(generator.generate_extreme('E', 'exact_length', 5, 200)) == 199
+
+
+def test_parallel_generation_is_reproducible():
+    """Con la misma semilla, generate_all paralelo se reproduce"""
+    runs = []
+    for _ in range(2):
+        generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+        generator.generate_all(12, 6, 5, 5, 40, workers=2, seed=1234)
+        runs.append(generator.test_cases)
+    
+    assert runs[0] == runs[1]
+    assert [c['id'] for c in runs[0]] == list(range(1, 24))
+    
+    # El resultado no depende de la cantidad de procesos
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(12, 6, 5, 5, 40, workers=1, seed=1234)
+    assert generator.test_cases == runs[0]
+    assert [c['type'] for c in runs[0]].count('inválida') == 6
+
+
+def test_streaming_jsonl_export(tmp_path):
+    """iter_cases + export_jsonl producen los mismos casos que generate_all"""
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(8, 4, 3, 5, 40, seed=99)
+    expected = generator.test_cases
+    
+    output_file = tmp_path / "casos.jsonl.gz"
+    metrics = generator.export_jsonl(str(output_file),
+                                     generator.iter_cases(8, 4, 3, 5, 40, seed=99))
+    with gzip.open(output_file, 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    
+    assert records[:-1] == expected
+    assert records[-1] == {'metrics': metrics}
+    assert metrics['total_cases'] == 15
+
+
+def test_online_metrics():
+    """Las métricas en línea coinciden con un cálculo directo sobre los casos"""
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(30, 10, 10, 5, 60)
+    metrics = generator.metrics
+    lengths = [c['length'] for c in generator.test_cases]
+    
+    assert metrics['type_counts'] == {'válida': 30, 'inválida': 10, 'extrema': 10}
+    assert abs(metrics['length_stats']['mean'] - statistics.fmean(lengths)) < 1e-9
+    assert abs(metrics['length_stats']['variance'] - statistics.pvariance(lengths)) < 1e-6
+    assert sum(metrics['length_histogram'].values()) == 50
+    assert metrics['operators']['+'] == sum(c['expression'].split().count('+')
+                                            for c in generator.test_cases)
+    
+    # Recalcular sobre los casos guardados da los mismos valores
+    live = dict(metrics)
+    generator.calculate_metrics()
+    for key in ('type_counts', 'length_histogram', 'operators', 'max_depth'):
+        assert generator.metrics[key] == live[key]
+    # ... sin perder la semilla ni las demás secciones de la generación
+    generator.generate_all(10, 5, 5, 5, 60, seed=77, unique='exact', verify=True)
+    sections = set(generator.metrics) - {'execution_time', 'execution_seconds'}
+    generator.calculate_metrics()
+    assert sections <= set(generator.metrics)
+    generator.export_json('test_output.json')
+    with open('test_output.json', encoding='utf-8') as f:
+        exported = json.load(f)['metrics']
+    assert exported['seed'] == 77 and exported['parameters']['seed'] == 77
+
+
+def test_earley_recognizer_and_verification():
+    """El reconocedor decide pertenencia y la verificación corrige etiquetas"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    recognizer = grammar.recognizer
+    assert recognizer.recognizes('( num + num ) * num % num'.split())
+    assert recognizer.recognizes(['num'])
+    assert not recognizer.recognizes('num + * num'.split())
+    assert not recognizer.recognizes('( num'.split())
+    assert not recognizer.recognizes(['num+num'])
+    assert not recognizer.recognizes([])
+    
+    # Gramática con producciones vacías
+    nullable = GrammarParser("S -> A S b | x\nA -> a | ").recognizer
+    assert nullable.recognizes('x b b'.split())
+    assert nullable.recognizes('a a x b b'.split())
+    assert not nullable.recognizes('x a'.split())
+
+    # El FIRST del análisis sin podar sirve para la gramática podada
+    pruned = GrammarParser("S -> A b | x C\nA -> a |\nC -> C c\nD -> d")
+    assert pruned.analysis.useless
+    assert pruned.recognizer.first == EarleyRecognizer(
+        pruned.compiled, pruned.get_start_symbol()).first
+    assert pruned.recognizer.recognizes('a b'.split()) and pruned.recognizer.recognizes(['b'])
+
+    generator = TestCaseGenerator(grammar)
+    generator.generate_all(40, 60, 10, 4, 40, verify=True)
+    assert generator.verify_cases() == []
+    verification = generator.metrics['verification']
+    assert verification['checked'] >= 110
+    assert verification['relabeled'] == 0
+
+
+def test_token_mutations():
+    """Las mutaciones usan los papeles de los terminales según la gramática"""
+    grammar = GrammarParser("S -> S and B | B\nB -> not B | [ S ] | id")
+    compiled = grammar.compiled
+    assert compiled.operators == ['and', 'not']
+    assert compiled.open_brackets == ['['] and compiled.close_brackets == [']']
+    assert compiled.operands == ['id']
+    
+    generator = TestCaseGenerator(grammar)
+    tokens = 'id and [ id and id ]'.split()
+    positions = set()
+    for _ in range(200):
+        mutated = list(tokens)
+        assert generator._remove_operator(mutated, generator._role_index(mutated))
+        positions.add(' '.join(mutated))
+    # Se elimina cualquiera de los dos operadores, no siempre el primero
+    assert positions == {'id [ id and id ]', 'id and [ id id ]'}
+
+    # Agregar al final no desplaza posiciones: el índice se actualiza sin rehacerlo
+    mutated = list(tokens)
+    index = generator._role_index(mutated)
+    assert generator._operator_at_end(mutated, index)
+    generator._index_last(mutated, index)
+    assert index == generator._role_index(mutated)
+
+    generator.generate_all(0, 30, 0, 4, 40, mutations_per_case=3, verify=True)
+    for case in generator.test_cases:
+        assert len(case['mutation'].split(',')) == 3
+    assert generator.verify_cases() == []
+
+
+def test_unique_cases():
+    """El modo de unicidad descarta expresiones repetidas y lo reporta"""
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    for backend in ('exact', 'bloom'):
+        generator.generate_all(60, 20, 10, 2, 30, unique=backend, unique_capacity=1000)
+        expressions = [c['expression'] for c in generator.test_cases]
+        dedup = generator.metrics['dedup']
+        
+        assert len(expressions) == len(set(expressions))
+        assert dedup['backend'] == backend
+        assert dedup['unique'] == len(expressions)
+        assert dedup['rejected'] > 0
+        assert len(expressions) + dedup['dropped'] == 90
+    
+    # Con cobertura los válidos se generan localmente y ya pasan por el
+    # deduplicador: al unir los fragmentos no deben descartarse otra vez
+    runs = []
+    for workers in (1, 2):
+        generator.generate_all(20, 10, 0, 5, 50, workers=workers, seed=1,
+                               coverage='productions', unique='exact')
+        runs.append([c for c in generator.test_cases if c['type'] == 'válida'])
+    assert len(runs[1]) == 20 and runs[1] == runs[0]
+    assert generator.metrics['dedup']['unique'] == len(generator.test_cases)
+
+    # Cada fragmento regenera sus duplicados y los repetidos entre fragmentos
+    # se regeneran al unirlos: el resultado no depende de los procesos
+    runs = []
+    for workers in (1, 4):
+        generator.generate_all(400, 100, 0, 4, 30, unique='exact', seed=5, workers=workers)
+        runs.append(generator.test_cases.to_list())
+    assert len(runs[0]) == 416 and runs[1] == runs[0]
+    assert generator.metrics['dedup']['unique'] == 416
+
+
+def test_coverage_guided_generation():
+    """La generación guiada cubre todas las producciones con pocos casos"""
+    # Cadena de no-terminales con muchas alternativas terminales: al azar
+    # casi nunca se llega a las producciones más profundas
+    lines = [f"N{i} -> " + " | ".join([f"t{i}_{j}" for j in range(10)] + [f"N{i + 1} x"])
+             for i in range(6)]
+    lines.append("N6 -> " + " | ".join(f"z{j}" for j in range(10)))
+    grammar = GrammarParser("\n".join(lines))
+    
+    generator = TestCaseGenerator(grammar)
+    generator.generate_all(100000, 0, 0, 20, 50, seed=3,
+                           coverage='productions', coverage_target=1.0)
+    coverage = generator.metrics['coverage']
+    
+    assert coverage['productions']['percentage'] == 100.0
+    assert coverage['productions']['total'] == 76
+    assert coverage['reached_at'] == len(generator.test_cases) < 200
+    
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(1000, 0, 0, 6, 50, seed=3,
+                           coverage='pairs', coverage_target=1.0)
+    coverage = generator.metrics['coverage']
+    assert coverage['pairs'] == {'covered': 41, 'total': 41, 'percentage': 100.0}
+    assert len(generator.test_cases) < 1000
+
+
+def test_weighted_productions():
+    """Los pesos de la gramática guían la elección y se pueden ajustar"""
+    grammar = GrammarParser("""E -> E + T [0.2] | T [0.8]
+T -> T * F [1] | F [3]
+F -> ( E ) [1] | num [9]""")
+    compiled = grammar.compiled
+    
+    assert grammar.rules['E'] == [['E', '+', 'T'], ['T']]
+    assert grammar.weights['F'] == [1.0, 9.0]
+    assert compiled.weighted
+    # Longitud esperada de E, T y F según los pesos
+    assert [round(x, 6) for x in compiled.expected_tokens()] == [3.0, 2.2, 1.4]
+    
+    # Con profundidad amplia las producciones salen en proporción a su peso
+    generator = TestCaseGenerator(grammar)
+    generator.rng = random.Random(5)
+    tokens = []
+    for _ in range(2000):
+        tokens.extend(generator._valid_tokens('F', 0, 100))
+    assert 0.85 < tokens.count('num') / (tokens.count('num') + tokens.count('(')) < 0.92
+    
+    # Sin pesos la esperanza diverge; el ajuste la lleva al objetivo
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    assert not grammar.compiled.weighted
+    assert grammar.compiled.expected_tokens()[0] == float('inf')
+    assert abs(grammar.tune_weights(10) - 10) < 1e-6
+    assert grammar.compiled.weighted
+    assert len(grammar.weights['T']) == 4
+
+
+def test_benchmark_report():
+    """El benchmark produce un informe JSON comparable entre corridas"""
+    import benchmark
+    
+    report = benchmark.run(scale=0.001, repeat=1, grammars=['expression'])
+    results = report['results']['expression']
+    
+    assert set(results) == {'generate_valid', 'generate_valid[pool]', 'generate_invalid',
+                            'calculate_metrics', 'export_json'} | {f'generate_extreme[{t}]'
+                                              for t in TestCaseGenerator.EXTREME_TYPES}
+    assert all(result['cases_per_sec'] > 0 for result in results.values())
+    json.dumps(report)
+    
+    # Una corrida el doble de lenta que la base cuenta como regresión
+    baseline = json.loads(json.dumps(report))
+    for result in baseline['results']['expression'].values():
+        result['cases_per_sec'] = result['cases_per_sec'] * 2
+    assert len(benchmark.compare(report, baseline, 0.1)) == len(results)
+
+
+def test_instrumentation_and_hooks():
+    """Las métricas traen tiempos por fase, contadores y perfiles numéricos"""
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    events = []
+    generator.add_hook(lambda event, data: events.append(event))
+    generator.generate_all(20, 20, 10, 5, 50, verify=True, profile='all')
+    metrics = generator.metrics
+    instrumentation = metrics['instrumentation']
+    
+    assert isinstance(metrics['execution_seconds'], float)
+    assert set(instrumentation['phases']) >= {'valid', 'invalid', 'extreme', 'verify', 'metrics'}
+    assert all(seconds >= 0 for seconds in instrumentation['phases'].values())
+    assert instrumentation['counters']['expansions'] > 0
+    assert instrumentation['counters']['valid_attempts'] >= 20
+    assert events[0] == 'start' and events[-1] == 'end'
+    assert events.count('case') == len(generator.test_cases)
+    
+    assert metrics['profile']['cpu'][0]['calls'] > 0
+    assert metrics['profile']['memory']['peak_bytes'] > 0
+    json.dumps(metrics)
+
+    # Cortar la generación a medias también cierra el perfil y emite 'end'
+    events.clear()
+    source = generator.iter_cases(20, 20, 10, 5, 50, profile='cpu')
+    next(source)
+    source.close()
+    assert events[-1] == 'end'
+    assert generator.end_time is not None and generator.profile_report['cpu']
+
+    # Un generador nuevo no detiene un tracemalloc que no inició
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))._stop_profile('memory', None)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_command_line(tmp_path):
+    """La línea de comandos genera casos sin importar tkinter"""
+    import subprocess
+    import sys
+    from generator import main
+    
+    grammar_file = tmp_path / "gramatica.txt"
+    grammar_file.write_text(GRAMATICA_EJEMPLO, encoding='utf-8')
+    output = tmp_path / "casos.json"
+    
+    assert main([str(grammar_file), '--valid', '4', '--invalid', '3', '--extreme', '2',
+                 '--seed', '7', '-o', str(output), '-q',
+                 '--cache-dir', str(tmp_path / 'cache')]) == 0
+    data = json.loads(output.read_text(encoding='utf-8'))
+    assert len(data['test_cases']) == 9
+    assert data['metrics']['total_cases'] == 9
+    
+    output = tmp_path / "casos.jsonl.gz"
+    main([str(grammar_file), '--seed', '7', '--unique', 'exact', '-o', str(output), '-q',
+          '--cache-dir', str(tmp_path / 'cache')])
+    with gzip.open(output, 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert 'dedup' in records[-1]['metrics']
+    
+    result = subprocess.run([sys.executable, '-c',
+                             'import sys, generator; print("tkinter" in sys.modules)'],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_regenerate_case_from_seed():
+    """Cualquier caso se regenera a partir de la semilla y su ID"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    generator = TestCaseGenerator(grammar)
+    generator.generate_all(15, 15, 10, 5, 50, verify=True, mutations_per_case=2, seed=2024)
+    metrics = json.loads(json.dumps(generator.metrics))
+    
+    assert metrics['seed'] == 2024
+    other = TestCaseGenerator(grammar)
+    for case in generator.test_cases:
+        assert other.regenerate_case(case['id'], parameters=metrics['parameters']) == case
+    
+    # La semilla del constructor hace reproducibles las llamadas sueltas
+    first = TestCaseGenerator(grammar, seed=8)
+    second = TestCaseGenerator(grammar, seed=8)
+    assert [first.generate_valid('E', 0, 5) for _ in range(5)] == \
+           [second.generate_valid('E', 0, 5) for _ in range(5)]
+
+
+def test_real_depth_and_derivation_trees():
+    """Los casos guardan su profundidad real y el árbol de derivación"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    generator = TestCaseGenerator(grammar)
+    generator.generate_all(30, 0, 10, 5, 40, seed=11, trees=True)
+    
+    for case in generator.test_cases:
+        tree = case['tree']
+        assert len(tree['parent']) == len(tree['production']) == case['expansions']
+        # Profundidad de cada nodo a partir de su padre (preorden)
+        levels = []
+        for parent in tree['parent']:
+            levels.append(1 if parent < 0 else levels[parent] + 1)
+        assert max(levels) == case['depth']
+        assert Derivation.tokens(grammar.compiled, tree['production']) == case['expression'].split()
+    
+    metrics = generator.metrics
+    assert metrics['max_depth'] == max(case['depth'] for case in generator.test_cases)
+    assert metrics['productions'][0] == 'E -> E + T'
+    
+    # Con profundidad 1 solo cabe la derivación mínima E -> T -> F -> num
+    generator.generate_all(1, 0, 0, 1, 40, seed=1)
+    case = generator.test_cases[0]
+    assert 'tree' not in case
+    assert (case['expression'], case['depth'], case['expansions']) == ('num', 3, 3)
+
+
+def test_grammar_analysis():
+    """El análisis detecta símbolos inútiles, ciclos y recursión izquierda"""
+    analysis = GrammarParser(GRAMATICA_EJEMPLO).analysis.report()
+    assert analysis['left_recursive'] == ['E', 'T']
+    assert analysis['first']['E'] == ['(', 'num']
+    assert analysis['follow']['F'] == ['$', '+', '-', '*', '/', '%', ')']
+    assert analysis['warnings'] == []
+    
+    grammar = GrammarParser("""S -> A b | C
+A -> B | a
+B -> A | c
+C -> C d
+D -> x
+N -> | S""")
+    report = grammar.analysis.report()
+    assert report['unproductive'] == ['C']
+    assert report['unreachable'] == ['D', 'N']
+    assert report['nullable'] == ['N']
+    assert report['cycles'] == [['A', 'B']]
+    assert report['pruned'] == ['S -> C', 'C -> C d', 'D -> x', 'N -> ', 'N -> S']
+    
+    # Solo se compilan las producciones útiles
+    assert grammar.compiled.num_productions == 5
+    generator = TestCaseGenerator(grammar)
+    generator.generate_all(10, 0, 0, 6, 30, seed=1)
+    assert all(case['expression'].endswith('b') for case in generator.test_cases)
+    assert generator.metrics['grammar']['cycles'] == [['A', 'B']]
+    
+    # Con ciclos unitarios no hay muestreo por longitud: los extremos por
+    # longitud usan la derivación aleatoria
+    cyclic = TestCaseGenerator(GrammarParser("S -> A\nA -> B | a\nB -> A | b"))
+    for workers in (1, 2):
+        cyclic.generate_all(2, 0, 10, 6, 30, seed=1, workers=workers)
+        assert len(cyclic.test_cases) == 12
+        assert {c['expression'] for c in cyclic.test_cases} <= {'a', 'b'}
+    counters = cyclic.metrics['instrumentation']['counters']
+    assert counters['long_expression_fallbacks'] == counters['exact_length_fallbacks'] == 2
+    
+    try:
+        TestCaseGenerator(GrammarParser("S -> S a")).generate_all(1, 0, 0, 5, 10)
+        assert False, "el símbolo inicial es improductivo"
+    except ValueError as e:
+        assert "no deriva ninguna cadena" in str(e)
+
+
+def test_columnar_case_store(tmp_path):
+    """CaseStore guarda los casos en columnas y se usa como la lista de dicts"""
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(20, 10, 10, 5, 40, seed=5, trees=True)
+    cases = generator.test_cases
+    expected = list(generator.iter_cases(20, 10, 10, 5, 40, seed=5, trees=True))
+    
+    assert isinstance(cases, CaseStore) and len(cases) == 40
+    assert cases == expected and cases[-1] == expected[-1]
+    assert [case.to_dict() for case in cases[:3]] == expected[:3]
+    assert 'mutation' in cases[20] and cases[0].get('mutation') is None
+    assert cases.positions_by_type()['inválida'] == list(range(20, 30))
+    
+    # Las expresiones cortas repetidas se guardan una sola vez
+    assert len(cases.pool) < sum(len(c['expression'].encode()) for c in expected)
+    
+    output_file = tmp_path / "casos.json"
+    generator.export_json(str(output_file))
+    data = {'test_cases': expected, 'metrics': generator.metrics}
+    assert output_file.read_text(encoding='utf-8') == json.dumps(data, indent=2, ensure_ascii=False)
+
+    # Cada combinación de mutaciones es una etiqueta: pueden ser decenas de miles
+    generator = TestCaseGenerator(GrammarParser("S -> S + a | a"))
+    generator.generate_all(0, 40000, 0, 2, 10, mutations_per_case=9, seed=1)
+    cases = generator.test_cases
+    assert len(cases.labels['mutation']) > 32767
+    assert len(cases[-1]['mutation'].split(',')) == 9
+
+
+def test_binary_corpus(tmp_path):
+    """El corpus binario se lee por ID, por tipo y por fragmentos vía mmap"""
+    from corpus import CorpusReader, write_corpus
+    
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(30, 15, 10, 5, 40, seed=8, trees=True)
+    corpus_file = tmp_path / "casos.corpus"
+    assert write_corpus(str(corpus_file), generator.test_cases, generator.metrics) == 55
+    
+    with CorpusReader(str(corpus_file)) as reader:
+        assert len(reader) == 55 and list(reader) == generator.test_cases
+        assert reader.get(40) == generator.test_cases[39]
+        assert 56 not in reader and reader.metrics == json.loads(json.dumps(generator.metrics))
+        assert [c['id'] for c in reader.scan('inválida')] == list(range(31, 46))
+        shards = [[c['id'] for c in reader.shard(i, 4)] for i in range(4)]
+        assert sum(shards, []) == list(range(1, 56))
+        
+        # Conversión de vuelta a JSON
+        reader.export_json(str(tmp_path / "casos.json"))
+    generator.export_json(str(tmp_path / "original.json"))
+    assert (tmp_path / "casos.json").read_text(encoding='utf-8') == \
+        (tmp_path / "original.json").read_text(encoding='utf-8')
+
+    # Más combinaciones de mutaciones que las que entran en 16 bits
+    cases = [{'id': i, 'type': 'inválida', 'expression': 'num +', 'mutation': f'm{i}',
+              'length': 2} for i in range(1, 40001)]
+    cases.append({'id': 40001, 'type': 'válida', 'expression': 'num', 'length': 1})
+    assert write_corpus(str(corpus_file), cases) == 40001
+    with CorpusReader(str(corpus_file)) as reader:
+        assert len(reader.labels['mutation']) == 40000
+        assert list(reader) == cases
+
+
+def test_grammar_cache(tmp_path):
+    """La caché en disco devuelve la gramática con sus tablas y respeta el límite"""
+    from generator import GrammarCache
+    
+    cache = GrammarCache(str(tmp_path / "cache"))
+    grammar = cache.load(GRAMATICA_EJEMPLO)
+    grammar.length_sampler('chars').ensure(120)
+    assert cache.misses == 1 and cache.save(grammar) and not cache.save(grammar)
+    
+    # Otro proceso (otra instancia) parte con las tablas ya calculadas
+    warm = GrammarCache(str(tmp_path / "cache"))
+    loaded = warm.load("\n  " + GRAMATICA_EJEMPLO.replace("->", "  ->") + "\n\n")
+    assert warm.hits == 1 and loaded.rules == grammar.rules
+    assert loaded._compiled is not None and loaded._recognizer is not None
+    assert loaded.length_sampler('chars').max_size >= 120
+    
+    # Las gramáticas ajustadas ya no corresponden a su texto
+    loaded.tune_weights(5)
+    assert not warm.save(loaded)
+    
+    # LRU: al superar el tamaño máximo se borra la menos usada
+    size = warm.entries()[0][1]
+    small = GrammarCache(str(tmp_path / "cache"), max_bytes=size + 1)
+    small.load("S -> a S | a")
+    assert [path for _, _, path in small.entries()] == [small.path(small.key("S -> a S | a"))]
+    
+    # Lo que guarda la línea de comandos (python -m generator) lo lee la biblioteca
+    import os
+    import subprocess
+    import sys
+    grammar_file = tmp_path / "gramatica.txt"
+    grammar_file.write_text(GRAMATICA_EJEMPLO, encoding='utf-8')
+    cli_cache = tmp_path / "cli-cache"
+    subprocess.run([sys.executable, '-m', 'generator', str(grammar_file), '-q',
+                    '-o', str(tmp_path / "casos.json"), '--cache-dir', str(cli_cache)],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    library = GrammarCache(str(cli_cache))
+    assert type(library.load(GRAMATICA_EJEMPLO)) is GrammarParser
+    assert library.hits == 1 and library.misses == 0
+
+
+def test_enumerate_sentences():
+    """La enumeración exhaustiva produce cada oración una vez y por longitud"""
+    grammar = GrammarParser(GRAMATICA_EJEMPLO)
+    generator = TestCaseGenerator(grammar, seed=4)
+    
+    sentences = list(generator.enumerate_sentences(7))
+    assert sentences[:2] == ['num', '( num )']
+    assert len(sentences) == len(set(sentences))
+    lengths = [len(s.split()) for s in sentences]
+    assert lengths == sorted(lengths)
+    
+    # Gramática no ambigua: una oración por árbol de derivación
+    sampler = grammar.length_sampler('tokens')
+    start = grammar.compiled.symbol_ids['E']
+    assert len(sentences) == sum(sampler.count(start, n) for n in range(8))
+    assert all(grammar.recognizer.recognizes(s.split()) for s in sentences)
+
+    # Sin ciclos cada producción se arma una sola vez por longitud
+    enumerator = SentenceEnumerator(grammar.compiled)
+    sequences = enumerator._sequences
+    calls = []
+    enumerator._sequences = lambda symbols, i, length: (
+        calls.append(i) if i == 0 else None, sequences(symbols, i, length))[1]
+    enumerator.ensure(9)
+    assert len(calls) == grammar.compiled.num_productions * 10
+    grammar.sentence_enumerator().ensure(9)
+    assert enumerator.sentences == grammar.sentence_enumerator().sentences
+
+    # Ciclos unitarios y anulables se resuelven con el punto fijo por longitud
+    cyclic = TestCaseGenerator(GrammarParser("S -> A B | S S\nA -> B | a |\nB -> A | b"))
+    assert list(cyclic.enumerate_sentences(2)) == ['', 'a', 'b', 'a a', 'a b', 'b a', 'b b']
+    
+    # Las oraciones alimentan a los mutadores de casos inválidos
+    cases = list(generator.enumerate_cases(5, invalid=True, seed=9))
+    assert [c['expression'] for c in cases if c['type'] == 'válida'] == sentences[:48]
+    assert len(cases) == 96 and cases[1]['mutation']
+    assert cases == list(generator.enumerate_cases(5, invalid=True, seed=9))
+
+
+def test_subtree_pool():
+    """El pool reutiliza subárboles sin perder profundidad ni expansiones reales"""
+    generator = TestCaseGenerator(GrammarParser("S -> a S | b S | c"), seed=2)
+    generator.generate_all(300, 50, 0, 8, 40, pool=8, pool_refresh=0.2)
+    pool = generator.metrics['pool']
+    assert pool['reused'] > 0 and pool['derived'] > 0 and pool['keys'] > 0
+    assert 0 < pool['distinct_case_ratio'] <= 1 and pool['cases'] == 350
+    for case in generator.test_cases[:300]:
+        # Cada token es un nivel y una expansión de S
+        tokens = case['expression'].split()
+        assert tokens[-1] == 'c' and case['depth'] == case['expansions'] == len(tokens)
+    
+    # Misma semilla y un solo proceso: el pool evoluciona igual
+    other = TestCaseGenerator(GrammarParser("S -> a S | b S | c"), seed=2)
+    other.generate_all(300, 50, 0, 8, 40, pool=8, pool_refresh=0.2)
+    assert other.test_cases == generator.test_cases
+    
+    generator = TestCaseGenerator(GrammarParser(GRAMATICA_EJEMPLO))
+    generator.generate_all(100, 0, 0, 6, 40, seed=3, pool=16)
+    assert all(generator.grammar.recognizer.recognizes(case['expression'].split())
+               for case in generator.test_cases)
+    # Cada proceso tiene su pool: las métricas suman los de todos
+    generator.generate_all(200, 50, 20, 6, 40, seed=3, pool=4, workers=2)
+    pool = generator.metrics['pool']
+    assert pool['processes'] >= 2 and pool['keys'] > 0
+    assert 0 < pool['distinct_subtrees'] <= pool['subtrees'] and pool['reused'] > 0
+    assert pool['cases'] == len(generator.test_cases) - 20
+    
+    # Los casos extremos no usan el pool
+    generator.generate_all(0, 0, 20, 6, 40, seed=3, pool=4)
+    assert generator.metrics['pool']['reused'] == generator.metrics['pool']['derived'] == 0
+    
     try:
-        test_basic_functionality()
-    except Exception as e:
-        print(f"\n❌ ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        generator.generate_all(1, 0, 0, 6, 40, pool=16, trees=True)
+        assert False, "el pool no guarda árboles"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    # Fuera de pytest, las pruebas que usan ``tmp_path`` reciben cada una
+    # un directorio propio dentro de uno temporal que se borra al terminar
+    with tempfile.TemporaryDirectory() as base:
+        def temp_dir():
+            return Path(tempfile.mkdtemp(dir=base))
+        
+        try:
+            test_basic_functionality()
+            test_compiled_grammar()
+            test_deep_derivation_without_recursion()
+            test_termination_tables()
+            test_length_sampler()
+            test_parallel_generation_is_reproducible()
+            test_streaming_jsonl_export(temp_dir())
+            test_online_metrics()
+            test_earley_recognizer_and_verification()
+            test_token_mutations()
+            test_unique_cases()
+            test_coverage_guided_generation()
+            test_weighted_productions()
+            test_benchmark_report()
+            test_instrumentation_and_hooks()
+            test_command_line(temp_dir())
+            test_regenerate_case_from_seed()
+            test_real_depth_and_derivation_trees()
+            test_grammar_analysis()
+            test_columnar_case_store(temp_dir())
+            test_binary_corpus(temp_dir())
+            test_grammar_cache(temp_dir())
+            test_enumerate_sentences()
+            test_subtree_pool()
+        except Exception as e:
+            print(f"\n❌ ERROR: {str(e)}")
+            import traceback
+            traceback.print_exc()